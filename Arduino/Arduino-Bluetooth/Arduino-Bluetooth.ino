@@ -12,6 +12,8 @@
 #include <esp_now.h>
 #include <WiFi.h>
 
+#include "botc_protocol.h"
+
 /* ------------------ Globals ------------------ */
 
 static NimBLEHIDDevice* hid;
@@ -153,6 +155,13 @@ GameState prevState = GameState::PRE_START;
 
 int currentPlayerID = 0;
 
+// From "tally,<(yes << 8) | threshold>"; -1 until the first tally of a nomination arrives
+int tallyYes = -1;
+int tallyNeeded = 0;
+
+// From "cdown,<seconds left>"; -1 while no countdown is running
+int countdownSeconds = -1;
+
 
 /* ------------------ OLED Display ------------------ */
 
@@ -214,13 +223,32 @@ void updateStage() {
 }
 
 void updatePlayer() {
-  display.fillRect(0, 16, 128, 16, SH110X_BLACK);
+  display.fillRect(0, 16, 128, 8, SH110X_BLACK);
   display.setCursor(0, 16);
   display.print("Current Player: ");
   display.print(currentPlayerID + 1);
   display.display();
 }
 
+void updateTally() {
+  // Running vote count of the current nomination, shown under the current player while votes are being taken
+  display.fillRect(0, 24, 128, 8, SH110X_BLACK);
+  if (state == GameState::NOMINATIONS && tallyYes >= 0) {
+    display.setCursor(0, 24);
+    display.print("Votes: ");
+    display.print(tallyYes);
+    display.print("/");
+    display.print(tallyNeeded);
+  }
+  // The phase's countdown, on the right of the same line
+  if (countdownSeconds >= 0) {
+    char countdown[8];
+    snprintf(countdown, sizeof(countdown), "%d:%02d", countdownSeconds / 60, countdownSeconds % 60);
+    drawCenteredText(countdown, 88, 24, 40);
+  }
+  display.display();
+}
+
 void updateOp(int index, const char* text) {
   if (index < 0 || index > 3) return;
 
@@ -276,41 +304,57 @@ void updateOps() {
 
 /* ------------------ ESP_NOW ------------------ */
 
-char CMD_OFF[] = "off";
-
-// Game-specific commands
-char CMD_START[] = "start";
-char CMD_DAY[] = "day";
-char CMD_NIGHT[] = "night";
-char CMD_PRE_REVEAL[] = "prerev";
-
-char CMD_ALIVE[] = "alive";
-char CMD_DEAD[] = "dead";
-char CMD_NO_VOTE[] = "dvote";
-char CMD_NOMINATIONS[] = "snomcon";
-char CMD_SET_PLAYER[] = "splayer";
-char CMD_START_KILL[] = "skill";
-char CMD_END_KILL[] = "ekill";
-char CMD_START_REVIVE[] = "srevive";
-char CMD_END_REVIVE[] = "erevive";
-
-char CMD_PREPARE_NOMINATIONS[] = "pnomin";
-char CMD_START_NOMINATIONS[] = "snomin";
-char CMD_POST_NOMINATIONS[] = "enomin";
-
-char CMD_GAME_END[] = "endgame";
-
 typedef struct botc_message {
   char command[32];
   float brightness = 100;
+  uint8_t seq = 0;  // must match the Sender's struct
+  uint8_t opcode = BOTC_OP_NONE;
+  uint16_t arg = BOTC_NO_ARG;
 } botc_message;
 
 // We will store received messages into "message"
 botc_message message;
 
+// The Sender bridge, learnt from the first message it sends; button presses go to it when no keyboard host is connected
+uint8_t senderAddress[6];
+bool senderKnown = false;
+esp_now_peer_info_t senderPeer;
+
+// The Sender retries a failed delivery within a few milliseconds, so a repeated sequence number is only a duplicate if it
+// arrives this soon after the original. Sequence numbers are shared by every peer and wrap after 255 messages, so a
+// message much later with the same number is a new one.
+const unsigned long DUPLICATE_WINDOW_MS = 1000;
+
 // Callback function that is called when data is received from ESP32-NOW
 void onDataRecv(const esp_now_recv_info_t* mac, const uint8_t* incomingData, int len) {
-  memcpy(&message, incomingData, sizeof(message));
+  if (len <= 0) {
+    return;
+  }
+
+  // Older Senders send a shorter message without the seq, opcode and arg fields. Copy only what arrived over a fresh
+  // message, so those fields keep their defaults (BOTC_OP_NONE makes runCommand parse the command text instead).
+  botc_message received = {};
+  memcpy(&received, incomingData, min((size_t)len, sizeof(received)));
+  received.command[sizeof(received.command) - 1] = '\0';
+  message = received;
+
+  if (!senderKnown) {
+    memcpy(senderAddress, mac->src_addr, 6);
+    memset(&senderPeer, 0, sizeof(senderPeer));
+    memcpy(senderPeer.peer_addr, senderAddress, 6);
+    senderPeer.channel = 0;
+    senderPeer.encrypt = false;
+    senderKnown = esp_now_add_peer(&senderPeer) == ESP_OK;
+  }
+
+  static uint8_t lastSeq = 0;
+  static unsigned long lastSeqAt = 0;
+  const unsigned long now = millis();
+  if (message.seq != 0 && message.seq == lastSeq && now - lastSeqAt < DUPLICATE_WINDOW_MS) {
+    return;
+  }
+  lastSeq = message.seq;
+  lastSeqAt = now;
 
   Serial.println("Performing command check...");
   if (message.command == nullptr || message.command[0] == '\0') {
@@ -321,7 +365,7 @@ void onDataRecv(const esp_now_recv_info_t* mac, const uint8_t* incomingData, int
   Serial.print("Running command: ");
   Serial.println(message.command);
 
-  runCommand(message.command);
+  runCommand(message);
 
   Serial.print("Bytes received: ");
   Serial.println(len);
@@ -335,77 +379,130 @@ void onDataRecv(const esp_now_recv_info_t* mac, const uint8_t* incomingData, int
 }
 
 /* HANDLER */
-void runCommand(const char command[32]) {
-
-  if (strcmp(command, CMD_START) == 0) {
-    state = GameState::PRE_START;
+void runCommand(const botc_message& message) {
+  // Messages from an older Sender carry no opcode, so fall back to parsing the command text
+  BotcFrame frame;
+  uint8_t opcode = message.opcode;
+  uint16_t arg = message.arg;
+  if (opcode == BOTC_OP_NONE && botcParseText(message.command, frame)) {
+    opcode = frame.opcode;
+    arg = frame.arg;
   }
 
-  if (strcmp(command, CMD_DAY) == 0) {
-    state = GameState::DAY;
-  }
+  switch (opcode) {
+    case BOTC_OP_START:
+      state = GameState::PRE_START;
+      break;
 
-  else if (strcmp(command, CMD_NIGHT) == 0) {
-    if (state == GameState::PRE_START) {
-      state = GameState::FIRST_NIGHT;
-    } else {
-      state = GameState::NIGHT;
-    }
-  }
+    case BOTC_OP_DAY:
+      state = GameState::DAY;
+      break;
 
-  else if (strcmp(command, CMD_PRE_REVEAL) == 0) {
-    state = GameState::PRE_REVEAL;
-  }
+    case BOTC_OP_NIGHT:
+      if (state == GameState::PRE_START) {
+        state = GameState::FIRST_NIGHT;
+      } else {
+        state = GameState::NIGHT;
+      }
+      break;
 
-  else if (strcmp(command, CMD_OFF) == 0) {
-    state = GameState::OFF;
-  }
+    case BOTC_OP_PRE_REVEAL:
+      state = GameState::PRE_REVEAL;
+      break;
 
-  else if (strcmp(command, CMD_NOMINATIONS) == 0) {
-    state = GameState::NOMINATIONS_CONFIG;
-  }
+    case BOTC_OP_OFF:
+      state = GameState::OFF;
+      break;
 
-  else if (strcmp(command, CMD_START_NOMINATIONS) == 0) {
-    state = GameState::NOMINATIONS;
-  }
+    case BOTC_OP_START_NOMINATION_CONFIG:
+      state = GameState::NOMINATIONS_CONFIG;
+      break;
+
+    case BOTC_OP_START_NOMINATIONS:
+      state = GameState::NOMINATIONS;
+      tallyYes = -1;
+      break;
 
-  else if (strcmp(command, CMD_POST_NOMINATIONS) == 0) {
-    state = GameState::POST_NOMINATIONS;
+    case BOTC_OP_TALLY:
+      if (arg != BOTC_NO_ARG) {
+        tallyYes = arg >> 8;
+        tallyNeeded = arg & 0xFF;
+      }
+      break;
+
+    case BOTC_OP_COUNTDOWN:
+      countdownSeconds = (arg != BOTC_NO_ARG) ? arg : -1;
+      break;
+
+    case BOTC_OP_END_NOMINATIONS:
+      state = GameState::POST_NOMINATIONS;
+      break;
+
+    case BOTC_OP_START_KILL:
+      prevState = state;
+      state = GameState::KILL_PLAYER;
+      break;
+
+    case BOTC_OP_END_KILL:
+      state = prevState;
+      break;
+
+    case BOTC_OP_START_REVIVE:
+      prevState = state;
+      state = GameState::REVIVE_PLAYER;
+      break;
+
+    case BOTC_OP_END_REVIVE:
+      state = prevState;
+      break;
+
+    case BOTC_OP_END_GAME:
+      state = GameState::END_GAME;
+      break;
+
+    case BOTC_OP_SET_PLAYER:
+      currentPlayerID = (arg != BOTC_NO_ARG) ? arg : getSplitID(message.command);
+      updatePlayer();
+      break;
+
+    default:
+      Serial.print("Unknown command: ");
+      Serial.println(message.command);
+      break;
   }
 
-  else if (strcmp(command, CMD_START_KILL) == 0) {
-    prevState = state;
-    state = GameState::KILL_PLAYER;
-  } 
+  updateStage();
 
-  else if (strcmp(command, CMD_END_KILL) == 0) {
-    state = prevState;
-  }
+  updateTally();
 
-  else if (strcmp(command, CMD_START_REVIVE) == 0) {
-    prevState = state;
-    state = GameState::REVIVE_PLAYER;
-  }
+  updateOps();
+}
 
-  else if (strcmp(command, CMD_END_REVIVE) == 0) {
-    state = prevState;
-  }
 
-  else if (strcmp(command, CMD_GAME_END) == 0) {
-    state = GameState::END_GAME;
+void pressButton(int button, uint8_t keycode) {
+  /* Types the button's number on the keyboard host if one is connected, otherwise forwards it to the Sender as "btn,<n>". */
+  if (connected) {
+    sendKey(0, keycode);
+    sendKey(0, KEY_ENTER);
+    Serial.print("Key ");
+    Serial.print(button);
+    Serial.println(" sent!");
+    return;
   }
 
-  else if (strncmp(command, CMD_SET_PLAYER, 7) == 0) { // hard-coded to "splayer"
-    currentPlayerID = getSplitID(command);
-    updatePlayer();
-  } else {
-    Serial.print("Unknown command: ");
-    Serial.println(command);
+  if (!senderKnown) {
+    Serial.println("No keyboard host connected and no Sender heard from yet; button press dropped");
+    return;
   }
 
-  updateStage();
-
-  updateOps();
+  botc_message press;
+  snprintf(press.command, sizeof(press.command), "btn,%d", button);
+  press.opcode = BOTC_OP_BUTTON;
+  press.arg = button;
+  esp_now_send(senderAddress, (uint8_t *)&press, sizeof(press));
+  Serial.print("Button ");
+  Serial.print(button);
+  Serial.println(" forwarded to the Sender");
 }
 
 
@@ -531,9 +628,7 @@ void loop() {
       buttonOneState = reading1;
       if (buttonOneState == LOW && !buttonOneInPress) {
         Serial.println("Button pressed!");
-        sendKey(0, KEY_1);
-        sendKey(0, KEY_ENTER);
-        Serial.println("Key 1 sent!");
+        pressButton(1, KEY_1);
         buttonOneInPress = true;
       } else if (buttonOneState == HIGH && buttonOneInPress) {
         buttonOneInPress = false;
@@ -553,9 +648,7 @@ void loop() {
       buttonTwoState = reading2;
       if (buttonTwoState == LOW && !buttonTwoInPress) {
         Serial.println("Button pressed!");
-        sendKey(0, KEY_2);
-        sendKey(0, KEY_ENTER);
-        Serial.println("Key 2 sent!");
+        pressButton(2, KEY_2);
         buttonTwoInPress = true;
       } else if (buttonTwoState == HIGH && buttonTwoInPress) {
         buttonTwoInPress = false;
@@ -575,9 +668,7 @@ void loop() {
       buttonThreeState = reading3;
       if (buttonThreeState == LOW && !buttonThreeInPress) {
         Serial.println("Button pressed!");
-        sendKey(0, KEY_3);
-        sendKey(0, KEY_ENTER);
-        Serial.println("Key 3 sent!");
+        pressButton(3, KEY_3);
         buttonThreeInPress = true;
       } else if (buttonThreeState == HIGH && buttonThreeInPress) {
         buttonThreeInPress = false;
@@ -597,9 +688,7 @@ void loop() {
       buttonFourState = reading4;
       if (buttonFourState == LOW && !buttonFourInPress) {
         Serial.println("Button pressed!");
-        sendKey(0, KEY_4);
-        sendKey(0, KEY_ENTER);
-        Serial.println("Key 4 sent!");
+        pressButton(4, KEY_4);
         buttonFourInPress = true;
       } else if (buttonFourState == HIGH && buttonFourInPress) {
         buttonFourInPress = false;
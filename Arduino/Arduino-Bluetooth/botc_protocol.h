@@ -0,0 +1,168 @@
+// Generated by Arduino/protocol.py from its COMMANDS table; do not edit by hand.
+// Regenerate with: python -m Arduino.protocol
+#pragma once
+
+#include <Arduino.h>
+#include <string.h>
+
+#define BOTC_FRAME_SYNC 0xA5
+#define BOTC_FRAME_SIZE 6
+#define BOTC_FRAME_SEQUENCED 0x80
+#define BOTC_NO_ARG 0xFFFF
+
+#define BOTC_PLAYER_DEAD 0x01
+#define BOTC_PLAYER_DEAD_VOTE_USED 0x02
+#define BOTC_PLAYER_NOMINATED 0x04
+#define BOTC_PLAYER_VOTED_YES 0x08
+#define BOTC_PLAYER_VOTED_NO 0x10
+
+enum BotcOpcode : uint8_t {
+  BOTC_OP_NONE = 0x00,
+  BOTC_OP_START = 0x01,
+  BOTC_OP_DAY = 0x02,
+  BOTC_OP_NIGHT = 0x03,
+  BOTC_OP_OFF = 0x04,
+  BOTC_OP_PRE_REVEAL = 0x05,
+  BOTC_OP_START_CONFIG = 0x06,
+  BOTC_OP_NEXT_DEVICE = 0x07,
+  BOTC_OP_SET_DEVICE = 0x08,
+  BOTC_OP_END_CONFIG = 0x09,
+  BOTC_OP_START_KILL = 0x0A,
+  BOTC_OP_END_KILL = 0x0B,
+  BOTC_OP_START_REVIVE = 0x0C,
+  BOTC_OP_END_REVIVE = 0x0D,
+  BOTC_OP_DEAD = 0x0E,
+  BOTC_OP_DEAD_VOTE_USED = 0x0F,
+  BOTC_OP_ALIVE = 0x10,
+  BOTC_OP_REVIVE_PLAYER = 0x11,
+  BOTC_OP_NEXT_PLAYER = 0x12,
+  BOTC_OP_PREVIOUS_PLAYER = 0x13,
+  BOTC_OP_SET_PLAYER = 0x14,
+  BOTC_OP_START_NOMINATION_CONFIG = 0x15,
+  BOTC_OP_START_NOMINATIONS = 0x16,
+  BOTC_OP_END_NOMINATIONS = 0x17,
+  BOTC_OP_VOTE_YES = 0x18,
+  BOTC_OP_VOTE_NO = 0x19,
+  BOTC_OP_VOTE_SKIP = 0x1A,
+  BOTC_OP_END_GAME = 0x1B,
+  BOTC_OP_GOOD_WINS = 0x1C,
+  BOTC_OP_EVIL_WINS = 0x1D,
+  BOTC_OP_RED = 0x1E,
+  BOTC_OP_BLUE = 0x1F,
+  BOTC_OP_GREEN = 0x20,
+  BOTC_OP_NOMINATIONS = 0x21,
+  BOTC_OP_FORCE_DEAD = 0x22,
+  BOTC_OP_FORCE_REVIVE = 0x23,
+  BOTC_OP_PREPARE_FOR_NOMINATIONS = 0x24,
+  BOTC_OP_CURRENT_PLAYER = 0x25,
+  BOTC_OP_SEQUENCE_RESET = 0x26,
+  BOTC_OP_PLAYER_STATES = 0x27,
+  BOTC_OP_BUTTON = 0x28,
+  BOTC_OP_TALLY = 0x29,
+  BOTC_OP_CONFIG_MAP = 0x2A,
+  BOTC_OP_CONFIG_APPLIED = 0x2B,
+  BOTC_OP_COUNTDOWN = 0x2C,
+};
+
+#define BOTC_MAX_OPCODE 0x2C
+
+// Command word for each opcode, indexed by opcode
+static const char *const BOTC_COMMAND_WORDS[BOTC_MAX_OPCODE + 1] = {
+  nullptr,  // 0x00
+  "start",  // 0x01
+  "day",  // 0x02
+  "night",  // 0x03
+  "off",  // 0x04
+  "prerev",  // 0x05
+  "sconfig",  // 0x06
+  "ndevice",  // 0x07
+  "sdevice",  // 0x08
+  "econfig",  // 0x09
+  "skill",  // 0x0A
+  "ekill",  // 0x0B
+  "srevive",  // 0x0C
+  "erevive",  // 0x0D
+  "dead",  // 0x0E
+  "dvote",  // 0x0F
+  "alive",  // 0x10
+  "revive",  // 0x11
+  "nplayer",  // 0x12
+  "pplayer",  // 0x13
+  "splayer",  // 0x14
+  "snomcon",  // 0x15
+  "snomin",  // 0x16
+  "enomin",  // 0x17
+  "vyes",  // 0x18
+  "vno",  // 0x19
+  "vskip",  // 0x1A
+  "endgame",  // 0x1B
+  "goodwins",  // 0x1C
+  "evilwins",  // 0x1D
+  "red",  // 0x1E
+  "blue",  // 0x1F
+  "green",  // 0x20
+  "noms",  // 0x21
+  "forced",  // 0x22
+  "forcer",  // 0x23
+  "pnomin",  // 0x24
+  "cur",  // 0x25
+  "seqreset",  // 0x26
+  "pstate",  // 0x27
+  "btn",  // 0x28
+  "tally",  // 0x29
+  "cfgmap",  // 0x2A
+  "cfgok",  // 0x2B
+  "cdown",  // 0x2C
+};
+
+inline uint8_t botcCrc8(const uint8_t *data, size_t len) {
+  uint8_t crc = 0;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+// Looks up the opcode for a command word (without any ",arg" suffix). Returns BOTC_OP_NONE if unknown.
+inline uint8_t botcOpcodeFor(const char *word, size_t len) {
+  for (uint8_t op = 1; op <= BOTC_MAX_OPCODE; op++) {
+    const char *candidate = BOTC_COMMAND_WORDS[op];
+    if (candidate != nullptr && strlen(candidate) == len && strncmp(candidate, word, len) == 0) {
+      return op;
+    }
+  }
+  return BOTC_OP_NONE;
+}
+
+struct BotcFrame {
+  uint8_t opcode;  // without the BOTC_FRAME_SEQUENCED flag
+  bool sequenced;
+  uint8_t seq;
+  uint16_t arg;  // BOTC_NO_ARG if the command has no argument
+};
+
+// Decodes a BOTC_FRAME_SIZE-byte frame. Returns false if the sync byte, checksum or opcode is invalid.
+inline bool botcDecodeFrame(const uint8_t *frame, BotcFrame &out) {
+  if (frame[0] != BOTC_FRAME_SYNC || botcCrc8(frame + 1, 4) != frame[5]) {
+    return false;
+  }
+  out.opcode = frame[1] & ~BOTC_FRAME_SEQUENCED;
+  out.sequenced = (frame[1] & BOTC_FRAME_SEQUENCED) != 0;
+  out.seq = frame[2];
+  out.arg = frame[3] | (frame[4] << 8);
+  return out.opcode != BOTC_OP_NONE && out.opcode <= BOTC_MAX_OPCODE && BOTC_COMMAND_WORDS[out.opcode] != nullptr;
+}
+
+// Parses a text command such as "splayer,3" into a frame, so text and binary commands share one dispatcher.
+inline bool botcParseText(const char *text, BotcFrame &out) {
+  const char *separator = strchr(text, ',');
+  size_t len = separator ? (size_t)(separator - text) : strlen(text);
+  out.opcode = botcOpcodeFor(text, len);
+  out.sequenced = false;
+  out.seq = 0;
+  out.arg = separator ? (uint16_t)atoi(separator + 1) : BOTC_NO_ARG;
+  return out.opcode != BOTC_OP_NONE;
+}
@@ -13,34 +13,12 @@
 */
 
 #include "arduino_secrets.h"
+#include "botc_protocol.h"
 
 #include <esp_now.h>
 #include <WiFi.h>
 #include <ArduinoOTA.h>
 
-// Configuration / general commands
-char CMD_RED[] = "red";
-char CMD_BLUE[] = "blue";
-char CMD_GREEN[] = "green";
-char CMD_OFF[] = "off";
-
-// Game-specific commands
-char CMD_START[] = "start";
-char CMD_DAY[] = "day";
-char CMD_NIGHT[] = "night";
-char CMD_ALIVE[] = "alive";
-char CMD_DEAD[] = "dead";
-char CMD_NO_VOTE[] = "dvote";
-
-char CMD_SET_NOMINATED[] = "snomin";
-char CMD_PREPARE_FOR_NOMINATION[] = "pnomin";
-char CMD_VOTED_YES[] = "vyes";
-char CMD_VOTED_NO[] = "vno";
-char CMD_VOTED_SKIPPED[] = "vskip";
-
-char CMD_GOOD_WINS[] = "goodwins";
-char CMD_EVIL_WINS[] = "evilwins";
-
 int redPin = 3;
 int greenPin = 2;
 int bluePin = 1;
@@ -48,6 +26,9 @@ int bluePin = 1;
 typedef struct botc_message {
   char command[32];
   float brightness = 100;
+  uint8_t seq = 0;  // must match the Sender's struct
+  uint8_t opcode = BOTC_OP_NONE;
+  uint16_t arg = BOTC_NO_ARG;
 } botc_message;
 
 // We will store received messages into "message"
@@ -71,92 +52,130 @@ enum class GameState {
 
 GameState state;
 
-void runCommand(const char command[32], const float brightness = 100) {
-
-  if (strcmp(command, CMD_START) == 0) {
-    playerState = PlayerState::ALIVE;
-    startNight();
-  }
-
-  else if (strcmp(command, CMD_DAY) == 0) {
-    startDay();
-  }
-
-  else if (strcmp(command, CMD_NIGHT) == 0) {
-    startNight();
-  }
-
-  else if (strcmp(command, CMD_DEAD) == 0) {
-    onPlayerDeath();
-  }
-
-  else if (strcmp(command, CMD_NO_VOTE) == 0) {
-    onDeadVoteUsed();
-  }
-
-  else if (strcmp(command, CMD_ALIVE) == 0) {
-    onPlayerAlive();
-  }
-
-  else if (strcmp(CMD_RED, command) == 0) {
-    Serial.println("CMD: Red");
-    specialColour(255, 0, 0, brightness);
-  }
-
-  else if (strcmp(CMD_BLUE, command) == 0) {
-    Serial.println("CMD: Blue");
-    specialColour(0, 0, 255, brightness);
-  }
-
-  else if (strcmp(CMD_GREEN, command) == 0) {
-    Serial.println("CMD: Green");
-    specialColour(0, 255, 0, brightness);
+void runCommand(const botc_message &message) {
+  // Messages from an older Sender carry no opcode, so fall back to parsing the command text
+  uint8_t opcode = message.opcode;
+  if (opcode == BOTC_OP_NONE) {
+    BotcFrame frame;
+    opcode = botcParseText(message.command, frame) ? frame.opcode : BOTC_OP_NONE;
   }
 
-  else if (strcmp(CMD_GOOD_WINS, command) == 0) {
-    Serial.println("CMD: GOOD WINS");
-    specialColour(0, 255, 0, brightness);
-  }
-
-  else if (strcmp(CMD_EVIL_WINS, command) == 0) {
-    Serial.println("CMD: EVIL WINS");
-    specialColour(255, 0, 0, brightness);
-  }
-
-  else if (strcmp(CMD_PREPARE_FOR_NOMINATION, command) == 0) {
-    state = GameState::DAY;
-  }
-
-  else if (strcmp(CMD_SET_NOMINATED, command) == 0) {
-    specialColour(128, 0, 128, brightness);
+  const float brightness = message.brightness;
+
+  switch (opcode) {
+    case BOTC_OP_START:
+      playerState = PlayerState::ALIVE;
+      startNight();
+      break;
+
+    case BOTC_OP_DAY:
+      startDay();
+      break;
+
+    case BOTC_OP_NIGHT:
+      startNight();
+      break;
+
+    case BOTC_OP_DEAD:
+      onPlayerDeath();
+      break;
+
+    case BOTC_OP_DEAD_VOTE_USED:
+      onDeadVoteUsed();
+      break;
+
+    case BOTC_OP_ALIVE:
+    case BOTC_OP_REVIVE_PLAYER:
+      onPlayerAlive();
+      break;
+
+    case BOTC_OP_RED:
+      Serial.println("CMD: Red");
+      specialColour(255, 0, 0, brightness);
+      break;
+
+    case BOTC_OP_BLUE:
+      Serial.println("CMD: Blue");
+      specialColour(0, 0, 255, brightness);
+      break;
+
+    case BOTC_OP_GREEN:
+      Serial.println("CMD: Green");
+      specialColour(0, 255, 0, brightness);
+      break;
+
+    case BOTC_OP_GOOD_WINS:
+      Serial.println("CMD: GOOD WINS");
+      specialColour(0, 255, 0, brightness);
+      break;
+
+    case BOTC_OP_EVIL_WINS:
+      Serial.println("CMD: EVIL WINS");
+      specialColour(255, 0, 0, brightness);
+      break;
+
+    case BOTC_OP_PREPARE_FOR_NOMINATIONS:
+      state = GameState::DAY;
+      break;
+
+    case BOTC_OP_START_NOMINATIONS:
+      specialColour(128, 0, 128, brightness);
+      break;
+
+    case BOTC_OP_VOTE_YES:
+      if (playerState == PlayerState::DEAD_ONE_VOTE) {
+        playerState = PlayerState::DEAD;
+      }
+      specialColour(0, 255, 0, brightness);
+      break;
+
+    case BOTC_OP_VOTE_NO:
+      specialColour(255, 0, 0, brightness);
+      break;
+
+    case BOTC_OP_VOTE_SKIP:
+      specialColour(0, 0, 0, brightness);
+      break;
+
+    case BOTC_OP_OFF:
+      Serial.println("CMD: Off");
+      setColour(0, 0, 0, 100);
+      state = GameState::OFF;
+      break;
+
+    default:
+      break;
   }
+}
 
-  else if (strcmp(CMD_VOTED_YES, command) == 0) {
-    if (playerState == PlayerState::DEAD_ONE_VOTE) {
-      playerState = PlayerState::DEAD;
-    }
-    specialColour(0, 255, 0, brightness);
-  }
+// The Sender retries a failed delivery within a few milliseconds, so a repeated sequence number is only a duplicate if it
+// arrives this soon after the original. Sequence numbers are shared by every peer and wrap after 255 messages, so a
+// message much later with the same number is a new one.
+const unsigned long DUPLICATE_WINDOW_MS = 1000;
 
-  else if (strcmp(CMD_VOTED_NO, command) == 0) {
-    specialColour(255, 0, 0, brightness);
-  }
-
-  else if (strcmp(CMD_VOTED_SKIPPED, command) == 0) {
-    specialColour(0, 0, 0, brightness);
+// Callback function that is called when data is received from ESP32-NOW
+void onDataRecv(const esp_now_recv_info_t *mac, const uint8_t *incomingData, int len) {
+  if (len <= 0) {
+    return;
   }
 
-  else if (strcmp(CMD_OFF, command) == 0) {
-    Serial.println("CMD: Off");
-    setColour(0, 0, 0, 100);
-    state = GameState::OFF;
+  // Older Senders send a shorter message without the seq, opcode and arg fields. Copy only what arrived over a fresh
+  // message, so those fields keep their defaults (BOTC_OP_NONE makes runCommand parse the command text instead).
+  botc_message received = {};
+  memcpy(&received, incomingData, min((size_t)len, sizeof(received)));
+  received.command[sizeof(received.command) - 1] = '\0';
+  message = received;
+
+  static uint8_t lastSeq = 0;
+  static unsigned long lastSeqAt = 0;
+  const unsigned long now = millis();
+  if (message.seq != 0 && message.seq == lastSeq && now - lastSeqAt < DUPLICATE_WINDOW_MS) {
+    return;
   }
-}
+  lastSeq = message.seq;
+  lastSeqAt = now;
 
-// Callback function that is called when data is received from ESP32-NOW
-void onDataRecv(const esp_now_recv_info_t *mac, const uint8_t *incomingData, int len) {
-  memcpy(&message, incomingData, sizeof(message));
-  runCommand(message.command, message.brightness);
+  runCommand(message);
 
   Serial.print("Bytes received: ");
   Serial.println(len);
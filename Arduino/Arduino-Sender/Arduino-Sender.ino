@@ -1,6 +1,8 @@
 #include <esp_now.h>
 #include <WiFi.h>
 
+#include "botc_protocol.h"
+
 // MAC addresses of all ESP32 boards to use
 uint8_t macAddresses[][6] = {
   { 0xAC, 0xA7, 0x04, 0xB9, 0x74, 0x60 },
@@ -84,12 +86,21 @@ const String SERIAL_EVIL_WINS = String("evilwins");
 
 const String DEBUG_CURRENT_PLAYER = String("cur");
 
+// Sequenced protocol: commands may arrive as "<seq>:<command>" (or as a frame with the sequenced flag), and are acknowledged
+// with "ack <seq>" once run. Commands are only run in sequence order; duplicates are re-acknowledged and out-of-order commands
+// are dropped for the controller to retransmit.
+const int SEQUENCE_SPACE = 256;
+int expectedSeq = 0;
+
 
 char serialCharCommand[32];
 
 typedef struct botc_message {
   char command[32];
   float brightness = 100;
+  uint8_t seq = 0;  // incremented for every message sent, so receivers can ignore a retransmitted duplicate
+  uint8_t opcode = BOTC_OP_NONE;  // BotcOpcode of "command", from botc_protocol.h
+  uint16_t arg = BOTC_NO_ARG;  // the "id" of a "command,id" command
 } botc_message;
 
 
@@ -120,17 +131,49 @@ SenderState senderState;
 int configPlayer = 0;  // Which player we are setting
 int configDevice = 0;  // Which device we are up to
 
+// The last message sent to a single peer, retried from loop() if its delivery fails
+const int MAX_DELIVERY_RETRIES = 2;
+botc_message lastUnicastMessage;
+uint8_t lastUnicastPeer[6];
+bool lastUnicastValid = false;
+volatile bool retryLastUnicast = false;
+int lastUnicastRetries = 0;
+
+// A button press forwarded by the Bluetooth board, printed as "btn,<n>" from loop() rather than from the receive callback
+// so it cannot be interleaved with another line being printed
+volatile int pendingButton = 0;
+uint8_t nextMessageSeq = 1;
+
 // callback when data is sent
 void OnDataSent(const wifi_tx_info_t *tx_info, esp_now_send_status_t status) {
   if (status != ESP_NOW_SEND_SUCCESS) {
     Serial.println("Last Packet Delivery Fail");
+
+    if (lastUnicastValid && memcmp(tx_info->des_addr, lastUnicastPeer, 6) == 0) {
+      retryLastUnicast = true;
+    }
+  }
+}
+
+// Callback when data is received; the Bluetooth board forwards its button presses here when no keyboard host is connected
+void OnDataRecv(const esp_now_recv_info_t *info, const uint8_t *incomingData, int len) {
+  if (len <= 0) {
+    return;
+  }
+
+  // Only what arrived is copied over a fresh message, as on the Receiver, so a short message keeps the defaults
+  botc_message received = {};
+  memcpy(&received, incomingData, min((size_t)len, sizeof(received)));
+  received.command[sizeof(received.command) - 1] = '\0';
+  if (received.opcode == BOTC_OP_BUTTON && received.arg != BOTC_NO_ARG) {
+    pendingButton = received.arg;
   }
 }
 
 /*
   Function declarations
 */
-String getSplitValue(String data);
+void setMessageOpcode(botc_message &message);
 
 
 void setup() {
@@ -148,6 +191,7 @@ void setup() {
 
   // On send callback registration
   esp_now_register_send_cb(OnDataSent);
+  esp_now_register_recv_cb(OnDataRecv);
 
   // Register all peers
   for (int i = 0; i < totalDevices; i++) {
@@ -175,107 +219,300 @@ void setup() {
 }
 
 
-// Define our commands based on what action we take, this helps us to reduce code repetition
+void loop() {
 
-String broadcastCommands[] = { SERIAL_RED, SERIAL_BLUE, SERIAL_START, SERIAL_DAY, SERIAL_NIGHT, SERIAL_GOOD_WINS, SERIAL_EVIL_WINS };
-const int broadcastCommandCount = sizeof(broadcastCommands) / sizeof(broadcastCommands[0]);
+  if (pendingButton != 0) {
+    int button = pendingButton;
+    pendingButton = 0;
+    Serial.print(BOTC_COMMAND_WORDS[BOTC_OP_BUTTON]);
+    Serial.print(",");
+    Serial.println(button);
+  }
 
-String controllerCommands[] = { SERIAL_NOMINATIONS, SERIAL_START_KILL, SERIAL_END_KILL, SERIAL_START_REVIVE, SERIAL_END_REVIVE, SERIAL_START_NOMINATION_CONFIG, SERIAL_END_GAME, SERIAL_PRE_REVEAL };
-const int controllerCommandCount = sizeof(controllerCommands) / sizeof(controllerCommands[0]);
+  // Retry a failed delivery outside of the send callback
+  if (retryLastUnicast) {
+    retryLastUnicast = false;
+    if (lastUnicastRetries < MAX_DELIVERY_RETRIES) {
+      lastUnicastRetries++;
+      esp_now_send(lastUnicastPeer, (uint8_t *)&lastUnicastMessage, sizeof(lastUnicastMessage));
+    }
+  }
 
+  if (!Serial.available()) {
+    return;
+  }
 
-void loop() {
+  // Commands arrive either as binary frames (which start with a non-ASCII sync byte) or as newline-terminated text.
+  // Both are decoded into a BotcFrame, so they share a single dispatcher.
+  BotcFrame frame;
+  bool fromText = false;
 
-  while (Serial.available()) {
-    serialString = Serial.readString();
+  if (Serial.peek() == BOTC_FRAME_SYNC) {
+    uint8_t raw[BOTC_FRAME_SIZE];
+    if (Serial.readBytes(raw, BOTC_FRAME_SIZE) != BOTC_FRAME_SIZE || !botcDecodeFrame(raw, frame)) {
+      Serial.println("Dropped invalid frame");
+      return;
+    }
+  } else {
+    // Read a single line rather than waiting for readString() to time out
+    serialString = Serial.readStringUntil('\n');
     serialString.trim();
+    if (serialString.length() == 0) {
+      return;
+    }
+
+    int seq = takeSequenceNumber(serialString);
+    if (!botcParseText(serialString.c_str(), frame)) {
+      Serial.print("Unknown command: ");
+      Serial.print(serialString);
+      Serial.println();
+      return;
+    }
+    frame.sequenced = seq >= 0;
+    frame.seq = frame.sequenced ? seq : 0;
+    fromText = true;
+  }
+
+  if (frame.sequenced) {
+    int ahead = modulo(frame.seq - expectedSeq, SEQUENCE_SPACE);
+    if (ahead != 0) {
+      // Already run: acknowledge again in case the first ack was lost. Otherwise an earlier command is missing, so drop it.
+      if (ahead >= SEQUENCE_SPACE / 2) {
+        acknowledge(frame.seq);
+      }
+      return;
+    }
   }
 
-  if (serialString.length() > 0) {
+  // Echo the command back (as text, even if it arrived as a frame) so the controller knows it was received
+  if (fromText) {
     Serial.println(serialString);
+  } else {
+    Serial.print(BOTC_COMMAND_WORDS[frame.opcode]);
+    if (frame.arg != BOTC_NO_ARG) {
+      Serial.print(",");
+      Serial.print(frame.arg);
+    }
+    Serial.println();
+  }
 
-    // Broadcast to all commands
-    if (stringInArray(serialString, broadcastCommands, broadcastCommandCount)) {
-      broadcast(serialString);
+  // A text "pstate" or "cfgmap" command can hold several players, more than the single argument of a frame
+  if (fromText && frame.opcode == BOTC_OP_PLAYER_STATES) {
+    applyPlayerStates(serialString);
+  } else if (fromText && frame.opcode == BOTC_OP_CONFIG_MAP) {
+    applyConfigMap(serialString);
+  } else {
+    runCommand(frame.opcode, frame.arg);
+  }
+
+  if (frame.sequenced) {
+    expectedSeq = modulo(expectedSeq + 1, SEQUENCE_SPACE);
+    acknowledge(frame.seq);
+  }
+}
+
+void runCommand(uint8_t opcode, uint16_t arg) {
+  const bool hasArg = arg != BOTC_NO_ARG;
+
+  switch (opcode) {
+    // Broadcast to all devices
+    case BOTC_OP_RED:
+    case BOTC_OP_BLUE:
+    case BOTC_OP_START:
+    case BOTC_OP_DAY:
+    case BOTC_OP_NIGHT:
+    case BOTC_OP_GOOD_WINS:
+    case BOTC_OP_EVIL_WINS:
+      broadcast(String(BOTC_COMMAND_WORDS[opcode]));
+      break;
+
+    // Send to controller only
+    case BOTC_OP_NOMINATIONS:
+    case BOTC_OP_START_KILL:
+    case BOTC_OP_END_KILL:
+    case BOTC_OP_START_REVIVE:
+    case BOTC_OP_END_REVIVE:
+    case BOTC_OP_START_NOMINATION_CONFIG:
+    case BOTC_OP_END_GAME:
+    case BOTC_OP_PRE_REVEAL:
+      sendController(String(BOTC_COMMAND_WORDS[opcode]));
+      break;
 
-    // Send to controller only commands
-    } else if (stringInArray(serialString, controllerCommands, controllerCommandCount)) {
-      sendController(serialString);
     // More complex commands
-    } else if (serialString == SERIAL_NEXT_PLAYER) {
+    case BOTC_OP_NEXT_PLAYER:
       nextPlayer();
-    } else if (serialString == SERIAL_PREV_PLAYER) {
+      break;
+    case BOTC_OP_PREVIOUS_PLAYER:
       previousPlayer();
-    } else if (serialString == SERIAL_START_CONFIG) {
+      break;
+    case BOTC_OP_SEQUENCE_RESET:
+      expectedSeq = 0;
+      break;
+    case BOTC_OP_START_CONFIG:
       startConfiguration();
-    } else if (serialString == SERIAL_NEXT_CONFIG_DEVICE) {
+      break;
+    case BOTC_OP_NEXT_DEVICE:
       configNextDevice();
-    } else if (serialString == SERIAL_SET_CONFIG_DEVICE) {
+      break;
+    case BOTC_OP_SET_DEVICE:
       configSetDeviceForPlayer();
-    } else if (serialString == SERIAL_END_CONFIG) {
+      break;
+    case BOTC_OP_END_CONFIG:
       endConfiguration();
-    } else if (serialString == SERIAL_POST_NOMINATIONS) {
+      break;
+    case BOTC_OP_CONFIG_MAP:
+      // A single seat, sent as a frame
+      startConfigMap();
+      if (hasArg) {
+        addConfigMapDevice(arg);
+      }
+      endConfigMap();
+      break;
+    case BOTC_OP_END_NOMINATIONS:
       sendController(SERIAL_POST_NOMINATIONS);
       delay(50);
       currentPlayerID = nominatedPlayerID;
       sendController(SERIAL_SET_PLAYER + "," + String(currentPlayerID));
       Serial.print("Current player: ");
       Serial.println(currentPlayerID);
-    } else if (serialString == SERIAL_PLAYER_DEAD) {
-      sendCommand(SERIAL_PLAYER_DEAD, getPlayerDevice(currentPlayerID));
-    } else if (serialString == SERIAL_PLAYER_REVIVE) {
-      sendCommand(SERIAL_PLAYER_REVIVE, getPlayerDevice(currentPlayerID));
-    } else if (serialString == SERIAL_START_NOMINATIONS) {
+      break;
+    case BOTC_OP_START_NOMINATIONS:
       startNominationsCurrentPlayer();
-    } else if (serialString == SERIAL_VOTED_YES) {
+      break;
+    case BOTC_OP_VOTE_YES:
       currentPlayerVotedYes();
-    } else if (serialString == SERIAL_VOTED_NO) {
+      break;
+    case BOTC_OP_VOTE_NO:
       currentPlayerVotedNo();
-    } else if (serialString == SERIAL_VOTE_SKIPPED) {
+      break;
+    case BOTC_OP_VOTE_SKIP:
       currentPlayerVoteSkipped();
-    } else if (serialString.startsWith(SERIAL_PLAYER_FORCE_DEAD)) {
-      // Get the player ID in range [0, 14]
-      playerID = getSafePlayerID(serialString);
+      break;
+    case BOTC_OP_TALLY:
+      sendController(String(BOTC_COMMAND_WORDS[opcode]) + "," + String(arg));
+      break;
+    case BOTC_OP_COUNTDOWN:
+      sendController(hasArg ? String(BOTC_COMMAND_WORDS[opcode]) + "," + String(arg) : String(BOTC_COMMAND_WORDS[opcode]));
+      break;
 
-      Serial.print("Force dead player: ");
-      Serial.println(playerID);
+    // Player commands act on the current player, or on the player given as "command,id"
+    case BOTC_OP_DEAD:
+    case BOTC_OP_FORCE_DEAD:
+      playerID = (hasArg || opcode == BOTC_OP_FORCE_DEAD) ? getSafePlayerID(arg) : currentPlayerID;
 
-      sendCommand(SERIAL_PLAYER_DEAD, getPlayerDevice(playerID));
-    } else if (serialString.startsWith(SERIAL_SET_PLAYER)) {
-      playerID = getSafePlayerID(serialString);
+      Serial.print("Dead player: ");
+      Serial.println(playerID);
 
-      currentPlayerID = playerID;
-      sendController(SERIAL_SET_PLAYER + "," + String(currentPlayerID));
-  
-    } else if (serialString.startsWith(SERIAL_PLAYER_NO_VOTE)) {
-      // Get the player ID in range [0, 14]
-      playerID = getSafePlayerID(serialString);
+      if (playerID >= 0) {
+        sendCommand(SERIAL_PLAYER_DEAD, getPlayerDevice(playerID));
+      }
+      break;
+    case BOTC_OP_REVIVE_PLAYER:
+    case BOTC_OP_ALIVE:
+    case BOTC_OP_FORCE_REVIVE:
+      playerID = (hasArg || opcode == BOTC_OP_FORCE_REVIVE) ? getSafePlayerID(arg) : currentPlayerID;
 
-      Serial.print("Dead vote used for player: ");
+      Serial.print("Revive player: ");
       Serial.println(playerID);
 
-      sendCommand(SERIAL_PLAYER_NO_VOTE, getPlayerDevice(playerID));
-    } else if (serialString.startsWith(SERIAL_PLAYER_FORCE_REVIVE)) {
-      playerID = getSafePlayerID(serialString);
+      if (playerID >= 0) {
+        sendCommand(SERIAL_PLAYER_REVIVE, getPlayerDevice(playerID));
+      }
+      break;
+    case BOTC_OP_DEAD_VOTE_USED:
+      playerID = hasArg ? getSafePlayerID(arg) : currentPlayerID;
 
-      Serial.print("Force revive player: ");
+      Serial.print("Dead vote used for player: ");
       Serial.println(playerID);
 
-      sendCommand(SERIAL_PLAYER_REVIVE, getPlayerDevice(playerID));
-    } else {
+      if (playerID >= 0) {
+        sendCommand(SERIAL_PLAYER_NO_VOTE, getPlayerDevice(playerID));
+      }
+      break;
+    case BOTC_OP_SET_PLAYER:
+      playerID = getSafePlayerID(arg);
+      if (playerID >= 0) {
+        currentPlayerID = playerID;
+      }
+      sendController(SERIAL_SET_PLAYER + "," + String(currentPlayerID));
+      break;
+    case BOTC_OP_PLAYER_STATES:
+      if (hasArg) {
+        applyPlayerState(arg);
+      }
+      break;
+
+    default:
       Serial.print("Unknown command: ");
-      Serial.print(serialString);
-      Serial.println();
+      Serial.println(BOTC_COMMAND_WORDS[opcode]);
+      break;
+  }
+}
+
+int takeSequenceNumber(String &data) {
+  /* If data is in the form "<seq>:<command>", strips the prefix and returns seq. Otherwise returns -1 and leaves data as-is. */
+  int separator = data.indexOf(':');
+  if (separator <= 0) {
+    return -1;
+  }
+
+  for (int i = 0; i < separator; i++) {
+    if (!isDigit(data.charAt(i))) {
+      return -1;
     }
+  }
 
-    serialString = "";
+  int seq = data.substring(0, separator).toInt();
+  data = data.substring(separator + 1);
+  return seq;
+}
+
+void applyPlayerStates(const String &command) {
+  /* Applies every "(player << 8) | flags" entry of a "pstate,<entry>,<entry>,..." command. */
+  int start = command.indexOf(',');
+  while (start >= 0) {
+    int end = command.indexOf(',', start + 1);
+    String entry = end >= 0 ? command.substring(start + 1, end) : command.substring(start + 1);
+    applyPlayerState((uint16_t)entry.toInt());
+    start = end;
   }
 }
+
+void applyPlayerState(uint16_t entry) {
+  /* Sets a player's device to the full status in "entry", whatever it showed before. */
+  int player = getSafePlayerID(entry >> 8);
+  uint8_t flags = entry & 0xFF;
+  if (player < 0) {
+    return;
+  }
+
+  uint8_t *device = getPlayerDevice(player);
+  sendCommand((flags & BOTC_PLAYER_DEAD) ? SERIAL_PLAYER_DEAD : SERIAL_PLAYER_REVIVE, device);
+  if (flags & BOTC_PLAYER_DEAD_VOTE_USED) {
+    delay(10);
+    sendCommand(SERIAL_PLAYER_NO_VOTE, device);
+  }
+  if (flags & BOTC_PLAYER_NOMINATED) {
+    delay(10);
+    sendCommand(SERIAL_START_NOMINATIONS, device);
+  }
+  if (flags & (BOTC_PLAYER_VOTED_YES | BOTC_PLAYER_VOTED_NO)) {
+    delay(10);
+    sendCommand((flags & BOTC_PLAYER_VOTED_YES) ? SERIAL_VOTED_YES : SERIAL_VOTED_NO, device);
+  }
+}
+
+void acknowledge(int seq) {
+  Serial.print("ack ");
+  Serial.println(seq);
+}
+
 void sendCommand(String command, uint8_t *peer) {
   /* Copies the string command into the botc_message struct, then sends to the specified peer. */
   command.toCharArray(serialCharCommand, command.length() + 1);  // unsafe but we're ignoring that for the purposes of this application
 
   strcpy(message.command, serialCharCommand);
+  setMessageOpcode(message);
   sendMessage(message, peer);
 }
 
@@ -283,16 +520,41 @@ void sendController(String command) {
   command.toCharArray(serialCharCommand, command.length() + 1);
 
   strcpy(message.command, serialCharCommand);
+  setMessageOpcode(message);
   sendMessage(message, controllerMAC);
 }
 
+void setMessageOpcode(botc_message &message) {
+  /* Fills in the opcode and argument of the message's command, so receivers can dispatch without comparing strings. */
+  BotcFrame frame;
+  if (botcParseText(message.command, frame)) {
+    message.opcode = frame.opcode;
+    message.arg = frame.arg;
+  } else {
+    message.opcode = BOTC_OP_NONE;
+    message.arg = BOTC_NO_ARG;
+  }
+}
+
 void broadcast(String command) {
   /* Utility function to broadcast a command to all peers. */
   sendCommand(command, 0);  // Sending NULL / 0 as the peer_addr broadcasts to all connected peers
 }
 
-void sendMessage(const botc_message message, const uint8_t *peer_addr) {
+void sendMessage(botc_message message, const uint8_t *peer_addr) {
   /* Sends a message to the specified peer MAC address. Set peer_addr to NULL/0 to broadcast. */
+  message.seq = nextMessageSeq++;
+  if (nextMessageSeq == 0) {
+    nextMessageSeq = 1;  // 0 means "no sequence number"
+  }
+
+  if (peer_addr != nullptr) {
+    memcpy(&lastUnicastMessage, &message, sizeof(message));
+    memcpy(lastUnicastPeer, peer_addr, 6);
+    lastUnicastValid = true;
+    lastUnicastRetries = 0;
+  }
+
   esp_err_t result = esp_now_send(peer_addr, (uint8_t *)&message, sizeof(message));
   if (result != ESP_OK) {
     Serial.println("Error sending the data");
@@ -425,6 +687,57 @@ void configSetDeviceForPlayer() {
   attemptConfigDevice(configDevice);
 }
 
+void applyConfigMap(const String &command) {
+  /* Replaces the whole player-to-device mapping with the devices of a "cfgmap,<device>,<device>,..." command, in seat order. */
+  startConfigMap();
+  int start = command.indexOf(',');
+  while (start >= 0) {
+    int end = command.indexOf(',', start + 1);
+    String entry = end >= 0 ? command.substring(start + 1, end) : command.substring(start + 1);
+    addConfigMapDevice((uint16_t)entry.toInt());
+    start = end;
+  }
+  endConfigMap();
+}
+
+void startConfigMap() {
+  for (int i = 0; i < totalDevices; i++) {
+    playerDevice[i] = -1;
+  }
+  totalPlayers = 0;
+}
+
+void addConfigMapDevice(uint16_t device) {
+  /* Gives the next seat this device, skipping devices that do not exist. */
+  if (device >= totalDevices || totalPlayers >= totalDevices) {
+    Serial.print("CONFIG: Ignoring device ");
+    Serial.println(device);
+    return;
+  }
+  playerDevice[totalPlayers++] = device;
+}
+
+void endConfigMap() {
+  /* Lights every seat's device green, then reports what was applied as "cfgok,<seats>,<crc8 of the seats' devices>". */
+  senderState = SenderState::READY;
+  configPlayer = 0;
+  configDevice = 0;
+  currentPlayerID = 0;
+
+  broadcast(SERIAL_OFF);
+  uint8_t devices[15];
+  for (int i = 0; i < totalPlayers; i++) {
+    devices[i] = playerDevice[i];
+    sendCommand(SERIAL_GREEN, getPlayerDevice(i));
+  }
+
+  Serial.print(BOTC_COMMAND_WORDS[BOTC_OP_CONFIG_APPLIED]);
+  Serial.print(",");
+  Serial.print(totalPlayers);
+  Serial.print(",");
+  Serial.println(botcCrc8(devices, totalPlayers));
+}
+
 void endConfiguration() {
   /* Sets all configured devices to green momentarily, then turns them all off. */
   for (int i = 0; i < totalDevices; i++) {
@@ -444,41 +757,15 @@ void endConfiguration() {
 
 /* Utility functions */
 
-bool stringInArray(const String &value, const String array[], int size) {
-  for (int i = 0; i < size; i++) {
-    if (value == array[i]) return true;
-  }
-  return false;
-}
-
-int getSafePlayerID(String data) {
-  int id = getSplitValue(data).toInt();
-
-  if (id >= 0 && id <= 14) {
+int getSafePlayerID(uint16_t id) {
+  /* Returns the player ID if it is in range [0, 14], otherwise -1. */
+  if (id <= 14) {
     return id;
   }
 
   return -1;
 }
 
-String getSplitValue(String data) {
-  const char separator = ',';
-  /* Splits a String by a comma, and returns everything after the first match. 
-  As we are only handling inputs in the form "command,id", we at this stage do not require something more complex. */
-
-  int strIndex[] = { 0, -1 };
-  int maxIndex = data.length() - 1;
-
-  for (int i = 0; i <= maxIndex; i++) {
-    if (data.charAt(i) == separator || i == maxIndex) {
-      strIndex[0] = strIndex[1] + 1;
-      strIndex[1] = (i == maxIndex) ? i + 1 : i;
-    }
-  }
-
-  return strIndex[1] > -1 ? data.substring(strIndex[0], strIndex[1]) : "";
-}
-
 uint8_t *getPlayerDevice(int id) {
   if (id < 0 || id > 14) {
     Serial.print("[ERROR] Attempted to retrieve device for unallowed player ID ");
@@ -1,121 +1,332 @@
-import serial
-import serial.tools.list_ports
+import os
 import time
+import serial.tools.list_ports
+
+from Arduino import protocol
+from Arduino import nominations, player_table
+from Arduino.bridge import Bridge
+from Arduino.command_queue import CoalescingCommandQueue
+from Arduino.device_profiles import DeviceProfiles
+from Arduino.nominations import NominationDay
+from Arduino.player_table import PlayerTable
+from Arduino.port_memory import PortMemory
+from collections import OrderedDict
+from consts import ARDUINO_PORT_MEMORY_PATH, ARDUINO_PROFILES_PATH
 
 class ArduinoController:
-    def __init__(self, baudrate=115200, timeout=0.1):
+    # Players per "pstate" command, keeping each line well inside the bridge's serial buffer
+    PLAYER_STATES_PER_COMMAND = 8
+    
+    def __init__(self, baudrate=115200, timeout=0.1, port=None, response_timeout=0.5, sequenced=None, binary=None, coalesce_window=None, routes=None):
+        
+        # Several bridges can be given as "name=port,name=port"; the first is the primary one
+        if port is None:
+            port = os.getenv("ARDUINO_PORT") or None
+        
+        # A single bridge is picked by its USB VID:PID if it has been used before, otherwise the port is asked for and remembered
+        port_memory = PortMemory(ARDUINO_PORT_MEMORY_PATH)
+        if port is None:
+            port = port_memory.find()
+            if port is not None:
+                print(f"[ARDUINO] Using remembered port {port}")
+        
+        if port is None:
+            print("COM devices:")
+            print([comport.device for comport in serial.tools.list_ports.comports()])
+            port = input("Enter the COM port for the Arduino (e.g., COM5, unlikely to be COM1): ").strip()
+            port_memory.remember(port)
+        
+        # Optionally send commands as compact binary frames rather than text lines
+        if binary is None:
+            binary = os.getenv("ARDUINO_BINARY", "").lower() in ("1", "true", "yes")
+        self.binary = binary
+        
+        # Each bridge has its own port, reader and writer thread, so a slow or unplugged one never holds up the others
+        ports = self._parse_ports(port)
+        self.bridges = OrderedDict(
+            (name, Bridge(name, device, baudrate=baudrate, timeout=timeout, binary=binary, label=name if len(ports) > 1 else None))
+            for name, device in ports.items()
+        )
+        self.bridge = next(iter(self.bridges.values()))
+        # The primary bridge's reader; the others are read by their own
+        self.reader = self.bridge.reader
         
-        print("COM devices:")
-        print([comport.device for comport in serial.tools.list_ports.comports()])
-        port = input("Enter the COM port for the Arduino (e.g., COM5, unlikely to be COM1): ").strip()
+        # Commands go to every bridge unless routed to some of them, by command word
+        self.routes = self._parse_routes(os.getenv("ARDUINO_ROUTES", "") if routes is None else routes)
         
-        self.arduino = serial.Serial(port, baudrate=baudrate, timeout=timeout)
-        self.in_configuration = False
-        self.in_nomination_config = False
+        self.response_timeout = response_timeout
+        self._last_command = None
+        # (bridge, Outgoing) for each bridge the last command was sent to
+        self._last_sent = []
         
         self.MAX_PLAYERS = 15
         
         self.player_count = 15
         
         self.current_player = 0
-        self.commands = {
-            "START": "start",
-            "DAY": "day",
-            "NIGHT": "night",
-            "OFF": "off",
-            "PRE_REVEAL": "prerev",
-            "START_CONFIG": "sconfig",
-            "NEXT_DEVICE": "ndevice",
-            "SET_DEVICE": "sdevice",
-            "END_CONFIG": "econfig",
-            "START_KILL": "skill",
-            "END_KILL": "ekill",
-            "START_REVIVE": "srevive",
-            "END_REVIVE": "erevive",
-            "DEAD": "dead",
-            "DEAD_VOTE_USED": "dvote",
-            "ALIVE": "alive",
-            "REVIVE_PLAYER": "revive",
-            
-            "NEXT_PLAYER": "nplayer",
-            "PREVIOUS_PLAYER": "pplayer",
-            "SET_PLAYER": "splayer",
-            
-            "START_NOMINATION_CONFIG": "snomcon",
-            "START_NOMINATIONS": "snomin",
-            "END_NOMINATIONS": "enomin",
-            "VOTE_YES": "vyes",
-            "VOTE_NO": "vno",
-            "VOTE_SKIP": "vskip",
-            
-            "END_GAME": "endgame",
-            "GOOD_WINS": "goodwins",
-            "EVIL_WINS": "evilwins",
-        }
+        self.players = PlayerTable(self.MAX_PLAYERS)
         
-        self.kill_menu_options = {
-            "1": "Next Player",
-            "2": "Previous Player",
-            "3": "Kill Current",
-            "4": "Cancel",   
-            "5": "Set Player"
-        }
+        # The device (index into the Sender's MAC addresses) of each seat, as the bridge has it; every device in order until configured
+        self.device_map = list(range(self.MAX_PLAYERS))
+        # The device the configuration menu is on
+        self._config_device = 0
+        # Mappings can be saved by name and restored in one command; ARDUINO_PROFILE is saved to when configuration ends
+        self.profiles = DeviceProfiles(os.getenv("ARDUINO_PROFILES") or ARDUINO_PROFILES_PATH)
+        self.profile = os.getenv("ARDUINO_PROFILE") or None
+        self.nominations = NominationDay(self.MAX_PLAYERS)
         
-        self.revive_menu_options = {
-            "1": "Next Player",
-            "2": "Previous Player",
-            "3": "Revive Current",
-            "4": "Cancel",
-            "5": "Set Player"
+        # Called after every change to the state above (e.g. to journal it)
+        self.on_state_change = None
+        
+        # Command words are defined once, alongside their binary opcodes, in Arduino/protocol.py
+        self.commands = {command.name: command.word for command in protocol.COMMANDS}
+        
+        # The menu open on the bridge (a key of self.menus), or None. Each option is (label, method run when it is chosen)
+        self.menu = None
+        self.menus = {
+            "kill": {
+                "1": ("Next Player", self.next_player),
+                "2": ("Previous Player", self.previous_player),
+                "3": ("Kill Current", self.kill_current),
+                "4": ("Cancel", self.end_kill_screen),
+                "5": ("Set Player", self.set_player)
+            },
+            "revive": {
+                "1": ("Next Player", self.next_player),
+                "2": ("Previous Player", self.previous_player),
+                "3": ("Revive Current", self.revive_current),
+                "4": ("Cancel", self.end_revive_screen),
+                "5": ("Set Player", self.set_player)
+            },
+            "config": {
+                "1": ("Set Device", self.add_device),
+                "2": ("Next Device", self.next_device),
+                "3": ("End Configuration", self.finish_device_config),
+                "4": ("Save Profile", self.save_profile)
+            },
+            "nomination_config": {
+                "1": ("Next Player", self.next_player),
+                "2": ("Previous Player", self.previous_player),
+                "3": ("Start Nominations", self.start_voting),
+                "4": ("Cancel", self.cancel_nominations),
+                "5": ("Set Player", self.set_player)
+            },
+            "nominations": {
+                "1": ("Voted Yes", lambda: self.vote(nominations.YES)),
+                "2": ("Voted No", lambda: self.vote(nominations.NO)),
+                "3": ("Skipped", lambda: self.vote(nominations.SKIPPED)),
+                "4": ("End Nominations", self.end_nominations)
+            }
         }
-    
-        self.configuration_options = {
-            "1": "Set Device",
-            "2": "Next Device",
-            "3": "End Configuration"
+        self.menu_titles = {
+            "config": "Configuration Options:",
+            "nomination_config": "Nomination Configuration Options:",
+            "nominations": "Nominations Options:"
         }
         
-        self.nomination_config_options = {
-            "1": "Next Player",
-            "2": "Previous Player",
-            "3": "Start Nominations",
-            "4": "Cancel",
-            "5": "Set Player"
-        }
+        # Whether opening a menu also asks for its options at the terminal until it is closed. When not, the menu
+        # stays open and its options are chosen with choose(), e.g. by the control API
+        self.interactive = True
+        
+        # Rapid "Next/Previous Player" presses are merged into a single "splayer" write
+        if coalesce_window is None:
+            coalesce_window = float(os.getenv("ARDUINO_COALESCE_WINDOW", "0.1"))
+        self.command_queue = CoalescingCommandQueue(self._send_now, self.commands["SET_PLAYER"], window=coalesce_window)
+        
+        # Optionally number each command and have the bridges acknowledge it, allowing several to be in flight at once
+        if sequenced is None:
+            sequenced = os.getenv("ARDUINO_SEQUENCED", "").lower() in ("1", "true", "yes")
+        
+        self.sequenced = sequenced
+        for bridge in self.bridges.values():
+            bridge.on_reconnect = self._bridge_reconnected
+            if sequenced:
+                bridge.start_sequencing(timeout=response_timeout)
+    
+    @staticmethod
+    def _parse_ports(ports):
+        """
+        Parses "name=port,name=port" (or a single port without a name) into {name: port}, in order.
+        """
+        entries = [entry.strip() for entry in ports.split(",") if entry.strip()]
+        parsed = OrderedDict()
+        for index, entry in enumerate(entries):
+            name, separator, device = entry.partition("=")
+            if not separator:
+                name, device = ("main" if len(entries) == 1 else f"bridge{index + 1}"), entry
+            if name.strip() in parsed:
+                raise ValueError(f"Bridge '{name.strip()}' is given more than once in '{ports}'")
+            parsed[name.strip()] = device.strip()
+        if not parsed:
+            raise ValueError("No serial port given for the Arduino bridge")
+        return parsed
+    
+    def _parse_routes(self, routes):
+        """
+        Parses "word=bridge+bridge,word=bridge" into {command word: [Bridge, ...]}.
+        """
+        parsed = {}
+        for entry in (entry.strip() for entry in routes.split(",") if entry.strip()):
+            word, _, names = entry.partition("=")
+            bridges = []
+            for name in (name.strip() for name in names.split("+") if name.strip()):
+                if name not in self.bridges:
+                    raise ValueError(f"ARDUINO_ROUTES sends '{word.strip()}' to unknown bridge '{name}' (bridges: {', '.join(self.bridges)})")
+                bridges.append(self.bridges[name])
+            parsed[word.strip()] = bridges
+        return parsed
+    
+    def _bridge_reconnected(self, bridge):
+        # Runs on the bridge's writer thread, so only marks every player to be sent again at the next sync
+        print(f"[ARDUINO] {bridge.name} is back; player states will be sent again at the next sync")
+        self.players.resync()
+        
+    def bridge_stats(self):
+        return {name: bridge.stats() for name, bridge in self.bridges.items()}
+        
+    def _await_response(self, expected=None, timeout=None):
+        """
+        Waits for the Arduino to reply to the last command sent, returning as soon as it does.
+        By default the reply is the Arduino echoing the command back; returns None if nothing matched within the timeout.
+        """
+        # A run of cursor moves may still be waiting to be merged; send it now, as the caller wants the reply
+        self.command_queue.flush()
+        
+        # Only the first bridge still connected is waited on, so a slow or unplugged bridge does not hold up the game
+        bridge, outgoing = next(((bridge, outgoing) for bridge, outgoing in self._last_sent if bridge.connected), (None, None))
+        if bridge is None:
+            if self._last_sent:
+                print(f"[ARDUINO] No bridge connected to reply to '{self._last_command}'")
+            return None
+        
+        timeout = self.response_timeout if timeout is None else timeout
+        end = time.monotonic() + timeout
+        if not outgoing.sent.wait(timeout) or outgoing.error is not None:
+            print(f"[ARDUINO] '{self._last_command}' was not written to {bridge.name}: {outgoing.error or 'still queued'}")
+            return None
+        remaining = max(end - time.monotonic(), 0)
+        
+        # Sequenced commands are acknowledged once the bridge has run them, which is a better reply than the echo
+        if expected is None and outgoing.seq is not None:
+            acked = bridge.sequencer.wait(outgoing.seq, timeout=remaining)
+            if not acked:
+                print(f"[ARDUINO] No ack for '{self._last_command}' (seq {outgoing.seq}) from {bridge.name} within {timeout}s")
+            return acked
         
-        self.nominations_options = {
-            "1": "Voted Yes",
-            "2": "Voted No",
-            "3": "Skipped",
-            "4": "End Nominations"
+        expected = self._last_command if expected is None else expected
+        
+        response = bridge.reader.wait_for(expected, timeout=remaining, since=outgoing.mark)
+        if response is None:
+            print(f"[ARDUINO] No reply to '{self._last_command}' from {bridge.name} within {timeout}s")
+        return response
+        
+    def _state_changed(self):
+        if self.on_state_change is not None:
+            self.on_state_change()
+            
+    def state(self):
+        return {
+            "current_player": self.current_player,
+            "player_count": self.player_count,
+            "device_map": self.device_map,
+            "players": self.players.to_list(),
+            "nominations": self.nominations.state()
         }
         
-        # There may already be something in the buffer; clear it
-        self._await_response()
+    def restore(self, state):
+        """
+        Restores the state saved by state(), without sending anything to the bridge (see push_player_states).
+        """
+        self.current_player = state.get("current_player", self.current_player)
+        self.player_count = state.get("player_count", self.player_count)
+        self.device_map = list(state.get("device_map", self.device_map))
+        self.nominations.restore(state.get("nominations", {}))
+        if "players" in state:
+            self.players.load(state["players"])
+        else:
+            # Journals written before the player table held lists of dead players instead
+            self.players.reset()
+            for player in state.get("dead", []):
+                self.players.set(player, player_table.DEAD)
+            for player in state.get("dead_vote_used", []):
+                self.players.set(player, player_table.DEAD_VOTE_USED)
+        
+    def sync_players(self):
+        """
+        Sends the players whose flags differ from what the devices last acknowledged, several per "pstate" command.
+        Returns the number of players sent; players whose command got no reply are sent again on the next sync.
+        """
+        changes = self.players.changes()
+        sent = 0
+        for start in range(0, len(changes), self.PLAYER_STATES_PER_COMMAND):
+            batch = changes[start:start + self.PLAYER_STATES_PER_COMMAND]
+            self.send_command(protocol.pack_player_states(batch))
+            if self._await_response() is None:
+                print(f"[ARDUINO] Player states not acknowledged, {len(changes) - sent} left to send")
+                break
+            self.players.acknowledge(batch)
+            sent += len(batch)
+        return sent
         
-    def _await_response(self):
+    def push_player_states(self):
         """
-        Waits for a response from the Arduino.
+        Sends every player's status and the current player to the bridge, e.g. after the bridge or this controller restarted.
         """
-        time.sleep(0.5)  # Small delay to allow Arduino to process
-        while self.arduino.in_waiting > 0:
-            response = self.arduino.readline().decode('utf-8').rstrip()
-            print(f"[ARDUINO] {response}")
+        self.players.resync()
+        self.sync_players()
+        self.send_command(f"{self.commands['SET_PLAYER']},{self.current_player}")
+        self._await_response()
         
-    def _get_set_player(self):
-        player_id = input("Enter player ID to set as current: ").strip()
+    def set_player(self, player_id=None):
+        """
+        Makes a player (numbered from 1) the current one, asking for the number if not given (and the menus are interactive).
+        """
+        if player_id is None and self.interactive:
+            player_id = input("Enter player ID to set as current: ")
+        player_id = str(player_id).strip()
         if player_id.isdigit() and 1 <= int(player_id) < self.player_count + 1:
             self.current_player = int(player_id) - 1
-            self.send_command(f"{self.commands["SET_PLAYER"]},{self.current_player}")
+            self.send_command(f"{self.commands['SET_PLAYER']},{self.current_player}")
+            self._state_changed()
         else:
             print("Invalid player ID. Please try again.")
 
-    def send_command(self, command):
+    def send_command(self, command, bridge=None):
         """
-        Sends a command to the Arduino and returns the response.
+        Sends a command after any cursor moves still waiting in the queue: to the bridges ARDUINO_ROUTES sends its word to
+        (every bridge, by default), to the named "bridge", or to every bridge if "bridge" is "*".
+        Each bridge writes it on its own thread, so this never waits for a bridge.
         """
-        print("Sending command to Arduino:", command)
-        self.arduino.write((command + '\n').encode('utf-8'))
+        self.command_queue.put(command, bridge)
+        
+    def _route(self, command, target=None):
+        if target == "*":
+            return list(self.bridges.values())
+        if target is not None:
+            if target not in self.bridges:
+                raise ValueError(f"No bridge '{target}' (bridges: {', '.join(self.bridges)})")
+            return [self.bridges[target]]
+        return self.routes.get(command.partition(",")[0]) or list(self.bridges.values())
+        
+    def _send_now(self, command, target=None):
+        bridges = self._route(command, target)
+        if len(bridges) < len(self.bridges):
+            print(f"Sending command to Arduino ({', '.join(bridge.name for bridge in bridges)}):", command)
+        else:
+            print("Sending command to Arduino:", command)
+        
+        self._last_command = command
+        self._last_sent = [(bridge, bridge.send(command)) for bridge in bridges]
+        
+    def next_player(self):
+        self.current_player = (self.current_player + 1) % self.player_count
+        self.command_queue.move(self.commands["NEXT_PLAYER"], self.current_player)
+        self._state_changed()
+        
+    def previous_player(self):
+        self.current_player = (self.current_player - 1) % self.player_count
+        self.command_queue.move(self.commands["PREVIOUS_PLAYER"], self.current_player)
+        self._state_changed()
         
     def start(self):
         self.send_command(self.commands["START"])
@@ -128,159 +339,273 @@ class ArduinoController:
 
     def start_day(self):
         self.send_command(self.commands["DAY"])
+        # Nobody is on the block at the start of a new day
+        self.nominations.reset()
+        self._state_changed()
+        
+    def _has_players(self):
+        # The player menus move round the table, which cannot be done without anyone at it
+        if self.player_count:
+            return True
+        print("[ARDUINO] No players are configured; configure the devices first")
+        return False
         
     def kill_player_screen(self):
+        if not self._has_players():
+            return
         self.send_command(self.commands["START_KILL"])
         self._await_response()
-        self.in_kill_screen = True
+        self._open_menu("kill")
         
-        while self.in_kill_screen:
-            print("Current player index:", self.current_player)
-
-            self._await_response()
-            for key, desc in self.kill_menu_options.items():
-                print(f"{key}: {desc}")
-                
-            user_input = input("Enter option number: ").strip()
-            if user_input == "1":
-                self.send_command(self.commands["NEXT_PLAYER"])
-                self.current_player = (self.current_player + 1) % self.player_count
-                
-            elif user_input == "2":
-                self.send_command(self.commands["PREVIOUS_PLAYER"])
-                self.current_player = (self.current_player - 1) % self.player_count
-
-            elif user_input == "3":
-                self.send_command(self.commands["DEAD"])
-            elif user_input == "4":
-                self.send_command(self.commands["END_KILL"])
-                self.in_kill_screen = False
-            elif user_input == "5":
-                self._get_set_player()
-            else:
-                print("Invalid option. Please try again.")
+    def kill_current(self):
+        self.send_command(self.commands["DEAD"])
+        self.players.apply(self.current_player, player_table.DEAD)
+        self._state_changed()
+        
+    def end_kill_screen(self):
+        self.send_command(self.commands["END_KILL"])
+        self.menu = None
                 
     def revive_player_screen(self):
+        if not self._has_players():
+            return
         self.send_command(self.commands["START_REVIVE"])
         self._await_response()
-        self.in_revive_screen = True
-        
         print("Current player index:", self.current_player)
+        self._open_menu("revive")
         
-        while self.in_revive_screen:
-            self._await_response()
-            for key, desc in self.revive_menu_options.items():
-                print(f"{key}: {desc}")
-                
-            user_input = input("Enter option number: ").strip()
-            if user_input == "1":
-                self.send_command(self.commands["NEXT_PLAYER"])
-                self.current_player = (self.current_player + 1) % self.player_count
-                
-            elif user_input == "2":
-                self.send_command(self.commands["PREVIOUS_PLAYER"])
-                self.current_player = (self.current_player - 1) % self.player_count
-                
-            elif user_input == "3":
-                self.send_command(self.commands["REVIVE_PLAYER"])
-                
-            elif user_input == "4":
-                self.send_command(self.commands["END_REVIVE"])
-                self.in_revive_screen = False
-
-            elif user_input == "5":
-                self._get_set_player()
-
-            else:
-                print("Invalid option. Please try again.")
-            
+    def revive_current(self):
+        self.send_command(self.commands["REVIVE_PLAYER"])
+        self.players.apply(self.current_player, player_table.DEAD | player_table.DEAD_VOTE_USED, False)
+        self._state_changed()
+        
+    def end_revive_screen(self):
+        self.send_command(self.commands["END_REVIVE"])
+        self.menu = None
     
     def start_config(self):
         self.send_command(self.commands["START_CONFIG"])
         self._await_response()
-        self.in_configuration = True
-        
         self.player_count = 0
+        self.device_map = []
+        self._config_device = 0
+        self._open_menu("config")
         
-        while self.in_configuration:
-            self._await_response()
-            print("Configuration Options:")
-            for key, desc in self.configuration_options.items():
-                print(f"{key}: {desc}")
-            user_input = input("Enter option number: ").strip()
-            if user_input == "1":
-                self.set_device()
-                self.player_count += 1
-            elif user_input == "2":
-                self.next_device()
-            elif user_input == "3":
-                self.end_config()
-                print("Configuration complete. Total players configured:", self.player_count)
-                self.in_configuration = False
-            else:
-                print("Invalid option. Please try again.")
-    
+    def add_device(self):
+        self.set_device()
+        self.player_count += 1
+        # The bridge gives the next seat the device it is on, then moves on to the next device
+        if len(self.device_map) < self.MAX_PLAYERS:
+            self.device_map.append(self._config_device)
+        self._config_device = (self._config_device + 1) % self.MAX_PLAYERS
+        
+    def finish_device_config(self):
+        self.end_config()
+        print("Configuration complete. Total players configured:", self.player_count)
+        self.menu = None
+        if self.profile is not None and self.device_map:
+            self.save_profile(self.profile)
+        self._state_changed()
+        
+    def save_profile(self, name=None):
+        """
+        Saves the current device-to-seat mapping under a name (asked for if not given, when the menus are interactive),
+        to be restored with restore_profile.
+        """
+        if not self.device_map:
+            print("[ARDUINO] No devices have been configured; nothing to save")
+            return False
+        if name is None:
+            name = self.profile or "default"
+            if self.interactive:
+                name = input(f"Profile name to save as [{name}]: ").strip() or name
+        
+        self.profiles.save(name, self.device_map)
+        print(f"[ARDUINO] Saved {len(self.device_map)} seats as profile '{name}'")
+        return True
+        
+    def restore_profile(self, name=None):
+        """
+        Sends a saved device-to-seat mapping to the bridge in one "cfgmap" command, instead of configuring each device in
+        turn, and checks it against what the bridge reports having applied. Asks for the profile if not given (and the menus
+        are interactive; otherwise ARDUINO_PROFILE, or the first saved).
+        Returns False (leaving the seats as they were) if there is no such profile or the bridge did not apply it.
+        """
+        if name is None:
+            names = self.profiles.names()
+            if not names:
+                print("[ARDUINO] No saved profiles; configure the devices and save one first")
+                return False
+            name = self.profile if self.profile in names else names[0]
+            if self.interactive:
+                name = input(f"Profile to restore ({', '.join(names)}) [{name}]: ").strip() or name
+        
+        devices = self.profiles.load(name)
+        if devices is None:
+            print(f"[ARDUINO] No profile '{name}'")
+            return False
+        if not devices or len(devices) > self.MAX_PLAYERS or len(set(devices)) != len(devices) or not all(0 <= device < self.MAX_PLAYERS for device in devices):
+            print(f"[ARDUINO] Profile '{name}' is not a valid mapping: {devices}")
+            return False
+        
+        applied_word = self.commands["CONFIG_APPLIED"]
+        self.send_command(protocol.pack_config_map(devices))
+        reply = self._await_response(expected=lambda text: text.startswith(applied_word + ","))
+        expected = protocol.config_applied_reply(devices)
+        if reply is None or reply.text != expected:
+            print(f"[ARDUINO] Profile '{name}' was not applied: expected '{expected}', bridge replied {reply.text if reply else None!r}")
+            return False
+        
+        self.device_map = devices
+        self.player_count = len(devices)
+        # The bridge starts again from the first seat, with every device showing it is in play
+        self.current_player = 0
+        self.menu = None
+        self.players.resync()
+        print(f"[ARDUINO] Restored profile '{name}': {self.player_count} players")
+        self._state_changed()
+        return True
 
     def start_nomination_config(self):
-        self.in_nomination_config = True
+        if not self._has_players():
+            return
         self.send_command(self.commands["START_NOMINATION_CONFIG"])
-        while self.in_nomination_config:
-            self._await_response()
-            print("Nomination Configuration Options:")
-            for key, desc in self.nomination_config_options.items():
-                print(f"{key}: {desc}")
-            user_input = input("Enter option number: ").strip()
-            if user_input == "1":
-                self.send_command(self.commands["NEXT_PLAYER"])
-                self.current_player = (self.current_player + 1) % self.player_count
-
-            elif user_input == "2":
-                self.send_command(self.commands["PREVIOUS_PLAYER"])
-                self.current_player = (self.current_player - 1) % self.player_count
-
-            elif user_input == "3":
-                self.send_command(self.commands["START_NOMINATIONS"])
-                self.in_nomination_config = False
-                self.in_nominations = True
-                self.start_nominations()
+        self._await_response()
+        self._open_menu("nomination_config")
+        
+    def start_voting(self):
+        self.send_command(self.commands["START_NOMINATIONS"])
+        # Votes from the last nomination no longer count; the devices clear them themselves, and light up the nominee
+        nominated = player_table.NOMINATED | player_table.VOTED_YES | player_table.VOTED_NO
+        for player in self.players.players_with(nominated):
+            self.players.apply(player, nominated, False)
+        self.players.apply(self.current_player, player_table.NOMINATED)
+        
+        alive = sum(1 for player in range(self.player_count) if not self.players.has(player, player_table.DEAD))
+        nomination = self.nominations.nominate(self.current_player, alive)
+        print(f"[NOMINATIONS] Player {nomination.nominee + 1} nominated; {nomination.threshold} of {alive} living players needed")
+        self._send_tally(nomination)
+        
+        # The bridge moves on to the player after the nominee, who votes first
+        self.current_player = (self.current_player + 1) % self.player_count
+        self.menu = "nominations"
+        self._state_changed()
+        
+    def cancel_nominations(self):
+        self.send_command(self.commands["END_NOMINATIONS"])
+        self.menu = None
+        
+    def vote(self, vote):
+        voter = self.current_player
+        
+        if vote == nominations.YES and self.players.has(voter, player_table.DEAD):
+            if self.players.has(voter, player_table.DEAD_VOTE_USED):
+                print(f"[NOMINATIONS] Player {voter + 1} is dead and has used their vote; not counted")
+                vote = nominations.SKIPPED
+            else:
+                # Sent with the other player changes once voting ends
+                self.players.set(voter, player_table.DEAD_VOTE_USED)
+        
+        # The vote actually counted is shown, so the device and the tally agree
+        self.send_command(self.commands[nominations.VOTE_COMMANDS[vote]])
+        if vote != nominations.SKIPPED:
+            self.players.apply(voter, player_table.VOTED_YES if vote == nominations.YES else player_table.VOTED_NO)
+        
+        nomination = self.nominations.record(voter, vote)
+        if nomination is not None:
+            print(f"[NOMINATIONS] Player {voter + 1} voted {nominations.VOTE_NAMES[vote]}: "
+                  f"{nomination.yes}/{nomination.threshold} (highest today {self.nominations.highest})")
+            self._send_tally(nomination)
+        
+        self.current_player = (self.current_player + 1) % self.player_count
+        self._state_changed()
+        
+    def _send_tally(self, nomination):
+        self.send_command(f"{self.commands['TALLY']},{(nomination.yes << 8) | nomination.threshold}")
 
-            elif user_input == "4":
-                self.send_command(self.commands["END_NOMINATIONS"])
-                self.in_nomination_config = False
+    def show_countdown(self, seconds=None):
+        """
+        Shows the seconds left in the phase on the bridges' displays, or clears them if "seconds" is None.
+        Ticks come from the scheduler's thread, so they go straight to the bridges rather than through the command queue:
+        they must not become the command a menu is waiting for a reply to.
+        """
+        command = self.commands["COUNTDOWN"] if seconds is None else f"{self.commands['COUNTDOWN']},{int(seconds)}"
+        for bridge in self._route(command):
+            bridge.send(command)
 
-            elif user_input == "5":
-                self._get_set_player()
-                
+    def end_nominations(self):
+        self.send_command(self.commands["DAY"])
+        # The bridge runs sequenced commands strictly in order, so they can go back-to-back; otherwise wait for it to read DAY first
+        if not self.sequenced:
+            self._await_response()
+        self.send_command(self.commands["END_NOMINATIONS"])
+        self.menu = None
+        
+        nomination = self.nominations.close()
+        if nomination is not None:
+            # The bridge goes back to the nominee
+            self.current_player = nomination.nominee
+            passed = "passes" if nomination.yes >= nomination.threshold else "fails"
+            print(f"[NOMINATIONS] Player {nomination.nominee + 1}: {nomination.yes} votes, {nomination.threshold} needed; {passed}")
+            if self.nominations.on_the_block is None:
+                print(f"[NOMINATIONS] Nobody is on the block (highest today {self.nominations.highest})")
             else:
-                print("Invalid option. Please try again.")
-                
-    def start_nominations(self):
-        while self.in_nominations:
-            print("Nominations Options:")
-            for key, desc in self.nominations_options.items():
-                print(f"{key}: {desc}")
+                print(f"[NOMINATIONS] Player {self.nominations.on_the_block + 1} is on the block with {self.nominations.highest} votes")
+        
+        # Dead votes used during the nomination, in one "pstate" command
+        self.sync_players()
+        self._state_changed()
+        
+    def _open_menu(self, menu):
+        self.menu = menu
+        if self.interactive:
+            self.run_menu()
+            
+    def menu_options(self, menu=None):
+        """
+        Returns {option: label} for a menu, by default the one open now (an empty dict if none is).
+        """
+        menu = self.menu if menu is None else menu
+        return {option: label for option, (label, _) in self.menus.get(menu, {}).items()}
+        
+    def choose(self, option, player=None):
+        """
+        Runs an option of the open menu. "Set Player" options take the player's number (from 1), and ask for it if not given.
+        Returns False if the open menu has no such option.
+        """
+        entry = self.menus.get(self.menu, {}).get(option)
+        if entry is None:
+            return False
+        
+        _, action = entry
+        if action == self.set_player:
+            action(player)
+        else:
+            action()
+        return True
+        
+    def print_menu(self):
+        if self.menu == "kill":
+            print("Current player index:", self.current_player)
+        if self.menu in self.menu_titles:
+            print(self.menu_titles[self.menu])
+        for key, desc in self.menu_options().items():
+            print(f"{key}: {desc}")
+            
+    def run_menu(self):
+        """
+        Asks for options at the terminal until the open menu is closed.
+        """
+        while self.menu is not None:
+            self.print_menu()
             user_input = input("Enter option number: ").strip()
-            if user_input == "1":
-                self.send_command(self.commands["VOTE_YES"])
-                self.current_player = (self.current_player + 1) % self.player_count
-            elif user_input == "2":
-                self.send_command(self.commands["VOTE_NO"])
-                self.current_player = (self.current_player + 1) % self.player_count
-            elif user_input == "3":
-                self.send_command(self.commands["VOTE_SKIP"])
-                self.current_player = (self.current_player + 1) % self.player_count
-            elif user_input == "4":
-                self.send_command(self.commands["DAY"])
-                time.sleep(1)
-                self.send_command(self.commands["END_NOMINATIONS"])
-                self.in_nominations = False
-            else:
+            if not self.choose(user_input):
                 print("Invalid option. Please try again.")
         
-
     def next_device(self):
         self.send_command(self.commands["NEXT_DEVICE"])
         self._await_response()
+        self._config_device = (self._config_device + 1) % self.MAX_PLAYERS
     
     def set_device(self):
         self.send_command(self.commands["SET_DEVICE"])
@@ -290,14 +615,22 @@ class ArduinoController:
         self.send_command(self.commands["END_CONFIG"])
         self._await_response()
         
+    def _set_player_flag(self, id, flag, value=True):
+        if not 0 <= id < self.MAX_PLAYERS:
+            print(f"Invalid player ID {id}. Must be between 0 and {self.MAX_PLAYERS - 1}.")
+            return
+        self.players.set(id, flag, value)
+        self._state_changed()
+        self.sync_players()
+        
     def set_dead(self, id: int):
-        self.send_command(f"{self.commands['DEAD']},{id}")
+        self._set_player_flag(id, player_table.DEAD)
     
     def set_dead_vote_used(self, id: int):
-        self.send_command(f"{self.commands['DEAD_VOTE_USED']},{id}")
+        self._set_player_flag(id, player_table.DEAD_VOTE_USED)
         
     def set_alive(self, id: int):
-        self.send_command(f"{self.commands['ALIVE']},{id}")
+        self._set_player_flag(id, player_table.DEAD | player_table.DEAD_VOTE_USED, False)
         
     def enter_end_game(self):
         self.send_command(self.commands['END_GAME'])
@@ -309,4 +642,8 @@ class ArduinoController:
         self.send_command(self.commands['EVIL_WINS'])
         
     def restart_game(self):
-        self.send_command(self.commands['START'])
\ No newline at end of file
+        self.send_command(self.commands['START'])
+        self.current_player = 0
+        self.players.reset()
+        self.nominations.reset()
+        self._state_changed()
\ No newline at end of file
@@ -0,0 +1,250 @@
+import contextvars
+import queue
+import threading
+import time
+import serial
+
+from Arduino import protocol
+from Arduino.sequencer import CommandSequencer, RESET_COMMAND
+from Arduino.serial_reader import SerialReader
+from collections import OrderedDict, deque
+from util.tracing import tracer
+
+# Write latencies kept per bridge for its percentiles
+LATENCY_HISTORY = 256
+
+
+class Outgoing():
+    """
+    A command on its way to one bridge. "sent" is set once the writer thread has written it (with its sequence number,
+    if sequenced) or given up on it (with the reason in "error").
+    """
+    def __init__(self, command, mark):
+        self.command = command
+        # Replies read after this reader mark can be the reply to this command
+        self.mark = mark
+        self.queued = time.monotonic()
+        # Written in the caller's context, so the serial span is part of the caller's trace
+        self.context = contextvars.copy_context()
+        self.sent = threading.Event()
+        self.seq = None
+        self.error = None
+
+
+class Bridge():
+    """
+    One ESP-NOW bridge on its own serial port. Commands go on the bridge's own outbound queue and are written by its own
+    writer thread, so a bridge that is slow to take them, or has been unplugged, only holds up its own commands.
+    When a write fails the bridge is marked as disconnected: commands for it are dropped until its port can be opened
+    again, which is tried every "reconnect_interval" seconds.
+    """
+    def __init__(self, name, port, baudrate=115200, timeout=0.1, write_timeout=1.0, binary=False, max_queue=256,
+                 reconnect_interval=2.0, label=None):
+        self.name = name
+        self.port = port
+        self.binary = binary
+        self.reconnect_interval = reconnect_interval
+
+        self.serial = serial.Serial(port, baudrate=baudrate, timeout=timeout, write_timeout=write_timeout)
+        self.connected = True
+        # Called on the writer thread once the bridge is back after being disconnected
+        self.on_reconnect = None
+
+        # Anything already in the buffer (or sent later) is printed by the reader as it arrives
+        self.reader = SerialReader(self.serial, label=label).start()
+        self.sequencer = None
+
+        self.outbox = queue.Queue(maxsize=max_queue)
+        self.writes = 0
+        self.write_errors = 0
+        self.dropped = 0
+        # Seconds from a command being queued to it being written
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+
+        # Commands still waiting for their reply (echo or ack), by the reply text, for tracing the ESP32's reply time
+        self._awaiting_reply = OrderedDict()
+        self._awaiting_reply_lock = threading.Lock()
+        self.reader.add_listener(self._trace_reply)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._write_loop, daemon=True, name=f"bridge_{name}")
+        self._thread.start()
+
+    def start_sequencing(self, timeout=0.5):
+        """
+        Resets the bridge's sequence numbers, then numbers every command sent to it and has it acknowledge each one.
+        """
+        outgoing = self.send(RESET_COMMAND)
+        if outgoing.sent.wait(timeout) and outgoing.error is None:
+            self.reader.wait_for(RESET_COMMAND, timeout=timeout, since=outgoing.mark)
+        self.sequencer = CommandSequencer(self._sequenced_write)
+        self.reader.add_listener(self.sequencer.on_line)
+
+    def send(self, command):
+        """
+        Queues a command for the writer thread and returns its Outgoing straight away.
+        """
+        outgoing = Outgoing(command, self.reader.mark())
+        if not self.connected:
+            self._drop(outgoing, "disconnected")
+            return outgoing
+
+        try:
+            self.outbox.put_nowait(outgoing)
+        except queue.Full:
+            # The bridge has stopped taking commands; the oldest are the least useful, so make room by dropping them
+            try:
+                self._drop(self.outbox.get_nowait(), "queue full")
+            except queue.Empty:
+                pass
+            self.outbox.put_nowait(outgoing)
+        return outgoing
+
+    def write_line(self, command, seq=None):
+        data = None
+        if self.binary:
+            try:
+                data = protocol.encode(command, seq)
+            except protocol.FrameError:
+                # Commands that do not fit a frame (e.g. "pstate" for several players) are sent as text; the bridge reads both
+                pass
+
+        if data is None:
+            data = (command + '\n' if seq is None else f"{seq}:{command}\n").encode('utf-8')
+
+        with tracer.span(command.partition(",")[0], kind="serial", command=command, seq=seq, bridge=self.name, bytes_written=len(data)):
+            self.serial.write(data)
+
+    def _sequenced_write(self, command, seq=None):
+        try:
+            self.write_line(command, seq)
+        except (serial.SerialException, OSError):
+            # Retransmits are written on the sequencer's own thread; the writer thread notices the port has gone on its next write
+            if threading.current_thread() is self._thread:
+                raise
+            self.write_errors += 1
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(int(round(fraction * (len(latencies) - 1))), len(latencies) - 1)] * 1000, 2)
+
+        return {
+            "port": self.port,
+            "connected": self.connected,
+            "queue_depth": self.outbox.qsize(),
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+            "dropped": self.dropped,
+            "write_latency_p50_ms": percentile(0.50),
+            "write_latency_p95_ms": percentile(0.95),
+            "write_latency_max_ms": percentile(1.0)
+        }
+
+    def stop(self):
+        self._running = False
+        try:
+            self.outbox.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=1)
+        if self.sequencer is not None:
+            self.sequencer.stop()
+        self.reader.stop()
+        self.serial.close()
+
+    def _drop(self, outgoing, reason):
+        self.dropped += 1
+        outgoing.error = reason
+        outgoing.sent.set()
+
+    def _write_loop(self):
+        while self._running:
+            try:
+                # While disconnected nothing is queued, so waking up means it is time to try the port again
+                outgoing = self.outbox.get(timeout=None if self.connected else self.reconnect_interval)
+            except queue.Empty:
+                self._reconnect()
+                continue
+
+            if outgoing is None:
+                return
+
+            try:
+                outgoing.context.run(self._write, outgoing)
+            except serial.SerialTimeoutException as e:
+                # Too slow to take the command, but still there
+                self.write_errors += 1
+                outgoing.error = repr(e)
+                print(f"[ARDUINO] {self.name}: timed out writing '{outgoing.command}'")
+            except (serial.SerialException, OSError) as e:
+                self.write_errors += 1
+                outgoing.error = repr(e)
+                self._disconnect(e)
+            except Exception as e:
+                # e.g. the sequencer's window staying full
+                self.write_errors += 1
+                outgoing.error = repr(e)
+                print(f"[ARDUINO] {self.name}: could not send '{outgoing.command}': {e}")
+            finally:
+                outgoing.sent.set()
+
+    def _write(self, outgoing):
+        command = outgoing.command
+        # Registered before writing, as the reply can arrive before the write call returns
+        reply = command if self.sequencer is None else f"ack {self.sequencer.next_seq}"
+        with self._awaiting_reply_lock:
+            self._awaiting_reply[reply] = (command, time.monotonic(), tracer.current())
+            # Commands the bridge never replied to are forgotten eventually
+            while len(self._awaiting_reply) > 64:
+                self._awaiting_reply.popitem(last=False)
+
+        if self.sequencer is not None:
+            outgoing.seq = self.sequencer.send(command)
+        else:
+            self.write_line(command)
+
+        self.writes += 1
+        self.latencies.append(time.monotonic() - outgoing.queued)
+
+    def _disconnect(self, error):
+        self.connected = False
+        print(f"[ARDUINO] {self.name} ({self.port}) disconnected: {error}")
+        while True:
+            try:
+                outgoing = self.outbox.get_nowait()
+            except queue.Empty:
+                return
+            if outgoing is None:
+                self._running = False
+                return
+            self._drop(outgoing, "disconnected")
+
+    def _reconnect(self):
+        self.reader.stop()
+        try:
+            self.serial.close()
+            self.serial.open()
+            if self.sequencer is not None:
+                self.sequencer.reset()
+                self.write_line(RESET_COMMAND)
+        except (serial.SerialException, OSError):
+            return False
+
+        self.connected = True
+        self.reader.start()
+        print(f"[ARDUINO] {self.name} ({self.port}) reconnected")
+        if self.on_reconnect is not None:
+            self.on_reconnect(self)
+        return True
+
+    def _trace_reply(self, line):
+        with self._awaiting_reply_lock:
+            pending = self._awaiting_reply.pop(line.text, None)
+
+        if pending is not None:
+            command, sent_at, parent = pending
+            tracer.record(command.partition(",")[0], "esp32_reply", sent_at, line.received, parent=parent, command=command, bridge=self.name)
@@ -0,0 +1,113 @@
+import threading
+import time
+
+class CoalescingCommandQueue():
+    """
+    Outbound command queue that merges runs of relative cursor moves (e.g. "nplayer"/"pplayer") into a single absolute
+    "splayer,<idx>". A run is sent once no further move has arrived for "window" seconds (or "max_delay" after it began).
+    Every other command is an ordering barrier: any pending run is sent first, then the command itself.
+    Commands are sent with send(command, target); moves always have no target.
+    A window of 0 disables coalescing, sending every command straight away.
+    """
+    def __init__(self, send, set_player_word, window=0.1, max_delay=0.5):
+        self._send = send
+        self.set_player_word = set_player_word
+        self.window = window
+        self.max_delay = max_delay
+
+        self.commands_sent = 0
+        self.moves_received = 0
+        self.writes_saved = 0
+
+        # The pending run: its first move (sent as-is if it is the only one), its length and the resulting player index
+        self._first_move = None
+        self._run_length = 0
+        self._target = None
+        self._run_started = 0.0
+        self._last_move = 0.0
+
+        self._condition = threading.Condition()
+        self._running = True
+
+        if window > 0:
+            threading.Thread(target=self._flush_loop, daemon=True, name="command_queue").start()
+
+    def move(self, command, target):
+        """
+        Queues a relative cursor move. "target" is the absolute player index once the move has been applied.
+        """
+        with self._condition:
+            self.moves_received += 1
+            if self.window <= 0:
+                self._write(command)
+                return
+
+            now = time.monotonic()
+            if self._run_length == 0:
+                self._first_move = command
+                self._run_started = now
+
+            self._run_length += 1
+            self._target = target
+            self._last_move = now
+            self._condition.notify_all()
+
+    def put(self, command, target=None):
+        """
+        Queues any other command, sending it (after any pending run of moves) straight away.
+        """
+        with self._condition:
+            self._flush_run()
+            self._write(command, target)
+
+    def flush(self):
+        with self._condition:
+            self._flush_run()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "commands_sent": self.commands_sent,
+                "moves_received": self.moves_received,
+                "writes_saved": self.writes_saved,
+                "pending_moves": self._run_length
+            }
+
+    def _write(self, command, target=None):
+        self.commands_sent += 1
+        self._send(command, target)
+
+    def _flush_run(self):
+        if self._run_length == 0:
+            return
+
+        if self._run_length == 1:
+            self._write(self._first_move)
+        else:
+            self._write(f"{self.set_player_word},{self._target}")
+            self.writes_saved += self._run_length - 1
+
+        self._first_move = None
+        self._run_length = 0
+        self._target = None
+
+    def _flush_loop(self):
+        with self._condition:
+            while self._running:
+                if self._run_length == 0:
+                    self._condition.wait()
+                    continue
+
+                due = min(self._last_move + self.window, self._run_started + self.max_delay)
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+
+                self._flush_run()
+
+    def stop(self):
+        with self._condition:
+            self._flush_run()
+            self._running = False
+            self._condition.notify_all()
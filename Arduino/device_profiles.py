@@ -0,0 +1,47 @@
+import json
+import os
+import time
+
+
+class DeviceProfiles():
+    """
+    Device-to-seat mappings saved by name, all in one JSON file, so a table that has been set up before can be restored
+    with a single command instead of walking through the device configuration menu again.
+    Each mapping is the device (index into the Sender's MAC addresses) of each seat in turn.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                profiles = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return profiles if isinstance(profiles, dict) else {}
+
+    def names(self):
+        return sorted(self._load())
+
+    def load(self, name):
+        """
+        Returns the devices saved as "name", or None if there is no such profile.
+        """
+        profile = self._load().get(name)
+        if profile is None:
+            return None
+        return [int(device) for device in profile["devices"]]
+
+    def save(self, name, devices):
+        profiles = self._load()
+        profiles[name] = {"devices": list(devices), "saved": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Written alongside and swapped in, so a crash mid-write never loses the other profiles
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(temporary, self.path)
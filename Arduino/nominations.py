@@ -0,0 +1,91 @@
+YES = 1
+NO = 2
+SKIPPED = 3
+
+VOTE_NAMES = {YES: "yes", NO: "no", SKIPPED: "skipped"}
+# The command (a name in Arduino/protocol.py's COMMANDS) that shows each vote on the devices
+VOTE_COMMANDS = {YES: "VOTE_YES", NO: "VOTE_NO", SKIPPED: "VOTE_SKIP"}
+
+
+class Nomination():
+    """
+    The votes on one nomination, one byte per player, with running totals so recording a vote never recounts the circle.
+    """
+    def __init__(self, nominee, alive, size):
+        self.nominee = nominee
+        self.alive = alive
+        # Half the living players, rounded up
+        self.threshold = (alive + 1) // 2
+        self.votes = bytearray(size)
+        self.counts = {YES: 0, NO: 0, SKIPPED: 0}
+
+    @property
+    def yes(self):
+        return self.counts[YES]
+
+    def record(self, player, vote):
+        previous = self.votes[player]
+        if previous:
+            self.counts[previous] -= 1
+        self.votes[player] = vote
+        self.counts[vote] += 1
+
+    def to_dict(self):
+        return {
+            "nominee": self.nominee,
+            "yes": self.counts[YES],
+            "no": self.counts[NO],
+            "skipped": self.counts[SKIPPED],
+            "threshold": self.threshold,
+            "voted_yes": [player for player, vote in enumerate(self.votes) if vote == YES]
+        }
+
+
+class NominationDay():
+    """
+    Every nomination of the current day, and who is about to die: the nominee with the most votes, as long as that is at
+    least half the living players and more than any other nominee got today (a tie means nobody is executed).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.nominations = []
+        self.current = None
+        self.highest = 0
+        self.on_the_block = None
+
+    def nominate(self, nominee, alive):
+        self.current = Nomination(nominee, alive, self.size)
+        self.nominations.append(self.current)
+        return self.current
+
+    def record(self, player, vote):
+        if self.current is None:
+            return None
+        self.current.record(player, vote)
+        return self.current
+
+    def close(self):
+        """
+        Ends voting on the current nomination, comparing it with the day's highest. Returns the nomination, or None.
+        """
+        nomination, self.current = self.current, None
+        if nomination is None or nomination.yes < nomination.threshold:
+            return nomination
+
+        if nomination.yes > self.highest:
+            self.highest = nomination.yes
+            self.on_the_block = nomination.nominee
+        elif nomination.yes == self.highest:
+            self.on_the_block = None
+        return nomination
+
+    def state(self):
+        return {"highest": self.highest, "on_the_block": self.on_the_block}
+
+    def restore(self, state):
+        self.reset()
+        self.highest = state.get("highest", 0)
+        self.on_the_block = state.get("on_the_block")
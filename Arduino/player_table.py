@@ -0,0 +1,82 @@
+from Arduino import protocol
+
+# Flag bits of a player's entry, shared with the bridge through botc_protocol.h
+DEAD = protocol.PLAYER_DEAD
+DEAD_VOTE_USED = protocol.PLAYER_DEAD_VOTE_USED
+NOMINATED = protocol.PLAYER_NOMINATED
+VOTED_YES = protocol.PLAYER_VOTED_YES
+VOTED_NO = protocol.PLAYER_VOTED_NO
+
+# Stands in for an acknowledged entry when what the devices show is not known (no real entry uses every bit)
+UNKNOWN = 0xFF
+
+
+class PlayerTable():
+    """
+    One byte of flags per player: the state the devices should show ("desired") and the last state they acknowledged ("acked").
+    changes() is the difference between the two, so only players whose flags changed are sent to the bridge.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.desired = bytearray(size)
+        self.acked = bytearray(size)
+
+    def set(self, player, flag, value=True):
+        if value:
+            self.desired[player] |= flag
+        else:
+            self.desired[player] &= ~flag & 0xFF
+
+    def has(self, player, flag):
+        return bool(self.desired[player] & flag)
+
+    def players_with(self, flag):
+        return [player for player, flags in enumerate(self.desired) if flags & flag]
+
+    def apply(self, player, flag, value=True):
+        """
+        Records a change the devices have already made themselves (e.g. the bridge killing the current player),
+        so it is not sent to them again.
+        """
+        self.set(player, flag, value)
+        if self.acked[player] != UNKNOWN:
+            if value:
+                self.acked[player] |= flag
+            else:
+                self.acked[player] &= ~flag & 0xFF
+
+    def clear_flag(self, flag):
+        """
+        Clears a flag for every player, e.g. the votes at the start of a new nomination.
+        """
+        for player in range(self.size):
+            self.desired[player] &= ~flag & 0xFF
+
+    def changes(self):
+        """
+        Returns (player, flags) for every player whose desired flags differ from what the devices acknowledged.
+        """
+        return [(player, flags) for player, (flags, acked) in enumerate(zip(self.desired, self.acked)) if flags != acked]
+
+    def acknowledge(self, entries):
+        for player, flags in entries:
+            self.acked[player] = flags
+
+    def resync(self):
+        """
+        Forgets what the devices show, so the next sync sends every player (e.g. after a receiver rebooted).
+        """
+        self.acked[:] = bytes([UNKNOWN]) * self.size
+
+    def reset(self):
+        """
+        Clears every player's flags at the start of a new game; the devices reset themselves, so nothing needs sending.
+        """
+        self.desired[:] = bytes(self.size)
+        self.acked[:] = bytes(self.size)
+
+    def to_list(self):
+        return list(self.desired)
+
+    def load(self, flags):
+        self.desired[:] = bytes(flags[:self.size]) + bytes(max(self.size - len(flags), 0))
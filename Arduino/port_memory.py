@@ -0,0 +1,58 @@
+import json
+import os
+
+import serial.tools.list_ports
+
+
+class PortMemory():
+    """
+    Remembers the USB VID:PID (and serial number, if it has one) of the bridge's serial port, so it can be picked
+    automatically next time even if it has been given a different COM port or /dev/tty name.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def find(self):
+        """
+        Returns the device name of the remembered port if exactly one connected port matches it, otherwise None.
+        """
+        remembered = self._load()
+        if not remembered:
+            return None
+
+        matches = [
+            port for port in serial.tools.list_ports.comports()
+            if port.vid == remembered.get("vid") and port.pid == remembered.get("pid")
+        ]
+
+        # Several identical boards are told apart by serial number, if they report one
+        if len(matches) > 1 and remembered.get("serial_number"):
+            matches = [port for port in matches if port.serial_number == remembered["serial_number"]]
+
+        if len(matches) != 1:
+            return None
+        return matches[0].device
+
+    def remember(self, device):
+        """
+        Remembers the port with this device name. Ports without a USB VID:PID cannot be recognised later, so are not remembered.
+        """
+        port = next((port for port in serial.tools.list_ports.comports() if port.device == device), None)
+        if port is None or port.vid is None:
+            return False
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, "w") as f:
+            json.dump({"vid": port.vid, "pid": port.pid, "serial_number": port.serial_number, "description": port.description}, f)
+        print(f"[ARDUINO] Remembered {device} ({port.vid:04X}:{port.pid:04X}) for next time")
+        return True
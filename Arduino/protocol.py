@@ -0,0 +1,315 @@
+"""
+The command set shared by the Python controller and the ESP32 sketches, and its compact binary framing.
+
+Every command is defined once in COMMANDS. The Python encoder/decoder below and the botc_protocol.h header used by the
+sketches are both generated from it; after changing COMMANDS, regenerate the headers with:
+
+    python -m Arduino.protocol
+"""
+import os
+
+FRAME_SYNC = 0xA5
+FRAME_SIZE = 6  # sync, opcode, seq, arg (2 bytes, little-endian), checksum
+FRAME_SEQUENCED = 0x80  # set on the opcode byte when the seq byte is in use
+NO_ARG = 0xFFFF
+
+# Per-player status flags, as sent in "pstate" commands
+PLAYER_DEAD = 0x01
+PLAYER_DEAD_VOTE_USED = 0x02
+PLAYER_NOMINATED = 0x04
+PLAYER_VOTED_YES = 0x08
+PLAYER_VOTED_NO = 0x10
+
+
+class Command():
+    def __init__(self, name, word, opcode):
+        self.name = name
+        self.word = word
+        self.opcode = opcode
+
+
+COMMANDS = [
+    Command("START", "start", 0x01),
+    Command("DAY", "day", 0x02),
+    Command("NIGHT", "night", 0x03),
+    Command("OFF", "off", 0x04),
+    Command("PRE_REVEAL", "prerev", 0x05),
+    Command("START_CONFIG", "sconfig", 0x06),
+    Command("NEXT_DEVICE", "ndevice", 0x07),
+    Command("SET_DEVICE", "sdevice", 0x08),
+    Command("END_CONFIG", "econfig", 0x09),
+    Command("START_KILL", "skill", 0x0A),
+    Command("END_KILL", "ekill", 0x0B),
+    Command("START_REVIVE", "srevive", 0x0C),
+    Command("END_REVIVE", "erevive", 0x0D),
+    Command("DEAD", "dead", 0x0E),
+    Command("DEAD_VOTE_USED", "dvote", 0x0F),
+    Command("ALIVE", "alive", 0x10),
+    Command("REVIVE_PLAYER", "revive", 0x11),
+
+    Command("NEXT_PLAYER", "nplayer", 0x12),
+    Command("PREVIOUS_PLAYER", "pplayer", 0x13),
+    Command("SET_PLAYER", "splayer", 0x14),
+
+    Command("START_NOMINATION_CONFIG", "snomcon", 0x15),
+    Command("START_NOMINATIONS", "snomin", 0x16),
+    Command("END_NOMINATIONS", "enomin", 0x17),
+    Command("VOTE_YES", "vyes", 0x18),
+    Command("VOTE_NO", "vno", 0x19),
+    Command("VOTE_SKIP", "vskip", 0x1A),
+
+    Command("END_GAME", "endgame", 0x1B),
+    Command("GOOD_WINS", "goodwins", 0x1C),
+    Command("EVIL_WINS", "evilwins", 0x1D),
+
+    # Only sent between the sketches, or used for debugging
+    Command("RED", "red", 0x1E),
+    Command("BLUE", "blue", 0x1F),
+    Command("GREEN", "green", 0x20),
+    Command("NOMINATIONS", "noms", 0x21),
+    Command("FORCE_DEAD", "forced", 0x22),
+    Command("FORCE_REVIVE", "forcer", 0x23),
+    Command("PREPARE_FOR_NOMINATIONS", "pnomin", 0x24),
+    Command("CURRENT_PLAYER", "cur", 0x25),
+    Command("SEQUENCE_RESET", "seqreset", 0x26),
+
+    # "pstate,<entry>,<entry>,..." where each entry is (player << 8) | PLAYER_* flags: the full status of several players at once
+    Command("PLAYER_STATES", "pstate", 0x27),
+
+    # "btn,<n>": printed by the Sender when the Bluetooth board forwards a button press (1-4) to it over ESP-NOW
+    Command("BUTTON", "btn", 0x28),
+
+    # "tally,<(yes << 8) | threshold>": the running vote count of the current nomination, shown on the Bluetooth board
+    Command("TALLY", "tally", 0x29),
+
+    # "cfgmap,<device>,<device>,...": the device (index into the Sender's MAC addresses) of each seat in turn, replacing
+    # the whole mapping built by the sconfig/sdevice/ndevice menu in one command
+    Command("CONFIG_MAP", "cfgmap", 0x2A),
+    # "cfgok,<seats>,<crc8 of the seats' devices>": printed by the Sender once it has applied a "cfgmap", to check it against
+    Command("CONFIG_APPLIED", "cfgok", 0x2B),
+
+    # "cdown,<seconds left>": the phase's countdown, shown on the Bluetooth board; "cdown" on its own clears it
+    Command("COUNTDOWN", "cdown", 0x2C),
+]
+
+BY_NAME = {command.name: command for command in COMMANDS}
+BY_WORD = {command.word: command for command in COMMANDS}
+BY_OPCODE = {command.opcode: command for command in COMMANDS}
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _crc8_table():
+    table = []
+    for crc in range(256):
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+# The CRC of every byte, so each byte of a frame costs one lookup rather than eight shifts
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """
+    CRC-8 (polynomial 0x07), matching botcCrc8 in botc_protocol.h.
+    """
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode(command, seq=None):
+    """
+    Encodes a text command such as "splayer,3" into a binary frame, optionally carrying a sequence number.
+    """
+    word, _, arg = command.partition(",")
+    try:
+        opcode = BY_WORD[word].opcode
+    except KeyError:
+        raise FrameError(f"Unknown command '{word}'") from None
+
+    try:
+        arg = NO_ARG if arg == "" else int(arg)
+    except ValueError:
+        raise FrameError(f"Argument '{arg}' does not fit in a frame") from None
+    if not 0 <= arg <= NO_ARG:
+        raise FrameError(f"Argument {arg} does not fit in a frame")
+
+    if seq is not None:
+        opcode |= FRAME_SEQUENCED
+
+    body = bytes((opcode, seq or 0, arg & 0xFF, arg >> 8))
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def decode(frame):
+    """
+    Decodes a binary frame back into (text command, seq), where seq is None for unsequenced frames.
+    """
+    if len(frame) != FRAME_SIZE or frame[0] != FRAME_SYNC:
+        raise FrameError(f"Not a frame: {frame!r}")
+
+    body = frame[1:5]
+    if crc8(body) != frame[5]:
+        raise FrameError(f"Checksum mismatch: {frame!r}")
+
+    opcode, seq, arg = body[0], body[1], body[2] | (body[3] << 8)
+    try:
+        command = BY_OPCODE[opcode & ~FRAME_SEQUENCED].word
+    except KeyError:
+        raise FrameError(f"Unknown opcode 0x{opcode:02X}") from None
+
+    if arg != NO_ARG:
+        command = f"{command},{arg}"
+
+    return command, (seq if opcode & FRAME_SEQUENCED else None)
+
+
+def pack_player_states(states):
+    """
+    Packs (player, flags) pairs into a single "pstate" command. A single player also fits in a binary frame.
+    """
+    return ",".join([BY_NAME["PLAYER_STATES"].word] + [str((player << 8) | flags) for player, flags in states])
+
+
+def unpack_player_states(command):
+    _, _, entries = command.partition(",")
+    return [(int(entry) >> 8, int(entry) & 0xFF) for entry in entries.split(",") if entry]
+
+
+def pack_config_map(devices):
+    """
+    Packs the device of each seat, in seat order, into a single "cfgmap" command. A single seat also fits in a binary frame.
+    """
+    return ",".join([BY_NAME["CONFIG_MAP"].word] + [str(device) for device in devices])
+
+
+def unpack_config_map(command):
+    _, _, entries = command.partition(",")
+    return [int(entry) for entry in entries.split(",") if entry]
+
+
+def config_applied_reply(devices):
+    """
+    The "cfgok" line the Sender prints after applying a "cfgmap" for these devices.
+    """
+    return f"{BY_NAME['CONFIG_APPLIED'].word},{len(devices)},{crc8(bytes(devices))}"
+
+
+def generate_header():
+    """
+    Generates botc_protocol.h, the C++ side of COMMANDS for the sketches.
+    """
+    opcodes = "\n".join(f"  BOTC_OP_{command.name} = 0x{command.opcode:02X}," for command in COMMANDS)
+    max_opcode = max(command.opcode for command in COMMANDS)
+    words = []
+    for op in range(max_opcode + 1):
+        word = f'"{BY_OPCODE[op].word}"' if op in BY_OPCODE else "nullptr"
+        words.append(f"  {word},  // 0x{op:02X}")
+    words = "\n".join(words)
+
+    return f"""// Generated by Arduino/protocol.py from its COMMANDS table; do not edit by hand.
+// Regenerate with: python -m Arduino.protocol
+#pragma once
+
+#include <Arduino.h>
+#include <string.h>
+
+#define BOTC_FRAME_SYNC 0x{FRAME_SYNC:02X}
+#define BOTC_FRAME_SIZE {FRAME_SIZE}
+#define BOTC_FRAME_SEQUENCED 0x{FRAME_SEQUENCED:02X}
+#define BOTC_NO_ARG 0x{NO_ARG:04X}
+
+#define BOTC_PLAYER_DEAD 0x{PLAYER_DEAD:02X}
+#define BOTC_PLAYER_DEAD_VOTE_USED 0x{PLAYER_DEAD_VOTE_USED:02X}
+#define BOTC_PLAYER_NOMINATED 0x{PLAYER_NOMINATED:02X}
+#define BOTC_PLAYER_VOTED_YES 0x{PLAYER_VOTED_YES:02X}
+#define BOTC_PLAYER_VOTED_NO 0x{PLAYER_VOTED_NO:02X}
+
+enum BotcOpcode : uint8_t {{
+  BOTC_OP_NONE = 0x00,
+{opcodes}
+}};
+
+#define BOTC_MAX_OPCODE 0x{max_opcode:02X}
+
+// Command word for each opcode, indexed by opcode
+static const char *const BOTC_COMMAND_WORDS[BOTC_MAX_OPCODE + 1] = {{
+{words}
+}};
+
+inline uint8_t botcCrc8(const uint8_t *data, size_t len) {{
+  uint8_t crc = 0;
+  for (size_t i = 0; i < len; i++) {{
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {{
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }}
+  }}
+  return crc;
+}}
+
+// Looks up the opcode for a command word (without any ",arg" suffix). Returns BOTC_OP_NONE if unknown.
+inline uint8_t botcOpcodeFor(const char *word, size_t len) {{
+  for (uint8_t op = 1; op <= BOTC_MAX_OPCODE; op++) {{
+    const char *candidate = BOTC_COMMAND_WORDS[op];
+    if (candidate != nullptr && strlen(candidate) == len && strncmp(candidate, word, len) == 0) {{
+      return op;
+    }}
+  }}
+  return BOTC_OP_NONE;
+}}
+
+struct BotcFrame {{
+  uint8_t opcode;  // without the BOTC_FRAME_SEQUENCED flag
+  bool sequenced;
+  uint8_t seq;
+  uint16_t arg;  // BOTC_NO_ARG if the command has no argument
+}};
+
+// Decodes a BOTC_FRAME_SIZE-byte frame. Returns false if the sync byte, checksum or opcode is invalid.
+inline bool botcDecodeFrame(const uint8_t *frame, BotcFrame &out) {{
+  if (frame[0] != BOTC_FRAME_SYNC || botcCrc8(frame + 1, 4) != frame[5]) {{
+    return false;
+  }}
+  out.opcode = frame[1] & ~BOTC_FRAME_SEQUENCED;
+  out.sequenced = (frame[1] & BOTC_FRAME_SEQUENCED) != 0;
+  out.seq = frame[2];
+  out.arg = frame[3] | (frame[4] << 8);
+  return out.opcode != BOTC_OP_NONE && out.opcode <= BOTC_MAX_OPCODE && BOTC_COMMAND_WORDS[out.opcode] != nullptr;
+}}
+
+// Parses a text command such as "splayer,3" into a frame, so text and binary commands share one dispatcher.
+inline bool botcParseText(const char *text, BotcFrame &out) {{
+  const char *separator = strchr(text, ',');
+  size_t len = separator ? (size_t)(separator - text) : strlen(text);
+  out.opcode = botcOpcodeFor(text, len);
+  out.sequenced = false;
+  out.seq = 0;
+  out.arg = separator ? (uint16_t)atoi(separator + 1) : BOTC_NO_ARG;
+  return out.opcode != BOTC_OP_NONE;
+}}
+"""
+
+
+SKETCH_DIRECTORIES = ["Arduino-Receiver", "Arduino-Sender", "Arduino-Bluetooth"]
+
+
+def write_headers():
+    header = generate_header()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for directory in SKETCH_DIRECTORIES:
+        path = os.path.join(root, directory, "botc_protocol.h")
+        with open(path, "w", newline="\n") as f:
+            f.write(header)
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    write_headers()
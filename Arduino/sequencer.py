@@ -0,0 +1,137 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+SEQUENCE_SPACE = 256
+RESET_COMMAND = "seqreset"
+
+
+class CommandSequencer():
+    """
+    Sends commands to the bridge tagged with a sequence number, keeping up to "window" of them in flight until it replies "ack <seq>".
+    The bridge only runs commands in sequence order, so an ack covers every earlier command too; anything left unacknowledged
+    for "ack_timeout" seconds is retransmitted along with everything sent after it (go-back-N).
+    """
+    def __init__(self, write, window=4, ack_timeout=0.5, max_retries=3):
+        # Called as write(command, seq); seq is None for the reset command
+        self._write = write
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+
+        self.retransmits = 0
+        self.failed = set()
+
+        self._next_seq = 0
+        self._in_flight = OrderedDict()
+        self._condition = threading.Condition()
+        self._running = True
+
+        threading.Thread(target=self._retransmit_loop, daemon=True, name="command_sequencer").start()
+
+    def reset(self):
+        """
+        Restarts the sequence at zero; the bridge must be sent RESET_COMMAND at the same time.
+        """
+        with self._condition:
+            self._next_seq = 0
+            self._in_flight.clear()
+            self._condition.notify_all()
+
+    @property
+    def next_seq(self):
+        """
+        The sequence number the next command sent will get.
+        """
+        with self._condition:
+            return self._next_seq
+
+    def send(self, command, timeout=5.0):
+        """
+        Sends a command, first waiting (up to "timeout") for a free slot in the window. Returns its sequence number.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._in_flight) < self.window, timeout=timeout):
+                raise TimeoutError(f"No free slot to send '{command}': {len(self._in_flight)} commands still unacknowledged")
+
+            seq = self._next_seq
+            self._next_seq = (self._next_seq + 1) % SEQUENCE_SPACE
+            self.failed.discard(seq)
+            self._in_flight[seq] = [command, time.monotonic(), 0]
+
+            # Written while holding the lock so commands reach the port in sequence order
+            self._write(command, seq)
+            # Wake the retransmit loop, which sleeps while nothing is in flight
+            self._condition.notify_all()
+
+        return seq
+
+    def wait(self, seq, timeout=None):
+        """
+        Waits until "seq" is acknowledged. Returns False if it timed out or was given up on.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: seq not in self._in_flight, timeout=timeout)
+            return seq not in self._in_flight and seq not in self.failed
+
+    def flush(self, timeout=None):
+        """
+        Waits until every command sent so far has been acknowledged.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._in_flight, timeout=timeout)
+
+    def on_line(self, line):
+        if not line.text.startswith("ack "):
+            return
+
+        try:
+            seq = int(line.text[4:])
+        except ValueError:
+            return
+
+        with self._condition:
+            if seq not in self._in_flight:
+                return
+
+            # Acks are cumulative: everything sent before "seq" has run as well
+            while self._in_flight:
+                acked, _ = self._in_flight.popitem(last=False)
+                if acked == seq:
+                    break
+            self._condition.notify_all()
+
+    def _retransmit_loop(self):
+        with self._condition:
+            while self._running:
+                if not self._in_flight:
+                    self._condition.wait()
+                    continue
+
+                seq, (command, sent_at, retries) = next(iter(self._in_flight.items()))
+                overdue = time.monotonic() - sent_at - self.ack_timeout
+                if overdue < 0:
+                    self._condition.wait(-overdue)
+                    continue
+
+                if retries >= self.max_retries:
+                    print(f"[ARDUINO] Giving up on '{command}' (seq {seq}) after {retries} retransmits, resynchronising")
+                    self.failed.update(self._in_flight)
+                    self._in_flight.clear()
+                    self._next_seq = 0
+                    self._write(RESET_COMMAND)
+                    self._condition.notify_all()
+                    continue
+
+                now = time.monotonic()
+                for pending_seq, pending in self._in_flight.items():
+                    pending[1] = now
+                    pending[2] += 1
+                    self._write(pending[0], pending_seq)
+                    self.retransmits += 1
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
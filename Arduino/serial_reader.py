@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+
+class SerialLine():
+    def __init__(self, index, text, received):
+        self.index = index
+        self.text = text
+        self.received = received
+
+    def __repr__(self):
+        return f"SerialLine({self.index}, {self.text!r})"
+
+
+class SerialReader():
+    """
+    Keeps a serial port drained on a background thread, splitting what arrives into lines.
+    Every line is put on the "events" queue, and callers can wait for a specific reply with a timeout instead of sleeping.
+    Echoed lines are tagged with "label", if given, to tell several bridges apart.
+    """
+    def __init__(self, port, history=256, echo=True, label=None):
+        self.port = port
+        self.history = history
+        self.echo = echo
+        self.prefix = "[ARDUINO]" if label is None else f"[ARDUINO {label}]"
+        self.events = queue.Queue(maxsize=1024)
+
+        self._listeners = []
+        self._lines = []
+        self._count = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, daemon=True, name="serial_reader")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def add_listener(self, callback):
+        """
+        Calls "callback" with every SerialLine as soon as it is read. Callbacks run on the reader thread, so must not block.
+        """
+        self._listeners.append(callback)
+
+    def mark(self):
+        """
+        Returns a marker for "now"; pass it to wait_for to only match lines received afterwards.
+        """
+        with self._condition:
+            return self._count
+
+    def wait_for(self, match, timeout=0.5, since=None):
+        """
+        Waits until a line matching "match" (an exact string, or a callable taking the line text) is received after "since".
+        Returns the matching SerialLine, or None if the timeout passed first.
+        """
+        if isinstance(match, str):
+            expected = match
+            match = lambda text: text == expected
+
+        end = time.monotonic() + timeout
+        with self._condition:
+            index = self._count if since is None else since
+            while True:
+                # Only the most recent lines are kept, so skip ahead if we have fallen behind
+                first = self._count - len(self._lines)
+                for line in self._lines[max(index - first, 0):]:
+                    if match(line.text):
+                        return line
+                index = self._count
+
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _read_loop(self):
+        buffer = b""
+        while self._running:
+            try:
+                chunk = self.port.read(self.port.in_waiting or 1)
+            except Exception as e:
+                print(f"[ARDUINO] Serial read failed: {e}")
+                self._running = False
+                break
+
+            if not chunk:
+                continue
+
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for raw in lines:
+                self._on_line(raw.decode("utf-8", errors="replace").rstrip())
+
+    def _on_line(self, text):
+        if self.echo:
+            print(f"{self.prefix} {text}")
+
+        with self._condition:
+            line = SerialLine(self._count, text, time.monotonic())
+            self._count += 1
+            self._lines.append(line)
+            if len(self._lines) > self.history:
+                del self._lines[0]
+            self._condition.notify_all()
+
+        for callback in self._listeners:
+            callback(line)
+
+        # Nobody may be consuming events, so drop the oldest rather than growing without bound
+        try:
+            self.events.put_nowait(line)
+        except queue.Full:
+            self.events.get_nowait()
+            self.events.put_nowait(line)
@@ -1,17 +1,57 @@
 import json
+import os
 
 from pprint import pp as pprint
 from HomeAssistant.homeassistant_api import HomeAssistantAPI
-from consts import EDITION_COLOURS, HA_SCRIPT_NAMES
+from HomeAssistant.homeassistant_ws import HomeAssistantWebSocket, HomeAssistantWebSocketError
+from HomeAssistant.state_cache import ScriptStateCache
+from util.tracing import tracer
+from consts import EDITION_COLOURS, HA_SCRIPT_NAMES, HA_SCRIPT_STATES, PREWARM_TIMEOUT
 
 class HomeAssistantController():
-    def __init__(self):
+    # The scripts each method run by the scenes triggers, so the next phase's scripts can be checked before it starts
+    SCRIPTS_BY_METHOD = {
+        "trigger_gong": [HA_SCRIPT_NAMES["CHURCH_BELLS"]],
+        "stop_all_alexa": [HA_SCRIPT_NAMES["STOP_ALL_ALEXA"]],
+        "turn_on_lights": [HA_SCRIPT_NAMES["TURN_ON"], HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"]],
+        "turn_off_lights": [HA_SCRIPT_NAMES["TURN_OFF"], HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"]],
+        "turn_on_mood_light": [HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"]],
+        "turn_off_mood_light": [HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"]],
+        "set_good_wins": [HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"]],
+        "set_evil_wins": [HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"]]
+    }
+    # Methods that play something on the speakers
+    MEDIA_METHODS = {"trigger_gong"}
+    
+    def __init__(self, use_websocket=None):
         self.api = HomeAssistantAPI()
         self.mood_light_data = {**EDITION_COLOURS["TROUBLE_BREWING"], "brightness": 100}
         
-    def _trigger_script(self, script_entity_id, data=None):
-        url = f"/api/services/script/turn_on"
+        # Optionally keep a WebSocket open for the whole session; REST is used whenever it is unavailable
+        if use_websocket is None:
+            use_websocket = os.getenv("HA_WEBSOCKET", "").lower() in ("1", "true", "yes")
+        
+        self.ws = None
+        if use_websocket:
+            self.ws = HomeAssistantWebSocket(base_url=self.api.base_url, token=self.api.token)
+            self.ws.connect_in_background()
         
+        # Skip light scripts whose target state is already in place
+        self.state_cache = ScriptStateCache(
+            self.api,
+            entities={
+                "room_lights": os.getenv("HA_ROOM_LIGHT_ENTITY"),
+                "mood_light": os.getenv("HA_MOOD_LIGHT_ENTITY")
+            },
+            ttl=float(os.getenv("HA_STATE_CACHE_TTL", "300"))
+        )
+        
+        # Optionally run before a phase that plays something, to wake the speakers so it starts on time
+        self.stage_media_script = os.getenv("HA_STAGE_MEDIA_SCRIPT") or None
+        # Scripts Home Assistant does not know about, as found by prewarm()
+        self.missing_scripts = set()
+            
+    def _script_payload(self, script_entity_id, data=None):
         payload = {
             "entity_id": script_entity_id,
             "variables": {}
@@ -22,10 +62,136 @@ class HomeAssistantController():
             payload["variables"] = data
             
         print(payload)
+        return payload
+        
+    def _trigger_script(self, script_entity_id, data=None, force=False):
+        return self._trigger_scripts([(script_entity_id, data)], force=force)[0]
+    
+    def _trigger_scripts(self, scripts, force=False):
+        """
+        Triggers each (script_entity_id, data) pair in order. Over the WebSocket all calls are sent before waiting on any reply;
+        over REST they are sent one after another.
+        Scripts that would not change the state of their lights are skipped (their response is None), unless "force" is set.
+        """
+        to_send = []
+        for index, (script_entity_id, data) in enumerate(scripts):
+            if not force and self.state_cache.is_current(script_entity_id, data):
+                print(f"Skipping {script_entity_id}, lights are already in that state")
+                continue
+            
+            # Recorded now so that later scripts in the same batch see its effect on overlapping groups
+            self.state_cache.record(script_entity_id, data)
+            to_send.append(index)
+        
+        try:
+            with tracer.span(
+                "trigger_scripts", kind="homeassistant",
+                scripts=[scripts[index][0] for index in to_send], skipped=len(scripts) - len(to_send),
+                transport="websocket" if self.ws is not None and self.ws.connected else "rest"
+            ):
+                responses = self._send_scripts([scripts[index] for index in to_send])
+        except Exception:
+            # We no longer know what state these lights are in
+            for index in to_send:
+                self.state_cache.invalidate(scripts[index][0])
+            raise
+        
+        results = [None] * len(scripts)
+        for index, response in zip(to_send, responses):
+            results[index] = response
+        return results
+    
+    def _send_scripts(self, scripts):
+        if not scripts:
+            return []
+        
+        payloads = [self._script_payload(script_entity_id, data) for script_entity_id, data in scripts]
+        
+        # Scripts that put lights into a known state can safely be sent twice; others (like the bells) cannot
+        repeatable = [script_entity_id in HA_SCRIPT_STATES for script_entity_id, _ in scripts]
+        responses = [None] * len(scripts)
+        unsent = list(range(len(scripts)))
+        errors = []
+        
+        if self.ws is not None and self.ws.connected:
+            futures = {}
+            for index, payload in enumerate(payloads):
+                try:
+                    futures[index] = self.ws.call_service("script", "turn_on", payload)
+                except HomeAssistantWebSocketError as e:
+                    print(f"[HA WEBSOCKET] {e}, falling back to REST")
+                    break
+            
+            unsent = [index for index in unsent if index not in futures]
+            for index, outcome in zip(futures, self.ws.results(futures.values())):
+                if not isinstance(outcome, Exception):
+                    responses[index] = outcome
+                elif isinstance(outcome, HomeAssistantWebSocketError) and repeatable[index]:
+                    # It may have run before the reply was lost, but running it again does no harm
+                    print(f"[HA WEBSOCKET] {outcome}, falling back to REST for {scripts[index][0]}")
+                    unsent.append(index)
+                else:
+                    errors.append(outcome)
+            unsent.sort()
+            pprint([responses[index] for index in futures])
+        
+        url = f"/api/services/script/turn_on"
         
-        response = self.api.post(url, data=payload)
-        pprint(response)
-        return response
+        for index in unsent:
+            responses[index] = self.api.post(url, data=payloads[index], retry=repeatable[index])
+            pprint(responses[index])
+        
+        if errors:
+            raise errors[0]
+        return responses
+
+    def call_service(self, domain, service, data, retry=False):
+        """
+        Calls any Home Assistant service, over the WebSocket when it is connected. Set "retry" if the call is safe to repeat.
+        A call sent over the WebSocket whose reply is lost is only repeated over REST if "retry" is set, as it may have run.
+        """
+        if self.ws is not None and self.ws.connected:
+            try:
+                future = self.ws.call_service(domain, service, data)
+            except HomeAssistantWebSocketError as e:
+                print(f"[HA WEBSOCKET] {e}, falling back to REST")
+            else:
+                outcome = self.ws.results([future])[0]
+                if not isinstance(outcome, Exception):
+                    return outcome
+                if not retry or not isinstance(outcome, HomeAssistantWebSocketError):
+                    raise outcome
+                print(f"[HA WEBSOCKET] {outcome}, falling back to REST")
+        
+        return self.api.post(f"/api/services/{domain}/{service}", data=data, retry=retry)
+    
+    def get_state(self, entity_id):
+        return self.api.get(f"/api/states/{entity_id}")
+    
+    def prewarm(self, methods):
+        """
+        Gets ready for calls to these methods: opens (or refreshes) the connection, checks that the scripts they trigger
+        exist, and runs HA_STAGE_MEDIA_SCRIPT if one of them plays something.
+        """
+        self.keep_alive()
+        # Anything else would go through the circuit breaker, and could take the probe the next transition is due
+        if self.api.breaker.degraded:
+            return
+        
+        scripts = {script for method in methods for script in self.SCRIPTS_BY_METHOD.get(method, [])}
+        for script in sorted(scripts):
+            if self.api.status(f"/api/states/{script}", timeout=PREWARM_TIMEOUT) == 404:
+                if script not in self.missing_scripts:
+                    print(f"[HA] {script} does not exist in Home Assistant; the next phase will not be able to run it")
+                self.missing_scripts.add(script)
+            else:
+                self.missing_scripts.discard(script)
+        
+        if self.stage_media_script is not None and self.MEDIA_METHODS.intersection(methods):
+            self.call_service("script", "turn_on", {"entity_id": self.stage_media_script})
+    
+    def keep_alive(self):
+        self.api.status("/api/", timeout=PREWARM_TIMEOUT)
 
     def trigger_gong(self):
         song_name = "Chuch Bells Version 2 by Digiffects Sound Effects Library"
@@ -41,22 +207,32 @@ class HomeAssistantController():
     def stop_all_alexa(self):
         self._trigger_script(HA_SCRIPT_NAMES["STOP_ALL_ALEXA"])
         
-    def turn_on_lights(self):
+    def turn_on_lights(self, force=False):
         data = {
             "brightness": 40
         }
-        self._trigger_script(HA_SCRIPT_NAMES["TURN_ON"], data=data)
-        self.turn_on_mood_light()
+        self._trigger_scripts([
+            (HA_SCRIPT_NAMES["TURN_ON"], data),
+            (HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"], self.mood_light_data)
+        ], force=force)
         
-    def turn_off_lights(self):
-        self._trigger_script(HA_SCRIPT_NAMES["TURN_OFF"])
-        self.turn_off_mood_light()
+    def turn_off_lights(self, force=False):
+        self._trigger_scripts([
+            (HA_SCRIPT_NAMES["TURN_OFF"], None),
+            (HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"], None)
+        ], force=force)
         
-    def turn_on_mood_light(self):
-        self._trigger_script(HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"], data=self.mood_light_data)
+    def turn_on_mood_light(self, force=False):
+        self._trigger_script(HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"], data=self.mood_light_data, force=force)
     
-    def turn_off_mood_light(self):
-        self._trigger_script(HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"])
+    def turn_off_mood_light(self, force=False):
+        self._trigger_script(HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"], force=force)
+        
+    def forget_light_states(self):
+        """
+        Forgets every cached light state, e.g. after the lights were changed by hand, so the next scripts are always sent.
+        """
+        self.state_cache.invalidate()
         
     def set_mood_light_data(self, data):
         """
@@ -68,6 +244,14 @@ class HomeAssistantController():
             
         self.mood_light_data = data
         
+    def set_edition_colours(self, edition):
+        """
+        Sets the mood lighting to an edition's colour from EDITION_COLOURS, e.g. "TROUBLE_BREWING".
+        """
+        if edition not in EDITION_COLOURS:
+            raise ValueError(f"Unknown edition '{edition}' (expected one of {', '.join(EDITION_COLOURS)})")
+        self.set_mood_light_data(dict(EDITION_COLOURS[edition]))
+        
     def set_mood_light_data_individual(self, r, g, b, brightness):
         self.mood_light_data = {
             "r": r,
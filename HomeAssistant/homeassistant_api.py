@@ -1,7 +1,15 @@
 import os
 
-from util.auth_requests import AuthRequests
+from consts import BACKEND_BUDGET, BACKEND_RETRIES, BACKEND_TIMEOUT, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+from util.auth_requests import AuthRequests, CircuitBreaker
     
 class HomeAssistantAPI(AuthRequests):
     def __init__(self):
-        super().__init__(base_url=os.getenv("HA_URL"), token=os.getenv("HA_TOKEN"))
\ No newline at end of file
+        super().__init__(
+            base_url=os.getenv("HA_URL"),
+            token=os.getenv("HA_TOKEN"),
+            timeout=float(os.getenv("HA_TIMEOUT") or BACKEND_TIMEOUT),
+            budget=float(os.getenv("HA_BUDGET") or BACKEND_BUDGET),
+            retries=int(os.getenv("HA_RETRIES") or BACKEND_RETRIES),
+            breaker=CircuitBreaker("homeassistant", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        )
\ No newline at end of file
@@ -0,0 +1,258 @@
+import json
+import threading
+import time
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from util.tracing import tracer
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+class HomeAssistantWebSocketError(Exception):
+    """
+    Raised when a call cannot be completed because the WebSocket connection is unavailable or was lost.
+    """
+
+
+class HomeAssistantServiceError(Exception):
+    """
+    Raised when Home Assistant answers a service call with an error.
+    """
+
+
+class HomeAssistantWebSocket():
+    """
+    Keeps a single authenticated connection to the Home Assistant WebSocket API open for the whole session.
+    Service calls are pipelined: each is sent straight away with its own message ID, and the replies are matched up as they arrive.
+    A connection that has been silent for "ping_interval" seconds is pinged, and dropped if the ping goes unanswered as long again.
+    """
+    def __init__(self, base_url, token, timeout=5, reconnect_delay=1, max_reconnect_delay=30, ping_interval=30):
+        if websocket is None:
+            raise ImportError("websocket-client is required for the Home Assistant WebSocket transport")
+
+        self.url = base_url.replace("http", "ws", 1).rstrip("/") + "/api/websocket"
+        self.token = token
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ping_interval = ping_interval
+
+        self._ws = None
+        self._next_id = 1
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closing = False
+        self._reconnecting = False
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def connect(self):
+        """
+        Opens the connection and authenticates, raising HomeAssistantWebSocketError if either fails.
+        """
+        ws = None
+        try:
+            ws = websocket.create_connection(self.url, timeout=self.timeout, enable_multithread=True)
+            self._authenticate(ws)
+        except (OSError, ValueError, websocket.WebSocketException, HomeAssistantWebSocketError) as e:
+            if ws is not None:
+                ws.close()
+            if isinstance(e, HomeAssistantWebSocketError):
+                raise
+            raise HomeAssistantWebSocketError(f"Could not connect to {self.url}: {e}") from e
+
+        # The reader wakes up after this long without a message to check the connection is still alive
+        ws.settimeout(self.ping_interval)
+
+        with self._lock:
+            self._ws = ws
+            # Message IDs must increase for the lifetime of a connection, so restart them for each new one
+            self._next_id = 1
+            self._connected.set()
+
+        threading.Thread(target=self._read_loop, args=(ws,), daemon=True, name="ha_websocket").start()
+
+    def connect_in_background(self):
+        """
+        Connects without blocking the caller, retrying until the connection succeeds.
+        """
+        self._schedule_reconnect()
+
+    def _authenticate(self, ws):
+        message = json.loads(ws.recv())
+        if message.get("type") != "auth_required":
+            raise HomeAssistantWebSocketError(f"Unexpected greeting from Home Assistant: {message}")
+
+        ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+
+        message = json.loads(ws.recv())
+        if message.get("type") != "auth_ok":
+            raise HomeAssistantWebSocketError(f"Home Assistant rejected the access token: {message.get('message')}")
+
+    def call_service(self, domain, service, service_data=None):
+        """
+        Sends a call_service message and returns a Future for its result, without waiting for the reply.
+        """
+        future = Future()
+
+        with self._lock:
+            if not self._connected.is_set():
+                raise HomeAssistantWebSocketError("Not connected to Home Assistant")
+
+            message_id = self._next_id
+            self._next_id += 1
+            self._pending[message_id] = future
+            future.message_id = message_id
+
+            message = {
+                "id": message_id,
+                "type": "call_service",
+                "domain": domain,
+                "service": service,
+                "service_data": service_data or {}
+            }
+
+            encoded = json.dumps(message)
+            sent_at = time.monotonic()
+            try:
+                self._ws.send(encoded)
+            except (OSError, websocket.WebSocketException) as e:
+                del self._pending[message_id]
+                raise HomeAssistantWebSocketError(f"Failed to send to Home Assistant: {e}") from e
+
+        # The reply arrives on the reader thread, so the span is recorded against the caller's span from there
+        parent = tracer.current()
+        future.add_done_callback(lambda f: tracer.record(
+            f"{domain}.{service}", "websocket", sent_at, parent=parent,
+            error=repr(f.exception()) if f.exception() else None,
+            message_id=message_id, bytes_sent=len(encoded)
+        ))
+        return future
+
+    def results(self, futures, timeout=None):
+        """
+        Waits up to "timeout" seconds in all (the connection's own timeout by default) for the replies to calls made with
+        call_service, returning each call's result or the exception it failed with, in order.
+        Calls still unanswered are given up on and fail with HomeAssistantWebSocketError, though Home Assistant may yet run them.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                with self._lock:
+                    abandoned = self._pending.pop(future.message_id, None) is future
+
+                if abandoned:
+                    error = HomeAssistantWebSocketError(f"No reply from Home Assistant within {timeout}s")
+                    future.set_exception(error)
+                    outcomes.append(error)
+                    continue
+
+                # The reply was being handed over just as we gave up on it
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def _ping(self, ws):
+        with self._lock:
+            if self._ws is not ws:
+                return
+            message_id = self._next_id
+            self._next_id += 1
+
+        ws.send(json.dumps({"id": message_id, "type": "ping"}))
+
+    def _read_loop(self, ws):
+        pinged = False
+        try:
+            while True:
+                try:
+                    message = json.loads(ws.recv())
+                except websocket.WebSocketTimeoutException:
+                    if pinged:
+                        raise HomeAssistantWebSocketError(f"No reply to a ping within {self.ping_interval}s")
+                    self._ping(ws)
+                    pinged = True
+                    continue
+
+                # Any message at all shows the connection is still alive
+                pinged = False
+                if message.get("type") != "result":
+                    continue
+
+                with self._lock:
+                    future = self._pending.pop(message.get("id"), None)
+
+                if future is None:
+                    continue
+
+                if message.get("success"):
+                    future.set_result(message.get("result"))
+                else:
+                    error = message.get("error", {})
+                    future.set_exception(HomeAssistantServiceError(f"{error.get('code')}: {error.get('message')}"))
+        except (OSError, ValueError, websocket.WebSocketException, HomeAssistantWebSocketError) as e:
+            self._on_disconnect(ws, e)
+            # A connection found to be half-open is still open as far as this end knows
+            ws.close()
+
+    def _on_disconnect(self, ws, reason):
+        with self._lock:
+            if self._ws is not ws:
+                return
+
+            self._connected.clear()
+            self._ws = None
+            pending, self._pending = self._pending, {}
+
+        for future in pending.values():
+            future.set_exception(HomeAssistantWebSocketError(f"Connection to Home Assistant lost: {reason}"))
+
+        if not self._closing:
+            print(f"[HA WEBSOCKET] Connection lost ({reason}), reconnecting...")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        with self._lock:
+            if self._reconnecting:
+                return
+            self._reconnecting = True
+
+        threading.Thread(target=self._reconnect_loop, daemon=True, name="ha_websocket_reconnect").start()
+
+    def _reconnect_loop(self):
+        delay = self.reconnect_delay
+        try:
+            while not self._closing and not self.connected:
+                try:
+                    self.connect()
+                    print("[HA WEBSOCKET] Connected to Home Assistant")
+                    return
+                except HomeAssistantWebSocketError as e:
+                    print(f"[HA WEBSOCKET] {e}, retrying in {delay}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            with self._lock:
+                self._reconnecting = False
+
+    def close(self):
+        self._closing = True
+        with self._lock:
+            ws = self._ws
+        if ws is not None:
+            ws.close()
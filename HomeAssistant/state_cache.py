@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+
+from consts import HA_SCRIPT_STATES, HA_GROUP_OVERLAPS
+
+class ScriptStateCache():
+    """
+    Remembers the last state the controller commanded for each group of lights, so scripts that would not change anything can be skipped.
+    Entries expire after "ttl" seconds. If an entity is configured for a group, an entry older than "verify_after" seconds is checked
+    against /api/states before it is trusted, so changes made outside the game are noticed.
+    It is shared by the transition pool and the prewarm threads, so every access to the entries is made under a lock.
+    """
+    def __init__(self, api, entities=None, ttl=300, verify_after=30):
+        self.api = api
+        self.entities = {group: entity for group, entity in (entities or {}).items() if entity}
+        self.ttl = ttl
+        self.verify_after = verify_after
+
+        self.hits = 0
+        self.misses = 0
+
+        # group -> (script_entity_id, variables as JSON, time recorded)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def is_current(self, script_entity_id, data=None):
+        """
+        Returns True (a hit) if running the script would leave its group in the state it is already in.
+        Scripts that are not in HA_SCRIPT_STATES are never cached.
+        """
+        if script_entity_id not in HA_SCRIPT_STATES:
+            return False
+
+        group, expected_state = HA_SCRIPT_STATES[script_entity_id]
+        with self._lock:
+            entry = self._entries.get(group)
+
+        current = (
+            entry is not None
+            and entry[0] == script_entity_id
+            and entry[1] == self._freeze(data)
+            and time.monotonic() - entry[2] < self.ttl
+        )
+
+        if current and group in self.entities and time.monotonic() - entry[2] >= self.verify_after:
+            current = self._verify(group, expected_state, entry)
+
+        with self._lock:
+            if current:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return current
+
+    def record(self, script_entity_id, data=None):
+        """
+        Records that a script has been run, invalidating any groups it overlaps with.
+        """
+        if script_entity_id not in HA_SCRIPT_STATES:
+            return
+
+        group, _ = HA_SCRIPT_STATES[script_entity_id]
+        with self._lock:
+            for overlapping in HA_GROUP_OVERLAPS.get(group, []):
+                self._entries.pop(overlapping, None)
+            self._entries[group] = (script_entity_id, self._freeze(data), time.monotonic())
+
+    def invalidate(self, script_entity_id=None):
+        """
+        Forgets the state of the script's group, or of every group if no script is given.
+        """
+        with self._lock:
+            if script_entity_id is None:
+                self._entries.clear()
+            elif script_entity_id in HA_SCRIPT_STATES:
+                self._entries.pop(HA_SCRIPT_STATES[script_entity_id][0], None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "groups": len(self._entries)}
+
+    def _verify(self, group, expected_state, entry):
+        # The lock is not held over the request; the entry is only updated if nothing has replaced it meanwhile
+        try:
+            state = self.api.get(f"/api/states/{self.entities[group]}").get("state")
+        except Exception as e:
+            print(f"Could not verify the state of {self.entities[group]}: {e}")
+            return False
+
+        with self._lock:
+            if self._entries.get(group) is not entry:
+                return False
+
+            if state != expected_state:
+                del self._entries[group]
+                return False
+
+            # Still as we left it, so trust the entry for a while longer
+            self._entries[group] = (entry[0], entry[1], time.monotonic())
+        return True
+
+    @staticmethod
+    def _freeze(data):
+        return json.dumps(data, sort_keys=True)
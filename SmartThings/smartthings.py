@@ -2,14 +2,19 @@ import os
 
 from pprint import pp as pprint
 from SmartThings.smartthings_api import SmartThingsAPI
+from consts import PREWARM_TIMEOUT
 
 class SmartThingsController():
     def __init__(self):
         self.api = SmartThingsAPI()
         self.location_id = os.getenv("ROOM_LOCATION_ID")
-        self.device_ids = os.getenv("ROOM_LIGHTS").split(",")
+        self.device_ids = [device_id for device_id in os.getenv("ROOM_LIGHTS", "").split(",") if device_id]
         
     def _execute_command(self, device_ids, capability, command, main="switch"):
+        if not device_ids:
+            print(f"No SmartThings devices configured (ROOM_LIGHTS), not sending '{command}'")
+            return None
+        
         to_execute = []
         for device_id in device_ids:
             to_execute.append({
@@ -25,10 +30,25 @@ class SmartThingsController():
                 }
             })
         
-        data = self.api.batch_post(to_execute)
-        pprint(data)
+        # Switching on or off is safe to repeat, so failed commands are retried
+        data = self.api.batch_post(to_execute, retry=True)
+        pprint(data.results)
+        
+        for device_id, error in zip(device_ids, data.errors):
+            if error is not None:
+                print(f"Failed to send '{command}' to device {device_id}: {error}")
         return data
         
+    def prewarm(self, methods):
+        self.keep_alive()
+        
+    def keep_alive(self):
+        """
+        Opens (or refreshes) the connection to SmartThings with a cheap request, so the next command does not wait for it.
+        """
+        if self.device_ids:
+            self.api.status(f"devices/{self.device_ids[0]}", timeout=PREWARM_TIMEOUT)
+        
     def turn_on_room_lights(self):
         self._execute_command(self.device_ids, "switch", "on")
         
@@ -1,9 +1,17 @@
 import os
 
-from util.auth_requests import AuthRequests
+from consts import BACKEND_BUDGET, BACKEND_RETRIES, BACKEND_TIMEOUT, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+from util.auth_requests import AuthRequests, CircuitBreaker
     
 class SmartThingsAPI(AuthRequests):
     ROOT_URL = "https://api.smartthings.com/v1/"
     
     def __init__(self):
-        super().__init__(base_url=self.ROOT_URL, token=os.getenv("PAT"))
\ No newline at end of file
+        super().__init__(
+            base_url=os.getenv("SMARTTHINGS_URL", self.ROOT_URL),
+            token=os.getenv("PAT"),
+            timeout=float(os.getenv("SMARTTHINGS_TIMEOUT") or BACKEND_TIMEOUT),
+            budget=float(os.getenv("SMARTTHINGS_BUDGET") or BACKEND_BUDGET),
+            retries=int(os.getenv("SMARTTHINGS_RETRIES") or BACKEND_RETRIES),
+            breaker=CircuitBreaker("smartthings", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        )
\ No newline at end of file
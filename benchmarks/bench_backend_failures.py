@@ -0,0 +1,140 @@
+"""
+Plays the scripted game of bench_game while the HTTP stand-in for Home Assistant and SmartThings fails in different ways,
+checking that no transition outlasts the transition deadline and that backends which keep failing are failed fast.
+
+One game per scenario, in order:
+  healthy     every request is answered
+  flaky       a fraction of requests is answered with a 500; safe calls are retried with jitter
+  down        every request is answered with a 500, until the circuit breakers open
+  stalled     every answer is held back for longer than the request timeout
+  recovered   answering again: after --reset-timeout the breakers let a probe through and close
+
+Steps that call a backend outside a transition plan (e.g. stopping the Alexas) are expected to fail while it is failing;
+their errors are reported, and only fail the run in the healthy and recovered scenarios.
+
+Run from the repository root with: python -m benchmarks.bench_backend_failures [--latency 0.02] [--flaky-rate 0.3]
+Exits with code 1 if a transition took longer than the deadline (plus --slack), a step failed while the backends were
+healthy, or a backend is still degraded at the end.
+"""
+import argparse
+import builtins
+import json
+import sys
+import time
+
+from benchmarks.bench_game import ScriptedInput, build_controller, play, summarise
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+from consts import TRANSITION_DEADLINE
+
+SCENARIOS = ["healthy", "flaky", "down", "stalled", "recovered"]
+
+
+def set_scenario(server, name, args):
+    server.error_rate = args.flaky_rate if name == "flaky" else 0.0
+    server.down = name == "down"
+    server.stall = args.stall if name == "stalled" else 0.0
+
+
+def run(args):
+    from util.tracing import tracer
+
+    rest_server = StubServer(latency=args.latency, seed=args.seed).start()
+    ws_server = HomeAssistantWebSocketStub(latency=args.latency).start()
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+
+    spans = []
+    tracer.add_listener(spans.append)
+
+    scripted_input = ScriptedInput()
+    original_input, original_print = builtins.input, builtins.print
+    builtins.input = scripted_input
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    results = {}
+    try:
+        botc = build_controller(args, rest_server, ws_server, device)
+        apis = [botc.homeassistant_controller.api, botc.smartthings_controller.api]
+        for api in apis:
+            api.breaker.reset_timeout = args.reset_timeout
+
+        for name in SCENARIOS:
+            set_scenario(rest_server, name, args)
+            if any(api.breaker.degraded for api in apis):
+                # Long enough for every open breaker to let a probe through, so each scenario starts by calling the backends
+                time.sleep(args.reset_timeout)
+
+            spans.clear()
+            requests_before, errors_before = rest_server.requests, rest_server.errors
+            rejected_before = sum(api.breaker.rejected for api in apis)
+            step_errors = []
+            start = time.perf_counter()
+            play(botc, scripted_input, step_errors)
+            botc.arduino_controller._await_response()
+            elapsed = time.perf_counter() - start
+
+            transitions = [span.duration for span in spans if span.kind in ("transition", "event")]
+            actions = [span for span in spans if span.kind == "action"]
+            results[name] = {
+                "elapsed_s": round(elapsed, 3),
+                "transitions": summarise(transitions),
+                "slowest_transition_ms": round(max(transitions) * 1000, 2),
+                "http_requests": rest_server.requests - requests_before,
+                "http_errors_injected": rest_server.errors - errors_before,
+                "calls_failed_fast": sum(api.breaker.rejected for api in apis) - rejected_before,
+                "actions_failed": sum(1 for span in actions if span.error and not span.error.startswith("CircuitOpenError")),
+                "actions_not_attempted": sum(1 for span in actions if span.error and span.error.startswith("CircuitOpenError")),
+                "step_errors": step_errors,
+                "degraded_after": botc.degraded_backends()
+            }
+    finally:
+        builtins.input, builtins.print = original_input, original_print
+        set_scenario(rest_server, "healthy", args)
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "config": {
+            "latency_s": args.latency,
+            "flaky_rate": args.flaky_rate,
+            "stall_s": args.stall,
+            "reset_timeout_s": args.reset_timeout,
+            "transition_deadline_s": TRANSITION_DEADLINE
+        },
+        "scenarios": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the HTTP and WebSocket stand-ins take to answer")
+    parser.add_argument("--flaky-rate", type=float, default=0.3, help="fraction of requests failed in the flaky scenario")
+    parser.add_argument("--stall", type=float, default=10.0, help="seconds answers are held back in the stalled scenario")
+    parser.add_argument("--reset-timeout", type=float, default=1.0, help="seconds an open circuit breaker waits before probing")
+    parser.add_argument("--slack", type=float, default=0.5, help="seconds a transition may run over the deadline")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = args.sequenced = args.binary = args.audio = False
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    scenarios = report["scenarios"].values()
+    if (
+        any(scenario["slowest_transition_ms"] > (TRANSITION_DEADLINE + args.slack) * 1000 for scenario in scenarios)
+        or any(report["scenarios"][name]["step_errors"] for name in ("healthy", "recovered"))
+        or report["scenarios"]["recovered"]["degraded_after"]
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
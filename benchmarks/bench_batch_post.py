@@ -0,0 +1,79 @@
+"""
+Compares the old thread-per-request AuthRequests.batch_post against the pooled client, using a local stub server.
+
+The pooled client sends at most max_workers (8) commands at once, over that many kept-alive connections; the old one
+opened a thread and a connection per command. Against a stand-in whose latency does not grow with load, sending
+everything at once wins, so batches of more than 8 commands are slower pooled (roughly one stand-in latency per 8
+commands). That is the trade-off being made: a real backend (SmartThings rate-limits per token) is not sent an
+unbounded burst, and a large batch cannot start an unbounded number of threads.
+
+Run from the repository root with: python -m benchmarks.bench_batch_post
+"""
+import threading
+import time
+
+from requests import Session
+
+from benchmarks.stub_server import StubServer
+from util.auth_requests import AuthRequests
+
+COMMAND_COUNTS = [5, 20, 100]
+ROUNDS = 5
+
+
+def legacy_batch_post(base_url, token, commands):
+    """
+    The previous implementation: one new thread per command, rebuilding the headers on each POST, with no timeout.
+    """
+    session = Session()
+    results = []
+
+    def post(url, data):
+        headers = {
+            "Authorization": "Bearer " + token,
+            "Content-Type": "application/json"
+        }
+        r = session.request("POST", base_url + url, headers=headers, json=data)
+        r.raise_for_status()
+        results.append(r.json())
+
+    threads = []
+    for command in commands:
+        thread = threading.Thread(target=post, args=(command['url'], command['data']))
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def time_rounds(func):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    server = StubServer(latency=0.02).start()
+    client = AuthRequests(base_url=server.url, token="benchmark")
+
+    print(f"{'commands':>8} | {'legacy best':>11} | {'legacy mean':>11} | {'pooled best':>11} | {'pooled mean':>11}")
+    for count in COMMAND_COUNTS:
+        commands = [{"url": f"/devices/{i}/commands", "data": {"commands": []}} for i in range(count)]
+
+        legacy_best, legacy_mean = time_rounds(lambda: legacy_batch_post(server.url, "benchmark", commands))
+        pooled_best, pooled_mean = time_rounds(lambda: client.batch_post(commands))
+
+        print(f"{count:>8} | {legacy_best:>10.3f}s | {legacy_mean:>10.3f}s | {pooled_best:>10.3f}s | {pooled_mean:>10.3f}s")
+
+    client.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
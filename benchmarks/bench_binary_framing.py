@@ -0,0 +1,80 @@
+"""
+Checks that every command round-trips through the binary framing, then compares text and binary framing over a pty loopback
+to a fake ESP32: bytes on the wire and commands per second.
+
+The pty has no baud rate, so its commands per second are bound by Python on both ends rather than by the bytes sent. The
+time those bytes take on the ESP32's 115200 baud UART (10 bits a byte) is shown too: that is where binary framing gains.
+
+Run from the repository root with: python -m benchmarks.bench_binary_framing
+"""
+import time
+
+from Arduino import protocol
+from Arduino.arduino import ArduinoController
+from benchmarks.fake_esp32 import FakeESP32
+
+COMMAND_COUNT = 2000
+BAUDRATE = 115200
+
+
+def check_round_trip():
+    checked = 0
+    for command in protocol.COMMANDS:
+        for text in (command.word, f"{command.word},0", f"{command.word},14"):
+            for seq in (None, 0, 255):
+                frame = protocol.encode(text, seq)
+                assert len(frame) == protocol.FRAME_SIZE
+                assert protocol.decode(frame) == (text, seq), (text, seq)
+                checked += 1
+
+    # A corrupted frame must be rejected rather than decoded as a different command
+    frame = bytearray(protocol.encode("splayer,3"))
+    frame[2] ^= 0x01
+    try:
+        protocol.decode(bytes(frame))
+        raise AssertionError("Corrupted frame was accepted")
+    except protocol.FrameError:
+        pass
+
+    return checked
+
+
+def run_loopback(binary):
+    device = FakeESP32(processing_delay=0).start()
+    controller = ArduinoController(port=device.port, binary=binary)
+    controller.reader.echo = False
+
+    commands = [f"splayer,{i % 15}" if i % 3 == 0 else ("nplayer" if i % 3 == 1 else "vyes") for i in range(COMMAND_COUNT)]
+
+    start = time.perf_counter()
+    mark = controller.reader.mark()
+    for command in commands:
+        controller.bridge.write_line(command)
+    # The fake echoes each command once handled, so the last echo means everything has been through
+    controller.reader.wait_for(lambda text: len(device.commands) >= COMMAND_COUNT, timeout=30, since=mark)
+    elapsed = time.perf_counter() - start
+
+    assert device.commands == commands, "Commands were not received intact"
+    controller.reader.stop()
+    device.stop()
+    return device.bytes_received, elapsed
+
+
+def main():
+    print(f"Round trip: {check_round_trip()} frames encoded and decoded correctly")
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        protocol.decode(protocol.encode("splayer,7", 42))
+    print(f"Encode + decode: {(time.perf_counter() - start) / 10000 * 1e6:.1f} us per frame")
+
+    print(f"\n{COMMAND_COUNT} commands over a pty loopback:")
+    print(f"{'framing':>8} | {'bytes':>7} | {'bytes/cmd':>9} | {'commands/s':>10} | {f'UART us/cmd at {BAUDRATE}':>22}")
+    for name, binary in (("text", False), ("binary", True)):
+        sent, elapsed = run_loopback(binary)
+        uart_us = sent / COMMAND_COUNT * 10 / BAUDRATE * 1e6
+        print(f"{name:>8} | {sent:>7} | {sent / COMMAND_COUNT:>9.2f} | {COMMAND_COUNT / elapsed:>10.0f} | {uart_us:>22.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Drives one ArduinoController with several pty-backed fake ESP32 bridges, checking that each bridge is written to on its own
+thread: commands broadcast to every bridge reach the healthy ones just as fast while another bridge has stopped reading
+its port, or has been unplugged, and routed commands only reach the bridges they are routed to.
+
+The last bridge is the one that misbehaves; the first (primary) bridge is the one whose replies the controller waits on.
+Reports, per scenario, the latency from sending a command to each healthy bridge's echo, and every bridge's stats
+(queue depth, writes, drops and write latency).
+
+Run from the repository root with: python -m benchmarks.bench_bridges [--bridges 3] [--commands 200]
+Exits with code 1 if the healthy bridges' p95 with a misbehaving bridge is over --target-ms, or a routed command
+reached the wrong bridge.
+"""
+import argparse
+import builtins
+import json
+import sys
+import time
+
+import serial
+
+from benchmarks.bench_game import summarise
+from benchmarks.fake_esp32 import FakeESP32
+
+
+def broadcast(controller, healthy, commands):
+    """
+    Sends each command to every bridge and waits for the primary's reply, as a menu keypress does, then collects when each
+    healthy bridge echoed it.
+    """
+    latencies = {name: [] for name in healthy}
+    for index in range(commands):
+        command = f"splayer,{index % 15}"
+        sent = time.monotonic()
+        controller.send_command(command)
+        controller._await_response()
+        for bridge, outgoing in controller._last_sent:
+            if bridge.name in healthy:
+                line = bridge.reader.wait_for(command, timeout=2, since=outgoing.mark)
+                latencies[bridge.name].append(float("inf") if line is None else line.received - sent)
+    return {name: summarise(durations) for name, durations in latencies.items()}
+
+
+def run(args):
+    from Arduino.arduino import ArduinoController
+
+    names = ["seats", "grimoire"] + [f"extra{index}" for index in range(1, args.bridges - 1)]
+    devices = {name: FakeESP32(processing_delay=args.processing_delay).start() for name in names}
+
+    original_print = builtins.print
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+
+    results = {}
+    try:
+        controller = ArduinoController(
+            port=",".join(f"{name}={device.port}" for name, device in devices.items()),
+            routes=f"tally={names[1]}",
+            sequenced=args.sequenced,
+            coalesce_window=0
+        )
+        for bridge in controller.bridges.values():
+            bridge.reader.echo = False
+        misbehaving = names[-1]
+        healthy = names[:-1]
+
+        results["healthy"] = {"latency": broadcast(controller, names, args.commands), "bridges": controller.bridge_stats()}
+
+        # Fill the stopped bridge's port buffer, so every write to it blocks until it times out
+        devices[misbehaving].paused = True
+        try:
+            while True:
+                controller.bridges[misbehaving].serial.write(b"\n" * 1024)
+        except serial.SerialTimeoutException:
+            pass
+        start = time.perf_counter()
+        results["stalled"] = {"latency": broadcast(controller, healthy, args.commands), "bridges": controller.bridge_stats()}
+        results["stalled"]["elapsed_s"] = round(time.perf_counter() - start, 3)
+        devices[misbehaving].paused = False
+
+        devices[misbehaving].stop()
+        start = time.perf_counter()
+        results["unplugged"] = {"latency": broadcast(controller, healthy, args.commands), "bridges": controller.bridge_stats()}
+        results["unplugged"]["elapsed_s"] = round(time.perf_counter() - start, 3)
+
+        received_before = {name: len(device.commands) for name, device in devices.items()}
+        for yes in range(args.routed):
+            controller.send_command(f"tally,{(yes << 8) | 5}")
+            controller._await_response()
+        controller.send_command("vyes", bridge=names[0])
+        controller._await_response()
+        results["routed"] = {
+            name: [command for command in device.commands[received_before[name]:]]
+            for name, device in devices.items() if name != misbehaving
+        }
+    finally:
+        builtins.print = original_print
+        for name, device in devices.items():
+            if device._running:
+                device.stop()
+
+    return {
+        "config": {"bridges": args.bridges, "commands": args.commands, "sequenced": args.sequenced, "misbehaving": misbehaving},
+        **results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bridges", type=int, default=3)
+    parser.add_argument("--commands", type=int, default=200, help="commands broadcast in each scenario")
+    parser.add_argument("--routed", type=int, default=5, help="tally commands sent, routed to the second bridge only")
+    parser.add_argument("--processing-delay", type=float, default=0.002, help="seconds each fake ESP32 takes per command")
+    parser.add_argument("--sequenced", action="store_true", help="use the sequenced, acknowledged serial protocol")
+    parser.add_argument("--target-ms", type=float, default=20.0, help="healthy bridges' p95 to stay under")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    if args.bridges < 3:
+        parser.error("--bridges must be at least 3: a primary, a routed-to bridge and one to misbehave")
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    names = list(report["routed"])
+    slow = [
+        f"{scenario}:{name}" for scenario in ("stalled", "unplugged")
+        for name, latency in report[scenario]["latency"].items() if latency["p95_ms"] > args.target_ms
+    ]
+    misrouted = [name for name, commands in report["routed"].items() if any(
+        command.startswith("tally") != (name == names[1]) or (command == "vyes" and name != names[0]) for command in commands
+    )]
+    if slow or misrouted:
+        print(f"Too slow: {slow}, misrouted: {misrouted}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
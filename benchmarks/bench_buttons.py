@@ -0,0 +1,111 @@
+"""
+Plays a game with nothing but Bluetooth board buttons: the fake ESP32 prints "btn,<n>" as the Sender does for a forwarded
+press, and EventController's input loop turns each one into a transition or menu option. Reports the latency from the press
+reaching the serial port to its transition finishing, and how long presses waited in the input queue.
+
+Run from the repository root with: python -m benchmarks.bench_buttons [--games 3] [--latency 0.02]
+"""
+import argparse
+import builtins
+import json
+import os
+import threading
+import time
+
+from benchmarks.bench_game import summarise, stub_environment
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+
+# Button presses for one game, from configuration to the restart; each does what typing its number would
+BUTTON_GAME = [
+    1,              # finish configuration
+    1,              # start game
+    1,              # start first day
+    1,              # start nominations, opening the nomination config menu
+    1, 3,           # next player, start voting
+    1, 2, 3, 4,     # yes, no, skip, end nominations
+    3, 1, 3, 4,     # kill screen: next player, kill, back
+    1,              # start night
+    3, 3, 4,        # revive screen: revive, back
+    1,              # start pre-day reveal
+    1,              # start day
+    4,              # start night (skip nominations)
+    4,              # end game via night
+    2,              # good wins
+    4               # restart game
+]
+
+
+def run(args):
+    rest_server = StubServer(latency=args.latency).start()
+    ws_server = HomeAssistantWebSocketStub(latency=args.latency).start()
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+
+    # Nobody types at the terminal: its reader waits forever
+    original_input, original_print = builtins.input, builtins.print
+    builtins.input = lambda prompt="": threading.Event().wait() or ""
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    presses = []
+    finished = threading.Semaphore(0)
+
+    def on_span(span):
+        if span.kind == "input" and span.name.startswith("button"):
+            presses.append(span)
+            finished.release()
+
+    try:
+        stub_environment(args, rest_server, ws_server, device)
+        os.environ.update({"BOTC_API_PORT": "", "BOTC_REDIS_URL": ""})
+
+        from main import EventController
+        from util.tracing import tracer
+        controller = EventController()
+        tracer.add_listener(on_span)
+        threading.Thread(target=controller.start_game, daemon=True).start()
+
+        phases = []
+        start = time.perf_counter()
+        for _ in range(args.games):
+            for button in BUTTON_GAME:
+                device.write_line(f"btn,{button}")
+                if not finished.acquire(timeout=10):
+                    raise RuntimeError(f"Button {button} was not handled (phase {controller.botc.current_state.id})")
+            phases.append(controller.botc.current_state.id)
+        elapsed = time.perf_counter() - start
+    finally:
+        builtins.input, builtins.print = original_input, original_print
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "config": {"games": args.games, "latency_s": args.latency},
+        "elapsed_s": round(elapsed, 3),
+        "presses": len(presses),
+        "press_to_transition": summarise([span.duration for span in presses]),
+        "queued": summarise([span.attributes["queued"] for span in presses]),
+        "failed": [span.error for span in presses if span.error],
+        "phase_after_each_game": phases
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the HTTP and WebSocket stand-ins take to answer")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = args.sequenced = args.binary = False
+
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Plays the scripted games of bench_game through the control API, as a phone on the LAN would: every phase event and menu
+option is sent over the WebSocket and timed until its result comes back, then GET /state is timed over a kept-alive
+HTTP connection. Every backend is a local stand-in, as in bench_game.
+
+A command's round trip includes running it, which for a phase change means waiting on the stand-ins (the lights alone
+are two Home Assistant scripts that must run in order, so 40 ms at the default latency). The time each command spent
+running in the controller is measured too, and the difference is what the API itself adds.
+
+The protocol is checked as well: requests without the token are refused, a frame over the size limit closes the
+WebSocket, and a command split over several frames runs.
+
+Run from the repository root with: python -m benchmarks.bench_control_api [--games 3] [--latency 0.02]
+Exits with code 1 if the p95 of the time the API adds to a command is over --target-ms, or a protocol check fails.
+"""
+import argparse
+import builtins
+import http.client
+import itertools
+import json
+import os
+import struct
+import sys
+import time
+
+import websocket
+
+from benchmarks.bench_game import GAME, summarise, stub_environment
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+from util.control_api import MAX_MESSAGE_BYTES
+
+
+TOKEN = "benchmark"
+
+
+class ControlClient():
+    """
+    Sends commands over the control API's WebSocket and waits for each one's result, counting the updates pushed meanwhile.
+    """
+    def __init__(self, url):
+        self.ws = websocket.create_connection(url, timeout=10, header=[f"Authorization: Bearer {TOKEN}"])
+        self.snapshot = json.loads(self.ws.recv())
+        self.updates = 0
+        self._ids = itertools.count(1)
+
+    def command(self, **command):
+        request_id = next(self._ids)
+        start = time.perf_counter()
+        self.ws.send(json.dumps({"id": request_id, **command}))
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get("type") == "result" and message.get("id") == request_id:
+                return time.perf_counter() - start, message
+            self.updates += 1
+
+    def close(self):
+        self.ws.close()
+
+
+def play(client, failures):
+    durations = []
+    for kind, name, answers in GAME:
+        commands = [{"event": name} if kind == "event" else {"non_state_event": name}]
+        commands += [{"menu_option": answer} for answer in answers]
+        for command in commands:
+            duration, result = client.command(**command)
+            durations.append(duration)
+            if not result["ok"]:
+                failures.append(f"{command}: {result['error']}")
+    return durations
+
+
+def time_state_requests(port, count):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        connection.request("GET", "/state", headers={"Authorization": f"Bearer {TOKEN}"})
+        response = connection.getresponse()
+        json.loads(response.read())
+        durations.append(time.perf_counter() - start)
+    connection.close()
+    return durations
+
+
+def check_protocol(port):
+    checks = {}
+
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/state")
+    checks["no_token_refused"] = connection.getresponse().status == 401
+    connection.close()
+
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", f"/state?token={TOKEN}")
+    checks["query_token_accepted"] = connection.getresponse().status == 200
+    connection.close()
+
+    try:
+        websocket.create_connection(f"ws://127.0.0.1:{port}/ws", timeout=5)
+        checks["websocket_without_token_refused"] = False
+    except websocket.WebSocketException:
+        checks["websocket_without_token_refused"] = True
+
+    client = ControlClient(f"ws://127.0.0.1:{port}/ws")
+    client.ws.send_frame(websocket.ABNF(fin=0, opcode=websocket.ABNF.OPCODE_TEXT, data='{"id": "split", '))
+    client.ws.send_frame(websocket.ABNF(fin=1, opcode=websocket.ABNF.OPCODE_CONT, data='"nonsense": true}'))
+    reply = json.loads(client.ws.recv())
+    checks["fragmented_command_answered"] = reply.get("type") == "result" and reply.get("id") == "split"
+
+    client.ws.send("x" * (MAX_MESSAGE_BYTES + 1))
+    frame = client.ws.recv_frame()
+    checks["oversized_frame_closed"] = frame.opcode == websocket.ABNF.OPCODE_CLOSE and frame.data[:2] == struct.pack("!H", 1009)
+    client.ws.close()
+    return checks
+
+
+def run(args):
+    rest_server = StubServer(latency=args.latency).start()
+    ws_server = HomeAssistantWebSocketStub(latency=args.latency).start()
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+
+    original_print = builtins.print
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    try:
+        stub_environment(args, rest_server, ws_server, device)
+        os.environ.update({"BOTC_API_PORT": "0", "BOTC_API_HOST": "127.0.0.1", "BOTC_API_TOKEN": TOKEN, "BOTC_REDIS_URL": ""})
+
+        from main import EventController
+        controller = EventController()
+        port = controller.control_server.port
+
+        # The time each command spends in the controller, to separate from what the API adds
+        run_times = []
+        run_command = controller.run_command
+
+        def timed_run_command(command):
+            start = time.perf_counter()
+            try:
+                return run_command(command)
+            finally:
+                run_times.append(time.perf_counter() - start)
+
+        controller.run_command = timed_run_command
+
+        client = ControlClient(f"ws://127.0.0.1:{port}/ws")
+        failures = []
+        start = time.perf_counter()
+        durations = []
+        for _ in range(args.games):
+            durations += play(client, failures)
+        elapsed = time.perf_counter() - start
+        client.close()
+
+        state_durations = time_state_requests(port, args.state_requests)
+        protocol = check_protocol(port)
+    finally:
+        builtins.print = original_print
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "config": {"games": args.games, "latency_s": args.latency},
+        "elapsed_s": round(elapsed, 3),
+        "commands": summarise(durations),
+        "running_commands": summarise(run_times[:len(durations)]),
+        "api_overhead": summarise([total - running for total, running in zip(durations, run_times)]),
+        "updates_pushed_per_game": client.updates / args.games,
+        "failed_commands": failures,
+        "get_state": summarise(state_durations),
+        "protocol": protocol
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the HTTP and WebSocket stand-ins take to answer")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--state-requests", type=int, default=200)
+    parser.add_argument("--target-ms", type=float, default=5.0, help="p95 of the time the API adds to a command to stay under")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = args.sequenced = args.binary = False
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if report["failed_commands"] or report["api_overhead"]["p95_ms"] > args.target_ms or not all(report["protocol"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
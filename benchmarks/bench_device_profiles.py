@@ -0,0 +1,120 @@
+"""
+Compares setting up a table's devices through the configuration menu, one "Next Device"/"Set Device" press at a time, with
+restoring the same device-to-seat mapping from a saved profile in one "cfgmap" command, against a pty-backed fake ESP32.
+Also checks that a restore the bridge does not apply as sent (a corrupted "cfgok" reply) is refused.
+
+The menu walk is timed without anyone pressing the buttons, so it is only the part of setup the bridge is responsible for;
+"menu_presses" is how many presses it takes a storyteller.
+
+Run from the repository root with: python -m benchmarks.bench_device_profiles [--players 15] [--restores 50]
+Exits with code 1 if a restore's p95 is over --target-ms, a mapping did not reach the bridge intact, or the corrupted
+reply was accepted.
+"""
+import argparse
+import builtins
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_game import summarise
+from benchmarks.fake_esp32 import FakeESP32
+
+
+def walk_menu(controller, devices):
+    """
+    Configures each seat's device through the menu, as a storyteller would, returning the number of presses.
+    """
+    controller.start_config()
+    presses = 0
+    for device in devices:
+        while controller._config_device != device:
+            controller.choose("2")
+            presses += 1
+        controller.choose("1")
+        presses += 1
+    controller.choose("3")
+    return presses + 2
+
+
+def run(args):
+    from Arduino.arduino import ArduinoController
+    from Arduino.device_profiles import DeviceProfiles
+
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+    devices = random.Random(args.seed).sample(range(15), args.players)
+
+    original_print = builtins.print
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            controller = ArduinoController(port=device.port, sequenced=args.sequenced, binary=args.binary, coalesce_window=0)
+            controller.reader.echo = False
+            controller.interactive = False
+            controller.profiles = DeviceProfiles(os.path.join(directory, "profiles.json"))
+
+            start = time.perf_counter()
+            presses = walk_menu(controller, devices)
+            menu_elapsed = time.perf_counter() - start
+            walked = list(controller.device_map)
+            controller.save_profile("bench")
+
+            restores = []
+            restored_intact = True
+            for _ in range(args.restores):
+                # Scrambled in between, so every restore has something to change
+                controller.player_count, controller.device_map = 0, []
+                start = time.perf_counter()
+                applied = controller.restore_profile("bench")
+                restores.append(time.perf_counter() - start)
+                restored_intact &= applied and controller.device_map == devices and device.device_map == devices
+
+            # A bridge that reports having applied something else must not be trusted
+            handle = device.handle
+            device.handle = lambda command: [line.replace("cfgok,", "cfgok,1") for line in handle(command)]
+            corrupted_accepted = controller.restore_profile("bench")
+            device.handle = handle
+    finally:
+        builtins.print = original_print
+        device.stop()
+
+    return {
+        "config": {"players": args.players, "restores": args.restores, "sequenced": args.sequenced, "binary": args.binary},
+        "menu": {"presses": presses, "elapsed_ms": round(menu_elapsed * 1000, 2), "mapping_intact": walked == devices},
+        "restore": {**summarise(restores), "max_ms": round(max(restores) * 1000, 2), "mapping_intact": restored_intact},
+        "corrupted_reply_accepted": corrupted_accepted
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--players", type=int, default=15)
+    parser.add_argument("--restores", type=int, default=50, help="times the saved profile is restored")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--sequenced", action="store_true", help="use the sequenced, acknowledged serial protocol")
+    parser.add_argument("--binary", action="store_true", help="send commands as binary frames where they fit")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="restore p95 to stay under")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    if not 1 <= args.players <= 15:
+        parser.error("--players must be between 1 and 15")
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if (
+        report["restore"]["p95_ms"] > args.target_ms
+        or not report["menu"]["mapping_intact"]
+        or not report["restore"]["mapping_intact"]
+        or report["corrupted_reply_accepted"]
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Plays games through EventController.run_command, the way start_game does but without anyone at the terminal, against the
+HTTP stand-in and a pty-backed fake ESP32 answering as fast as they can. Each step is either taken from a --script (a
+JSON list of run_command commands, replayed for every game) or chosen at random: an option of the phase or of the
+Arduino menu open on the bridge, favouring the phase's transitions with probability --progress, and now and then
+(--invalid-rate) a command that must be refused (an option the phase does not have, a stale phase, an event that is not
+allowed from here, an out-of-range player).
+
+After every step the controller is checked:
+- the phase only ever changes along one of the state machine's transitions, and a refused command changes nothing
+- current_player stays within player_count, player_count within the devices' limit, and each seat has a device
+- nothing asks for input() (there is no terminal to answer it)
+- every scene action runs in a transition or event it belongs to: states.<x>.exit only when leaving <x>,
+  states.<x>.enter only when entering it, events.<name> only for an option the phase offers
+- every HTTP and serial call is made on behalf of a transition, event, menu option, timer or prewarm pass
+
+Reports steps, transitions and games per second, transition latency and, from a second run under cProfile, the
+functions the controller's own thread spent the most time in.
+
+Run from the repository root with: python -m benchmarks.bench_fuzz [--games 200] [--seed 1] [--script game.json]
+Exits with code 1 if an invariant was broken, a step raised anything other than a refusal, or fewer than
+--min-transitions-per-s transitions were made.
+"""
+import argparse
+import builtins
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_game import stub_environment, summarise
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+from util.tracing import tracer
+
+# Spans a backend call can be made on behalf of
+OWNER_KINDS = {"transition", "event", "input", "timer", "prewarm"}
+# Examples of each invariant broken, kept in the report
+EXAMPLES = 5
+
+
+class HeadlessPrompt(Exception):
+    pass
+
+
+def refuse_input(prompt=""):
+    raise HeadlessPrompt(f"asked for input: {prompt!r}")
+
+
+class Fuzzer():
+    """
+    Drives one EventController through games, checking its invariants after each step.
+    """
+    def __init__(self, events, device, args, rng):
+        from statemachine.exceptions import TransitionNotAllowed
+
+        self.events = events
+        self.botc = events.botc
+        self.arduino = events.botc.arduino_controller
+        self.device = device
+        self.args = args
+        self.rng = rng
+        self.refusals = (ValueError, TransitionNotAllowed)
+        self.script = None
+        self.script_index = 0
+        if args.script:
+            with open(args.script, "r", encoding="utf-8") as file:
+                self.script = json.load(file)
+
+        self.legal = {(state.id, transition.target.id) for state in self.botc.states_map.values() for transition in state.transitions}
+        self.state_events = sorted({transition.event for state in self.botc.states_map.values() for transition in state.transitions})
+        self.events_from = {state.id: {transition.event for transition in state.transitions} for state in self.botc.states_map.values()}
+        self.offered = {
+            state.id: {option["non_state_event"] for option in self.botc.progression_options.get(state.value, []) if "non_state_event" in option}
+            for state in self.botc.states_map.values()
+        }
+
+        self.steps = 0
+        self.refused = 0
+        self.games = 0
+        self.violations = {}
+        self.commands = {}
+
+    def violation(self, kind, detail):
+        examples = self.violations.setdefault(kind, [])
+        if len(examples) < EXAMPLES:
+            examples.append(detail)
+
+    def random_command(self):
+        phase, menu = self.botc.current_state.id, self.arduino.menu
+        if self.rng.random() < self.args.invalid_rate:
+            return self.invalid_command(phase, menu)
+
+        if menu is not None:
+            options = self.arduino.menu_options()
+            option = self.rng.choice(sorted(options))
+            command = {"menu_option": option, "phase": phase, "menu": menu}
+            if options[option] == "Set Player":
+                # Out of range now and then, which must be turned down
+                command["player"] = self.rng.randint(0, self.arduino.player_count + 1)
+            return command
+
+        options = self.events._options()
+        transitions = [option for option in options if "event" in option]
+        pool = transitions if transitions and self.rng.random() < self.args.progress else options
+        return {"input": self.rng.choice(pool)["input"], "phase": phase, "menu": None}
+
+    def invalid_command(self, phase, menu):
+        other_phases = [state.id for state in self.botc.states_map.values() if state.id != phase]
+        illegal_events = [event for event in self.state_events if event not in self.events_from[phase]]
+        choices = [
+            {"input": "9", "phase": phase, "menu": menu},
+            {"menu_option": "9", "phase": phase, "menu": menu},
+            {"input": "1", "phase": self.rng.choice(other_phases), "menu": None},
+            {"event": self.rng.choice(illegal_events)},
+            {"set_dead": self.rng.choice([-1, self.arduino.MAX_PLAYERS])}
+        ]
+        command = self.rng.choice(choices)
+        command["expect_refusal"] = True
+        return command
+
+    def step(self, command):
+        expect_refusal = command.pop("expect_refusal", False)
+        before = self.snapshot()
+        kind = next(iter(key for key in command if key not in ("phase", "menu", "player")), "?")
+        self.commands[kind] = self.commands.get(kind, 0) + 1
+
+        refused = None
+        try:
+            # As start_game does, so menu options have a span for their serial commands to belong to
+            with tracer.span("fuzz", kind="input", menu=self.arduino.menu, phase=before["phase"]):
+                self.events.run_command(dict(command))
+        except HeadlessPrompt as e:
+            self.violation("prompted_for_input", {"command": command, "phase": before["phase"], "menu": before["menu"], "error": str(e)})
+        except self.refusals as e:
+            refused = e
+        except Exception as e:
+            self.violation("step_raised", {"command": command, "phase": before["phase"], "menu": before["menu"], "error": repr(e)})
+        self.steps += 1
+
+        after = self.snapshot()
+        if refused is not None:
+            self.refused += 1
+            if after != before:
+                self.violation("refused_command_changed_state", {"command": command, "error": repr(refused), "before": before, "after": after})
+        elif expect_refusal and "set_dead" in command:
+            # Out-of-range players are turned down without raising, so must simply leave everything as it was
+            if after != before:
+                self.violation("refused_command_changed_state", {"command": command, "before": before, "after": after})
+        elif expect_refusal:
+            self.violation("invalid_command_accepted", {"command": command, "phase": before["phase"]})
+
+        if after["phase"] != before["phase"] and (before["phase"], after["phase"]) not in self.legal:
+            self.violation("illegal_transition", {"command": command, "from": before["phase"], "to": after["phase"]})
+        if before["phase"] == "postgame" and after["phase"] == "game_configuration":
+            self.games += 1
+        self.check_arduino(command)
+
+    def snapshot(self):
+        return {
+            "phase": self.botc.current_state.id,
+            "menu": self.arduino.menu,
+            "current_player": self.arduino.current_player,
+            "player_count": self.arduino.player_count,
+            "players": self.arduino.players.to_list()
+        }
+
+    def check_arduino(self, command):
+        arduino = self.arduino
+        problems = []
+        if not 0 <= arduino.player_count <= arduino.MAX_PLAYERS:
+            problems.append(f"player_count {arduino.player_count} outside 0..{arduino.MAX_PLAYERS}")
+        if arduino.player_count and not 0 <= arduino.current_player < arduino.player_count:
+            problems.append(f"current_player {arduino.current_player} outside 0..{arduino.player_count - 1}")
+        if len(arduino.device_map) != arduino.player_count:
+            problems.append(f"{len(arduino.device_map)} seats mapped to devices for {arduino.player_count} players")
+        if arduino.menu is not None and arduino.menu not in arduino.menus:
+            problems.append(f"unknown menu {arduino.menu!r}")
+        for problem in problems:
+            self.violation("arduino_state", {"command": command, "phase": self.botc.current_state.id, "problem": problem})
+
+    def play(self, steps):
+        """
+        Plays "steps" steps (a scripted game restarts from its first command once it has run out).
+        """
+        for _ in range(steps):
+            if self.script is not None:
+                command = dict(self.script[self.script_index % len(self.script)])
+                self.script_index += 1
+            else:
+                command = self.random_command()
+            self.step(command)
+
+    def check_spans(self, spans):
+        """
+        Checks that every scene action and backend call was made on behalf of something that should have made it.
+        """
+        by_id = {span.span_id: span for span in spans}
+
+        def owner(span):
+            parent = by_id.get(span.parent_id)
+            while parent is not None and parent.kind not in OWNER_KINDS:
+                parent = by_id.get(parent.parent_id)
+            return parent
+
+        for span in spans:
+            if span.kind == "transition":
+                source, target = span.attributes.get("source"), span.attributes.get("target")
+                if target is not None and (source, target) not in self.legal:
+                    self.violation("illegal_transition", {"event": span.name, "from": source, "to": target})
+            elif span.kind == "event":
+                if span.name not in self.offered.get(span.attributes.get("state"), ()):
+                    self.violation("event_in_wrong_phase", {"event": span.name, "phase": span.attributes.get("state")})
+            elif span.kind == "action":
+                self._check_action(span, owner(span))
+            elif span.kind in ("http", "serial"):
+                parent = owner(span)
+                if parent is None or (parent.kind == "input" and parent.attributes.get("menu") is None):
+                    self.violation("backend_call_outside_phase_action", {"kind": span.kind, "call": span.name})
+
+    def _check_action(self, span, parent):
+        plan = span.attributes.get("plan", "")
+        if parent is not None and parent.kind == "transition":
+            allowed = {f"states.{parent.attributes.get('source')}.exit", f"states.{parent.attributes.get('target')}.enter"}
+        elif parent is not None and parent.kind == "event":
+            allowed = {f"events.{parent.name}"}
+        elif parent is not None and parent.kind == "timer":
+            allowed = {plan} if plan.startswith("Timer ") else set()
+        else:
+            allowed = set()
+
+        if plan not in allowed:
+            self.violation("action_in_wrong_phase", {
+                "action": span.name, "plan": plan, "during": None if parent is None else f"{parent.kind} {parent.name}",
+                "phase": None if parent is None else parent.attributes.get("source") or parent.attributes.get("state")
+            })
+
+
+def hot_spots(profile, top):
+    stats = pstats.Stats(profile)
+    root = os.getcwd() + os.sep
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    return [
+        {
+            "function": f"{filename.replace(root, '')}:{line}({name})",
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 2),
+            "cumtime_ms": round(cumtime * 1000, 2)
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+def run(args):
+    rest_server = StubServer(latency=0).start()
+    ws_server = HomeAssistantWebSocketStub(latency=0).start()
+    device = FakeESP32(processing_delay=0).start()
+    stub_environment(args, rest_server, ws_server, device)
+    os.environ.update({
+        "BOTC_AUDIO_MEDIA_PLAYER": "media_player.benchmark",
+        "BOTC_AUDIO_FADE_SECONDS": "0.05",
+        "BOTC_PREWARM": "1" if args.prewarm else "0",
+        "ARDUINO_COALESCE_WINDOW": "0",
+        "ARDUINO_PROFILES": os.path.join(tempfile.mkdtemp(prefix="botc_fuzz_"), "profiles.json"),
+        "BOTC_REDIS_URL": "",
+        "BOTC_API_PORT": "",
+        "BOTC_TRACE_DIR": ""
+    })
+
+    spans = []
+    tracer.add_listener(spans.append)
+
+    original_print, original_input = builtins.print, builtins.input
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+    builtins.input = refuse_input
+
+    try:
+        from main import EventController
+        events = EventController()
+        fuzzer = Fuzzer(events, device, args, random.Random(args.seed))
+
+        spans.clear()
+        start = time.perf_counter()
+        while fuzzer.games < args.games and fuzzer.steps < args.max_steps:
+            fuzzer.play(1)
+        elapsed = time.perf_counter() - start
+        steps, games = fuzzer.steps, fuzzer.games
+        # Writes still on their way to the fake ESP32 finish their spans on the bridge threads
+        time.sleep(0.2)
+        transitions = [span.duration for span in spans if span.kind == "transition"]
+        fuzzer.check_spans(list(spans))
+
+        profile_report = None
+        if args.profile_steps:
+            spans.clear()
+            profile = cProfile.Profile()
+            profile.enable()
+            fuzzer.play(args.profile_steps)
+            profile.disable()
+            time.sleep(0.2)
+            fuzzer.check_spans(list(spans))
+            profile_report = {"steps": args.profile_steps, "hot_spots": hot_spots(profile, args.top)}
+
+        events.botc.scheduler.stop()
+        if events.botc.prewarmer is not None:
+            events.botc.prewarmer.cancel()
+    finally:
+        builtins.print, builtins.input = original_print, original_input
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "config": {
+            "seed": args.seed,
+            "script": args.script,
+            "progress": args.progress,
+            "invalid_rate": args.invalid_rate,
+            "prewarm": args.prewarm,
+            "sequenced": args.sequenced,
+            "binary": args.binary
+        },
+        "games": games,
+        "steps": steps,
+        "refused": fuzzer.refused,
+        "commands": fuzzer.commands,
+        "elapsed_s": round(elapsed, 3),
+        "steps_per_s": round(steps / elapsed, 1),
+        "transitions_per_s": round(len(transitions) / elapsed, 1),
+        "games_per_s": round(games / elapsed, 2),
+        "transitions": summarise(transitions),
+        "unknown_serial_commands": device.unknown_commands[:EXAMPLES],
+        "violations": {kind: len(examples) for kind, examples in fuzzer.violations.items()},
+        "violation_examples": fuzzer.violations,
+        "profile": profile_report
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=200, help="games to finish (each ends with a restart from the post-game phase)")
+    parser.add_argument("--max-steps", type=int, default=50000, help="steps to stop after even if the games have not finished")
+    parser.add_argument("--script", help="JSON list of run_command commands to replay instead of choosing at random")
+    parser.add_argument("--progress", type=float, default=0.35, help="probability of taking one of the phase's transitions")
+    parser.add_argument("--invalid-rate", type=float, default=0.05, help="probability of a command that must be refused")
+    parser.add_argument("--profile-steps", type=int, default=2000, help="steps run again under cProfile (0 to skip)")
+    parser.add_argument("--top", type=int, default=15, help="hot spots to report")
+    parser.add_argument("--min-transitions-per-s", type=float, default=20.0)
+    parser.add_argument("--prewarm", action="store_true", help="prepare the backends in the background, as a real game does")
+    parser.add_argument("--sequenced", action="store_true", help="use the sequenced, acknowledged serial protocol")
+    parser.add_argument("--binary", action="store_true", help="send commands as binary frames where they fit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = False
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if report["violations"] or report["unknown_serial_commands"] or report["transitions_per_s"] < args.min_transitions_per_s:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Plays scripted full games through BOTCController against local stand-ins for every device: an HTTP stub for the Home Assistant and
+SmartThings REST APIs (with configurable latency and injected errors), the Home Assistant WebSocket stub, and a pty-backed fake ESP32.
+Writes a JSON report of transition latency percentiles, HTTP calls per game and serial bytes per game.
+
+Run from the repository root with: python -m benchmarks.bench_game [--games 5] [--latency 0.02] [--error-rate 0.0] [--audio] [--output report.json]
+Pass --baseline with an earlier report to fail (exit code 1) if the transition p95 has regressed by more than --tolerance.
+"""
+import argparse
+import builtins
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+
+# Each step is (kind, name, answers to the menus it opens); kind is "event" for state machine events, "menu" for non-state events
+GAME = [
+    ("menu", "set_bad_moon_rising", []),
+    ("event", "finish_config", []),
+    ("event", "start", []),
+    ("event", "first_day", []),
+    # Nomination config: two players along, start; then yes, no, yes, skip and end nominations
+    ("event", "start_nominations", ["1", "1", "3", "1", "2", "1", "3", "4"]),
+    ("event", "start_night", []),
+    # Kill screen: three players along, kill, done
+    ("menu", "start_player_kill_screen", ["1", "1", "1", "3", "4"]),
+    ("event", "start_prereveal", []),
+    ("event", "start_day", []),
+    # Revive screen: one player back, revive, done
+    ("menu", "start_player_revive_screen", ["2", "3", "4"]),
+    ("menu", "stop_all_alexa", []),
+    ("event", "start_nominations", ["1", "3", "1", "1", "1", "4"]),
+    ("event", "end_game_via_nomination", []),
+    ("menu", "set_good_wins", []),
+    ("menu", "restart_game", [])
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+def summarise(durations):
+    return {
+        "count": len(durations),
+        "p50_ms": round(percentile(durations, 0.50) * 1000, 2) if durations else None,
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 2) if durations else None,
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 2) if durations else None
+    }
+
+
+class ScriptedInput():
+    """
+    Answers the controller's input() prompts from the current step's list of answers.
+    """
+    def __init__(self):
+        self.answers = []
+
+    def __call__(self, prompt=""):
+        if not self.answers:
+            raise RuntimeError(f"The scripted game ran out of answers at prompt {prompt!r}")
+        return self.answers.pop(0)
+
+
+def stub_environment(args, rest_server, ws_server, device):
+    """
+    Points every backend at its stand-in, through the same environment variables as a real setup.
+    """
+    os.environ.update({
+        "HA_URL": ws_server.url if args.websocket else rest_server.url,
+        "HA_TOKEN": "benchmark",
+        "HA_WEBSOCKET": "1" if args.websocket else "0",
+        "SMARTTHINGS_URL": rest_server.url + "/",
+        "PAT": "benchmark",
+        "ROOM_LIGHTS": "light-1,light-2",
+        "ARDUINO_PORT": device.port,
+        "ARDUINO_SEQUENCED": "1" if args.sequenced else "0",
+        "ARDUINO_BINARY": "1" if args.binary else "0",
+        # A fresh journal each run, so there is never an unfinished game to offer to resume
+        "BOTC_JOURNAL": os.path.join(tempfile.mkdtemp(prefix="botc_bench_"), "game.jsonl")
+    })
+
+
+def build_controller(args, rest_server, ws_server, device):
+    stub_environment(args, rest_server, ws_server, device)
+    # Fades go to a media player on the stand-in, as the keyboard's media keys would need a display
+    os.environ["BOTC_AUDIO_MEDIA_PLAYER"] = "media_player.benchmark" if args.audio else ""
+
+    from main import BOTCController
+    botc = BOTCController()
+    botc.controlling_audio = args.audio
+
+    if args.websocket:
+        deadline = time.monotonic() + 5
+        while not botc.homeassistant_controller.ws.connected:
+            if time.monotonic() > deadline:
+                raise RuntimeError("WebSocket stand-in did not accept the connection")
+            time.sleep(0.01)
+
+    return botc
+
+
+def play(botc, scripted_input, step_errors):
+    for kind, name, answers in GAME:
+        scripted_input.answers = list(answers)
+        try:
+            if kind == "event":
+                botc.send(name)
+            else:
+                botc.send_non_state(name)
+        except Exception as e:
+            # Only errors raised outside a transition plan get this far (e.g. an injected HTTP error in a menu action)
+            step_errors.append(f"{name}: {e!r}")
+            continue
+
+        if scripted_input.answers:
+            raise RuntimeError(f"Step '{name}' left answers unused: {scripted_input.answers}")
+
+
+def run(args):
+    from util.tracing import tracer
+
+    rest_server = StubServer(latency=args.latency, error_rate=args.error_rate, seed=args.seed).start()
+    ws_server = HomeAssistantWebSocketStub(latency=args.latency).start()
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+
+    spans = []
+    tracer.add_listener(spans.append)
+
+    scripted_input = ScriptedInput()
+    original_input, original_print = builtins.input, builtins.print
+    builtins.input = scripted_input
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    try:
+        botc = build_controller(args, rest_server, ws_server, device)
+        # Everything before the first game (startup, reset handshakes) is not part of the measurements
+        spans.clear()
+        requests_before, bytes_before, commands_before = rest_server.requests, device.bytes_received, len(device.commands)
+        ws_calls_before = len(ws_server.calls)
+
+        step_errors = []
+        start = time.perf_counter()
+        for _ in range(args.games):
+            play(botc, scripted_input, step_errors)
+        botc.arduino_controller._await_response()
+        botc.audio.wait()
+        elapsed = time.perf_counter() - start
+    finally:
+        builtins.input, builtins.print = original_input, original_print
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    transitions = [span for span in spans if span.kind in ("transition", "event")]
+    by_name = {}
+    for span in transitions:
+        by_name.setdefault(f"{span.kind}:{span.name}", []).append(span.duration)
+
+    return {
+        "config": {
+            "games": args.games,
+            "latency_s": args.latency,
+            "error_rate": args.error_rate,
+            "transport": "websocket" if args.websocket else "rest",
+            "sequenced": args.sequenced,
+            "binary": args.binary,
+            "audio": args.audio
+        },
+        "elapsed_s": round(elapsed, 3),
+        "transitions": summarise([span.duration for span in transitions]),
+        "transitions_by_name": {name: summarise(durations) for name, durations in sorted(by_name.items())},
+        "audio_fades_per_game": sum(1 for span in spans if span.kind == "audio") / args.games,
+        "audio_fades_cancelled": sum(1 for span in spans if span.kind == "audio" and span.attributes.get("cancelled")),
+        "failed_actions_per_game": sum(1 for span in spans if span.kind == "action" and span.error) / args.games,
+        "step_errors": step_errors,
+        "http_calls_per_game": (rest_server.requests - requests_before) / args.games,
+        "http_errors_injected": rest_server.errors,
+        "websocket_calls_per_game": (len(ws_server.calls) - ws_calls_before) / args.games,
+        "serial_bytes_per_game": (device.bytes_received - bytes_before) / args.games,
+        "serial_commands_per_game": (len(device.commands) - commands_before) / args.games,
+        "unknown_serial_commands": device.unknown_commands
+    }
+
+
+def check_baseline(report, path, tolerance):
+    with open(path) as f:
+        baseline = json.load(f)
+
+    before, after = baseline["transitions"]["p95_ms"], report["transitions"]["p95_ms"]
+    if before and after > before * (1 + tolerance):
+        print(f"Transition p95 regressed: {before}ms -> {after}ms (tolerance {tolerance:.0%})", file=sys.stderr)
+        return False
+    print(f"Transition p95 {before}ms -> {after}ms, within {tolerance:.0%} of the baseline", file=sys.stderr)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the HTTP and WebSocket stand-ins take to answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP requests answered with a 500")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--websocket", action="store_true", help="call Home Assistant over the WebSocket stand-in")
+    parser.add_argument("--sequenced", action="store_true", help="use the sequenced, acknowledged serial protocol")
+    parser.add_argument("--binary", action="store_true", help="send serial commands as binary frames")
+    parser.add_argument("--audio", action="store_true", help="enable audio control, fading a media player on the HTTP stand-in")
+    parser.add_argument("--output", help="write the report here instead of to stdout")
+    parser.add_argument("--baseline", help="an earlier report to compare the transition p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
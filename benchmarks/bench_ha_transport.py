@@ -0,0 +1,79 @@
+"""
+Compares script calls over the Home Assistant REST API against the persistent WebSocket transport, using local stand-ins for both.
+The light calls are forced past the state cache so that every round reaches the stand-in.
+
+Run from the repository root with: python -m benchmarks.bench_ha_transport
+"""
+import os
+import time
+
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+
+LATENCY = 0.02
+ROUNDS = 20
+
+
+def time_rounds(func):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[-1]
+
+
+def build_controller(url, use_websocket):
+    from HomeAssistant.homeassistant import HomeAssistantController
+
+    os.environ["HA_URL"] = url
+    os.environ["HA_TOKEN"] = "benchmark"
+    controller = HomeAssistantController(use_websocket=use_websocket)
+
+    if use_websocket:
+        deadline = time.monotonic() + 5
+        while not controller.ws.connected:
+            if time.monotonic() > deadline:
+                raise RuntimeError("WebSocket stand-in did not accept the connection")
+            time.sleep(0.01)
+
+    return controller
+
+
+def main():
+    rest_server = StubServer(latency=LATENCY).start()
+    ws_server = HomeAssistantWebSocketStub(latency=LATENCY).start()
+
+    rest = build_controller(rest_server.url, use_websocket=False)
+    ws = build_controller(ws_server.url, use_websocket=True)
+
+    # Silence the controllers' own printing while timing
+    import builtins
+    original_print = builtins.print
+    builtins.print = lambda *args, **kwargs: None
+    import HomeAssistant.homeassistant as homeassistant
+    homeassistant.pprint = lambda *args, **kwargs: None
+
+    results = []
+    try:
+        for name, controller in (("REST", rest), ("WebSocket", ws)):
+            results.append((name, "single script", *time_rounds(controller.stop_all_alexa)))
+            # Forced, as the state cache would otherwise skip every round after the first
+            results.append((name, "turn_off_lights", *time_rounds(lambda: controller.turn_off_lights(force=True))))
+            results.append((name, "turn_on_lights", *time_rounds(lambda: controller.turn_on_lights(force=True))))
+    finally:
+        builtins.print = original_print
+
+    print(f"Stand-in latency per call: {LATENCY * 1000:.0f} ms, {ROUNDS} rounds each")
+    print(f"{'transport':>10} | {'call':>16} | {'p50':>9} | {'max':>9}")
+    for name, call, p50, worst in results:
+        print(f"{name:>10} | {call:>16} | {p50 * 1000:>7.1f}ms | {worst * 1000:>7.1f}ms")
+
+    ws.ws.close()
+    rest_server.stop()
+    ws_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Compares phase transitions that follow a long, idle phase with and without the backends being prepared in the
+background (see util/prewarm.py). The HTTP stand-in for Home Assistant and SmartThings charges --connect-latency for
+every new connection, as the TCP and TLS handshakes with a real server would, and closes connections left idle for
+--idle-timeout seconds, so without prewarming the first call after each idle phase has to open a new connection.
+
+The game is taken to the day phase, then goes round day -> nominations -> night -> pre-reveal -> day --rounds times,
+sitting idle for --idle seconds in every phase. Reports, for each mode, transition latency, the gong's latency and how
+many connections were opened during transitions.
+
+Run from the repository root with: python -m benchmarks.bench_prewarm [--rounds 3] [--idle 2]
+Exits with code 1 if prewarming did not save every connection opened during transitions, or did not lower the
+transition p95.
+"""
+import argparse
+import builtins
+import json
+import os
+import sys
+import time
+
+from benchmarks.bench_game import ScriptedInput, build_controller, summarise
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+
+SETUP = ["finish_config", "start", "first_day"]
+# Each event, with the answers to the menus it opens (the nomination menu is cancelled straight away)
+ROUND = [("start_nominations", ["4"]), ("start_night", []), ("start_prereveal", []), ("start_day", [])]
+
+
+def run_mode(args, prewarm, spans):
+    rest_server = StubServer(latency=args.latency, connect_latency=args.connect_latency, idle_timeout=args.idle_timeout).start()
+    ws_server = HomeAssistantWebSocketStub(latency=args.latency).start()
+    device = FakeESP32(processing_delay=args.processing_delay).start()
+    os.environ["BOTC_PREWARM"] = "1" if prewarm else "0"
+    os.environ["BOTC_PREWARM_INTERVAL"] = str(args.interval)
+
+    scripted_input = ScriptedInput()
+    original_input = builtins.input
+    builtins.input = scripted_input
+
+    transitions, gongs, cold_connections = [], [], 0
+    try:
+        botc = build_controller(args, rest_server, ws_server, device)
+        for event in SETUP:
+            botc.send(event)
+
+        for _ in range(args.rounds):
+            for event, answers in ROUND:
+                time.sleep(args.idle)
+                scripted_input.answers = list(answers)
+                spans.clear()
+                connections_before = rest_server.connections
+                botc.send(event)
+                cold_connections += rest_server.connections - connections_before
+                transitions += [span.duration for span in spans if span.kind == "transition"]
+                gongs += [span.duration for span in spans if span.kind == "action" and span.name == "gong"]
+
+        prewarm_passes = botc.prewarmer.passes if botc.prewarmer is not None else 0
+        if botc.prewarmer is not None:
+            botc.prewarmer.cancel()
+    finally:
+        builtins.input = original_input
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "transitions": summarise(transitions),
+        "gong": summarise(gongs),
+        "connections_opened_in_transitions": cold_connections,
+        "connections_opened": rest_server.connections,
+        "http_requests": rest_server.requests,
+        "prewarm_passes": prewarm_passes
+    }
+
+
+def run(args):
+    from util.tracing import tracer
+
+    spans = []
+    tracer.add_listener(spans.append)
+
+    original_print = builtins.print
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    try:
+        results = {"cold": run_mode(args, False, spans), "prewarmed": run_mode(args, True, spans)}
+    finally:
+        builtins.print = original_print
+
+    return {
+        "config": {
+            "rounds": args.rounds,
+            "idle_s": args.idle,
+            "latency_s": args.latency,
+            "connect_latency_s": args.connect_latency,
+            "idle_timeout_s": args.idle_timeout,
+            "keep_alive_interval_s": args.interval
+        },
+        **results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds spent in each phase before moving on")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the HTTP stand-in takes to answer")
+    parser.add_argument("--connect-latency", type=float, default=0.15, help="seconds the HTTP stand-in takes to accept a connection")
+    parser.add_argument("--idle-timeout", type=float, default=1.0, help="seconds before the HTTP stand-in closes an idle connection")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between keep-alives while prewarming")
+    parser.add_argument("--processing-delay", type=float, default=0.005, help="seconds the fake ESP32 takes per command")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = args.sequenced = args.binary = args.audio = False
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    cold, prewarmed = report["cold"], report["prewarmed"]
+    if prewarmed["connections_opened_in_transitions"] or prewarmed["transitions"]["p95_ms"] >= cold["transitions"]["p95_ms"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Measures the scheduler behind the phases' countdowns and timers (util/scheduler.py):
+- accuracy: timers (some cancelled, some rescheduled) driven by a virtual clock must each fire exactly when due, in
+  order, and cancelled ones never; timers on the real clock are reported by how late they fired
+- idle cost: the CPU time taken while thousands of far-off timers wait, and the cost of scheduling them and of
+  cancelling all of them at once with a transition
+- countdowns: how many updates reach the display, and the shortest gap between two, when the scheduler runs on time
+  and when it is run late at random
+- the game: a countdown and timer started by entering the day phase reach the fake ESP32, can be extended, and are
+  cancelled (and the display cleared) by moving on to nominations. The shipped scenes.yaml has them commented out, so
+  the game is played with a copy that turns on the day phase's example countdown and gong
+
+Run from the repository root with: python -m benchmarks.bench_scheduler [--timers 10000] [--idle 1]
+Exits with code 1 if a virtual-clock timer fired off time or out of order, the real-clock p95 lateness is over
+--target-ms, waiting timers took more than --idle-cpu-ms of CPU, a countdown updated faster than its rate, or the
+game did not start, extend and cancel its timers.
+"""
+import argparse
+import builtins
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.bench_game import ScriptedInput, build_controller, summarise
+from benchmarks.fake_esp32 import FakeESP32
+from benchmarks.ha_websocket_stub import HomeAssistantWebSocketStub
+from benchmarks.stub_server import StubServer
+from consts import SCENES_PATH
+from util.scheduler import Scheduler, VirtualClock
+
+
+def drive(scheduler, clock, until):
+    """
+    Runs a virtual-clock scheduler to "until", jumping the clock straight to each action as it comes due.
+    """
+    while True:
+        wait = scheduler.run_due()
+        if wait is None or clock.now + wait > until:
+            clock.now = until
+            scheduler.run_due()
+            return
+        clock.advance(wait)
+
+
+def virtual_accuracy(args, rng):
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    fired = []
+    expected = {}
+
+    actions = []
+    for index in range(args.virtual_timers):
+        delay = rng.uniform(0, 600)
+        actions.append(scheduler.schedule(delay, lambda index=index: fired.append((index, clock.now)), name=f"timer {index}"))
+        expected[index] = delay
+
+    for index in rng.sample(range(args.virtual_timers), args.virtual_timers // 10):
+        actions[index].cancel()
+        expected.pop(index)
+    for index in rng.sample(sorted(expected), len(expected) // 10):
+        delay = rng.uniform(0, 600)
+        actions[index].reschedule(delay)
+        expected[index] = delay
+
+    drive(scheduler, clock, 700)
+    order = [index for index, _ in fired]
+    return {
+        "timers": args.virtual_timers,
+        "fired": len(fired),
+        "expected": len(expected),
+        "off_time": sum(1 for index, at in fired if at != expected.get(index)),
+        "in_order": order == sorted(expected, key=lambda index: (expected[index], index)),
+        "cancelled_fired": sum(1 for index in order if index not in expected)
+    }
+
+
+def real_accuracy(args, rng):
+    scheduler = Scheduler().start()
+    lateness = []
+    try:
+        for _ in range(args.real_timers):
+            due = time.monotonic() + rng.uniform(0, args.real_spread)
+            scheduler.schedule(due - time.monotonic(), lambda due=due: lateness.append(time.monotonic() - due))
+        deadline = time.monotonic() + args.real_spread + 1
+        while len(lateness) < args.real_timers and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        scheduler.stop()
+
+    report = summarise(lateness)
+    return {"timers": args.real_timers, "fired": len(lateness), "lateness_p50_ms": report["p50_ms"], "lateness_p95_ms": report["p95_ms"],
+            "lateness_max_ms": round(max(lateness) * 1000, 2) if lateness else None}
+
+
+def idle_cost(args):
+    scheduler = Scheduler().start()
+    try:
+        start = time.perf_counter()
+        for index in range(args.timers):
+            scheduler.schedule(3600 + index, lambda: None)
+        scheduled_in = time.perf_counter() - start
+
+        # process_time covers every thread, including the scheduler's own
+        cpu_start = time.process_time()
+        time.sleep(args.idle)
+        idle_cpu = time.process_time() - cpu_start
+
+        start = time.perf_counter()
+        scheduler.next_epoch()
+        cancelled_in = time.perf_counter() - start
+        pending_after = len(scheduler.pending())
+    finally:
+        scheduler.stop()
+
+    return {
+        "timers": args.timers,
+        "schedule_us_per_timer": round(scheduled_in / args.timers * 1e6, 2),
+        "idle_s": args.idle,
+        "idle_cpu_ms": round(idle_cpu * 1000, 2),
+        "cancel_all_us": round(cancelled_in * 1e6, 2),
+        "pending_after_cancel": pending_after
+    }
+
+
+def countdown(args, rng, late):
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    ticks = []
+    done = []
+    scheduler.countdown(args.countdown, lambda seconds: ticks.append((clock.now, seconds)), then=lambda: done.append(clock.now),
+                        max_rate=args.max_rate)
+
+    if late:
+        # Run at random, up to four seconds apart, as a scheduler held up by a busy machine would be
+        while not done and clock.now < args.countdown * 2:
+            clock.advance(rng.uniform(0, 4))
+            scheduler.run_due()
+    else:
+        drive(scheduler, clock, args.countdown * 2)
+
+    gaps = [later[0] - earlier[0] for earlier, later in zip(ticks, ticks[1:])]
+    return {
+        "duration_s": args.countdown,
+        "max_rate": args.max_rate,
+        "updates": len(ticks),
+        "min_gap_s": round(min(gaps), 3) if gaps else None,
+        "first": ticks[0][1] if ticks else None,
+        "last": ticks[-1][1] if ticks else None,
+        "finished": bool(done)
+    }
+
+
+def timed_scenes():
+    """
+    Writes a copy of scenes.yaml with the day phase's example countdown and gong turned on, returning its path.
+    """
+    with open(SCENES_PATH) as f:
+        scenes = yaml.safe_load(f)
+    scenes["states"]["day_phase"]["enter"].update({
+        "countdown": 600,
+        "timers": [{"name": "gong", "after": 570, "call": "homeassistant.trigger_gong"}]
+    })
+
+    path = os.path.join(tempfile.mkdtemp(prefix="botc_bench_"), "scenes.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(scenes, f)
+    return path
+
+
+def game(args):
+    os.environ["BOTC_SCENES"] = timed_scenes()
+    rest_server = StubServer(latency=0.005).start()
+    ws_server = HomeAssistantWebSocketStub(latency=0.005).start()
+    device = FakeESP32(processing_delay=0.001).start()
+    scripted_input = ScriptedInput()
+    original_input = builtins.input
+    builtins.input = scripted_input
+
+    countdown_word = "cdown"
+    try:
+        botc = build_controller(args, rest_server, ws_server, device)
+        for event in ("finish_config", "start", "first_day"):
+            botc.send(event)
+        day = botc.timer_state()
+
+        botc.extend_timers(30)
+        extended = botc.timer_state()
+        time.sleep(0.2)
+        shown = [command for command in device.commands if command.partition(",")[0] == countdown_word]
+
+        # Cancelling the nomination menu straight away
+        scripted_input.answers = ["4"]
+        botc.send("start_nominations")
+        nominations = botc.timer_state()
+        time.sleep(0.2)
+        cleared = [command for command in device.commands if command.partition(",")[0] == countdown_word][-1:] == [countdown_word]
+        state_bound_pending = [scheduled.name for scheduled in botc.scheduler.pending() if scheduled.epoch is not None]
+        botc.scheduler.stop()
+    finally:
+        os.environ.pop("BOTC_SCENES")
+        builtins.input = original_input
+        device.stop()
+        rest_server.stop()
+        ws_server.stop()
+
+    return {
+        "day": day,
+        "extended": extended,
+        "countdown_shown": shown[:3],
+        "nominations": nominations,
+        "display_cleared": cleared,
+        "state_bound_pending": state_bound_pending
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+
+    original_print = builtins.print
+    if not args.verbose:
+        builtins.print = lambda *a, **k: None
+        import HomeAssistant.homeassistant as homeassistant
+        import SmartThings.smartthings as smartthings
+        homeassistant.pprint = smartthings.pprint = lambda *a, **k: None
+
+    try:
+        return {
+            "virtual_clock": virtual_accuracy(args, rng),
+            "real_clock": real_accuracy(args, rng),
+            "idle": idle_cost(args),
+            "countdown_on_time": countdown(args, rng, late=False),
+            "countdown_run_late": countdown(args, rng, late=True),
+            "game": game(args)
+        }
+    finally:
+        builtins.print = original_print
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--timers", type=int, default=10000, help="far-off timers left waiting while idle")
+    parser.add_argument("--idle", type=float, default=1.0, help="seconds to leave them waiting")
+    parser.add_argument("--virtual-timers", type=int, default=2000)
+    parser.add_argument("--real-timers", type=int, default=200)
+    parser.add_argument("--real-spread", type=float, default=2.0, help="seconds the real-clock timers are spread over")
+    parser.add_argument("--countdown", type=float, default=120.0, help="seconds counted down")
+    parser.add_argument("--max-rate", type=float, default=1.0, help="most countdown updates a second")
+    parser.add_argument("--target-ms", type=float, default=20.0, help="real-clock p95 lateness to stay under")
+    parser.add_argument("--idle-cpu-ms", type=float, default=20.0, help="CPU time the waiting timers may take while idle")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+    args.websocket = args.sequenced = args.binary = args.audio = False
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    virtual, real, idle, game_report = report["virtual_clock"], report["real_clock"], report["idle"], report["game"]
+    min_gap = 1.0 / args.max_rate
+    countdowns_ok = all(
+        result["finished"] and result["last"] == 0 and (result["min_gap_s"] is None or result["min_gap_s"] >= min_gap - 1e-9)
+        for result in (report["countdown_on_time"], report["countdown_run_late"])
+    )
+    game_ok = (
+        game_report["day"]["countdown"] is not None
+        and game_report["day"]["timers"]
+        and game_report["extended"]["countdown"] > game_report["day"]["countdown"]
+        and game_report["countdown_shown"]
+        and game_report["nominations"] == {"countdown": None, "timers": []}
+        and game_report["display_cleared"]
+        and not game_report["state_bound_pending"]
+    )
+    if (
+        virtual["off_time"] or not virtual["in_order"] or virtual["cancelled_fired"] or virtual["fired"] != virtual["expected"]
+        or real["fired"] != real["timers"] or real["lateness_p95_ms"] > args.target_ms
+        or idle["idle_cpu_ms"] > args.idle_cpu_ms or idle["pending_after_cancel"]
+        or not countdowns_ok or not game_ok
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
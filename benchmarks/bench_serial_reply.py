@@ -0,0 +1,67 @@
+"""
+Measures the per-keypress latency of the Arduino menus (send a command, then wait for the bridge) against a pty-backed fake ESP32,
+comparing the old fixed 0.5 s sleep with the background reader waiting for the reply.
+
+Run from the repository root with: python -m benchmarks.bench_serial_reply
+"""
+import time
+
+import serial
+
+from Arduino.arduino import ArduinoController
+from benchmarks.fake_esp32 import FakeESP32
+
+KEYPRESSES = 10
+PROCESSING_DELAY = 0.005
+
+
+def legacy_keypress(port, command):
+    port.write((command + '\n').encode('utf-8'))
+    time.sleep(0.5)
+    while port.in_waiting > 0:
+        port.readline()
+
+
+def measure(func):
+    timings = []
+    for _ in range(KEYPRESSES):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[-1]
+
+
+def main():
+    import builtins
+    original_print = builtins.print
+    builtins.print = lambda *args, **kwargs: None
+
+    try:
+        device = FakeESP32(processing_delay=PROCESSING_DELAY).start()
+        port = serial.Serial(device.port, baudrate=115200, timeout=0.1)
+        legacy = measure(lambda: legacy_keypress(port, "nplayer"))
+        port.close()
+        device.stop()
+
+        device = FakeESP32(processing_delay=PROCESSING_DELAY).start()
+        controller = ArduinoController(port=device.port)
+
+        def keypress():
+            controller.send_command("nplayer")
+            controller._await_response()
+
+        reader = measure(keypress)
+        controller.reader.stop()
+        device.stop()
+    finally:
+        builtins.print = original_print
+
+    print(f"{KEYPRESSES} keypresses, fake ESP32 replying after {PROCESSING_DELAY * 1000:.0f} ms")
+    print(f"{'path':>16} | {'p50':>9} | {'max':>9}")
+    print(f"{'fixed 0.5s sleep':>16} | {legacy[0] * 1000:>7.1f}ms | {legacy[1] * 1000:>7.1f}ms")
+    print(f"{'reader wait':>16} | {reader[0] * 1000:>7.1f}ms | {reader[1] * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measures commands per second through the state bus: a front-end adds commands to the command stream, a controller-side
+listener runs each one and publishes the resulting state, and the front-end waits for that state to come back over pub/sub.
+Uses the in-process bus by default; pass --redis-url redis://localhost:6379/0 to measure a local redis-server instead.
+
+Run from the repository root with: python -m benchmarks.bench_state_bus [--commands 5000] [--redis-url memory://]
+"""
+import argparse
+import json
+import threading
+import time
+
+from benchmarks.bench_game import summarise
+from util.state_bus import IN_PROCESS_URL, StateBus, connect
+
+
+def run(url, count, window):
+    client = connect(url)
+    prefix = f"botc_bench_{int(time.time() * 1000)}"
+    controller = StateBus(client, prefix=prefix)
+    front_end = StateBus(client, prefix=prefix)
+
+    # Stands in for EventController.run_command: every command changes the game state, which is then published
+    state = {"phase": "day_phase", "current_player": 0, "last_command": None}
+
+    def run_command(command):
+        state["current_player"] = (state["current_player"] + 1) % 15
+        state["last_command"] = int(command["id"])
+        controller.publish_state(dict(state))
+
+    controller.listen(run_command, block_ms=100)
+    subscription = front_end.subscribe()
+
+    sent_at = {}
+    latencies = []
+    done = threading.Event()
+    # At most "window" commands are in flight, like a handful of front-ends each waiting on their last command
+    in_flight = threading.Semaphore(window)
+
+    def receive():
+        while len(latencies) < count:
+            message = subscription.get_message(timeout=5)
+            if message is None:
+                break
+            event = json.loads(message["data"])
+            command_id = event.get("changes", {}).get("last_command")
+            if command_id in sent_at:
+                latencies.append(time.perf_counter() - sent_at.pop(command_id))
+                in_flight.release()
+        done.set()
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+
+    start = time.perf_counter()
+    for command_id in range(count):
+        in_flight.acquire()
+        sent_at[command_id] = time.perf_counter()
+        front_end.send_command(input="1", id=command_id, source="bench")
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    controller.stop()
+    subscription.close()
+    client.delete(controller.state_key, controller.commands_key)
+
+    return {
+        "bus": "in-process" if url == IN_PROCESS_URL else url,
+        "window": window,
+        "commands": count,
+        "completed": len(latencies),
+        "commands_per_s": round(len(latencies) / elapsed, 1),
+        "round_trip": summarise(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=5000)
+    parser.add_argument("--redis-url", default=IN_PROCESS_URL)
+    parser.add_argument("--window", type=int, nargs="+", default=[1, 16], help="commands in flight at once")
+    args = parser.parse_args()
+
+    for window in args.window:
+        print(json.dumps(run(args.redis_url, args.commands, window), indent=2))
+
+
+if __name__ == "__main__":
+    main()
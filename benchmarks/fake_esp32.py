@@ -0,0 +1,133 @@
+import os
+import pty
+import random
+import threading
+import time
+import tty
+
+from Arduino import protocol
+
+
+class FakeESP32():
+    """
+    A pty-backed stand-in for the Arduino-Sender bridge. Like the real sketch it echoes each newline-terminated
+    command back once it has been read, after "processing_delay" seconds, and follows the sequenced "<seq>:<command>" protocol.
+    Binary frames are decoded and handled the same way as text.
+    "drop_rate" is the chance of an incoming line being lost, to exercise retransmits. Set "paused" to stop reading the
+    port, as a bridge that has hung would, so writes to it back up and eventually block.
+    Open "port" with serial.Serial as if it were the ESP32's COM port.
+    """
+    def __init__(self, processing_delay=0.005, drop_rate=0.0, seed=None):
+        self.processing_delay = processing_delay
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.expected_seq = 0
+        self.dropped = 0
+        self.paused = False
+        self.master, self.slave = pty.openpty()
+        # Raw mode, so the pty neither echoes nor translates what is written to it
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.commands = []
+        self.unknown_commands = []
+        # Player flags as last set by "pstate" commands, and the device of each seat as last set by a "cfgmap" command
+        self.player_states = {}
+        self.device_map = None
+        self.bytes_received = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write_line(self, text):
+        try:
+            os.write(self.master, (text + "\r\n").encode("utf-8"))
+        except OSError:
+            # Stopped while a reply was on its way
+            pass
+
+    def handle(self, command):
+        """
+        Returns the lines to send back for a command; override to emulate more of the sketch.
+        """
+        if command.partition(",")[0] == protocol.BY_NAME["CONFIG_MAP"].word:
+            return [command, protocol.config_applied_reply(self.device_map)]
+        return [command]
+
+    def _serve(self):
+        buffer = b""
+        while self._running:
+            if self.paused:
+                time.sleep(0.01)
+                continue
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                return
+            self.bytes_received += len(chunk)
+
+            buffer += chunk
+            while buffer:
+                if buffer[0] == protocol.FRAME_SYNC:
+                    if len(buffer) < protocol.FRAME_SIZE:
+                        break
+                    frame, buffer = buffer[:protocol.FRAME_SIZE], buffer[protocol.FRAME_SIZE:]
+                    try:
+                        command, seq = protocol.decode(frame)
+                    except protocol.FrameError:
+                        self.write_line("Dropped invalid frame")
+                        continue
+                    text = command if seq is None else f"{seq}:{command}"
+                else:
+                    raw, separator, rest = buffer.partition(b"\n")
+                    if not separator:
+                        break
+                    buffer = rest
+                    text = raw.decode("utf-8").strip()
+
+                if self.random.random() < self.drop_rate:
+                    self.dropped += 1
+                    continue
+                self._receive(text)
+
+    def _receive(self, command):
+        seq = None
+        prefix, separator, rest = command.partition(":")
+        if separator and prefix.isdigit():
+            seq = int(prefix)
+            command = rest
+            ahead = (seq - self.expected_seq) % 256
+            if ahead != 0:
+                if ahead >= 128:
+                    self.write_line(f"ack {seq}")
+                return
+
+        if command == "seqreset":
+            self.expected_seq = 0
+
+        word = command.partition(",")[0]
+        if word not in protocol.BY_WORD:
+            self.unknown_commands.append(command)
+        elif word == protocol.BY_NAME["PLAYER_STATES"].word:
+            self.player_states.update(protocol.unpack_player_states(command))
+        elif word == protocol.BY_NAME["CONFIG_MAP"].word:
+            self.device_map = protocol.unpack_config_map(command)
+
+        self.commands.append(command)
+        time.sleep(self.processing_delay)
+        for line in self.handle(command):
+            self.write_line(line)
+
+        if seq is not None:
+            self.expected_seq = (self.expected_seq + 1) % 256
+            self.write_line(f"ack {seq}")
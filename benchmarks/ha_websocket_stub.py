@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import json
+import socketserver
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class HomeAssistantWebSocketHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough of the Home Assistant WebSocket API for the controller: the auth handshake and call_service.
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        if not self._handshake():
+            return
+
+        self._send({"type": "auth_required", "ha_version": "stub"})
+        auth = self._recv()
+        if auth is None:
+            return
+        if auth.get("type") != "auth" or auth.get("access_token") != self.server.token:
+            self._send({"type": "auth_invalid", "message": "Invalid access token"})
+            return
+        self._send({"type": "auth_ok", "ha_version": "stub"})
+
+        while True:
+            message = self._recv()
+            if message is None:
+                return
+
+            self.server.calls.append(message)
+            # Answer each call on its own thread so pipelined calls overlap, as they do in Home Assistant
+            threading.Thread(target=self._answer, args=(message,), daemon=True).start()
+
+    def _answer(self, message):
+        time.sleep(self.server.latency)
+        if message.get("type") == "call_service":
+            self._send({"id": message["id"], "type": "result", "success": True, "result": {"context": {"id": "stub"}}})
+        elif message.get("type") == "ping":
+            self._send({"id": message["id"], "type": "pong"})
+        else:
+            self._send({"id": message.get("id"), "type": "result", "success": False,
+                        "error": {"code": "unknown_command", "message": "Unknown command."}})
+
+    def _handshake(self):
+        headers = {}
+        request_line = self.rfile.readline()
+        if not request_line:
+            return False
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        self._send_lock = threading.Lock()
+        return True
+
+    def _recv(self):
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None
+
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.rfile.read(8))[0]
+
+        mask = self.rfile.read(4) if header[1] & 0x80 else b"\x00\x00\x00\x00"
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+
+        if opcode == 0x8:
+            return None
+        return json.loads(payload)
+
+    def _send(self, message):
+        payload = json.dumps(message).encode()
+        if len(payload) < 126:
+            header = struct.pack("!BB", 0x81, len(payload))
+        else:
+            header = struct.pack("!BBH", 0x81, 126, len(payload))
+
+        with self._send_lock:
+            try:
+                self.wfile.write(header + payload)
+            except OSError:
+                pass
+
+
+class HomeAssistantWebSocketStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, token="benchmark", latency=0.02, port=0):
+        super().__init__(("127.0.0.1", port), HomeAssistantWebSocketHandler)
+        self.token = token
+        self.latency = latency
+        self.calls = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,98 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # A new connection costs what the TCP and TLS handshakes with a real server would
+        self.server.count_connection()
+        time.sleep(self.server.connect_latency)
+        # Connections left idle for longer are closed, as a real server's keep-alive timeout would
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        time.sleep(self.server.latency + self.server.stall)
+        if self.server.should_fail():
+            self._reply(500, {"message": "Injected failure"})
+        else:
+            self._reply(200, {"message": "API running."})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(self.server.latency + self.server.stall)
+        if self.server.should_fail():
+            self._reply(500, {"message": "Injected failure"})
+        else:
+            self._reply(200, [])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the Home Assistant and SmartThings REST APIs, answering every request after a fixed latency.
+    A fraction "error_rate" of requests is answered with a 500 instead, to exercise error handling. Outages can be
+    simulated while it runs: set "down" to answer every request with a 500, or "stall" to hold every answer back that
+    many more seconds. Each new connection takes "connect_latency" seconds to accept, and connections idle for
+    "idle_timeout" seconds are closed, so a client that lets its connections go cold pays to open them again.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.02, port=0, error_rate=0.0, seed=None, connect_latency=0.0, idle_timeout=None):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.error_rate = error_rate
+        self.down = False
+        self.stall = 0.0
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def should_fail(self):
+        """
+        Counts a request, deciding whether to inject a failure for it.
+        """
+        with self._lock:
+            self.requests += 1
+            failed = self.down or self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,3 +1,4 @@
+import os
 from enum import Enum
 
 class GAME_PHASE(Enum):
@@ -35,4 +36,56 @@ HA_SCRIPT_NAMES = {
    "STOP_ALL_ALEXA": "script.stop_all_alexa",
    "SET_MOOD_LIGHTING": "script.set_mood_lighting",
    "SET_MOOD_LIGHTING_OFF": "script.set_mood_lighting_off"
-}
\ No newline at end of file
+}
+
+# Maximum time (in seconds) to wait for all devices during a single phase transition
+TRANSITION_DEADLINE = 5.0
+TRANSITION_WORKERS = 4
+
+# Seconds each request to a backend may take, and the budget for a whole call including its retries (overridden per backend
+# with e.g. HA_TIMEOUT and HA_BUDGET). Budgets stay under TRANSITION_DEADLINE, so a slow backend is given up on first.
+BACKEND_TIMEOUT = 2.0
+BACKEND_BUDGET = 4.0
+# Retries for calls that are safe to repeat (light scripts, switch commands, reads)
+BACKEND_RETRIES = 2
+# Failures in a row before a backend is marked as degraded, and seconds before it is tried again
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30.0
+
+# While the game sits in a phase, the backends the next transitions use are prepared in the background: after the
+# delay (seconds), then kept alive every interval, each request timing out quickly so a slow backend is not waited on
+PREWARM_DELAY = 0.5
+PREWARM_INTERVAL = 30.0
+PREWARM_TIMEOUT = 1.0
+
+# Most updates a second a phase's countdown sends to the Arduino displays
+COUNTDOWN_MAX_RATE = 1.0
+
+# Scripts that put a group of lights into a known state, as (group, state of the group's entity afterwards).
+# Sending one of these when its group is already in that state changes nothing, so HomeAssistantController skips it.
+HA_SCRIPT_STATES = {
+    HA_SCRIPT_NAMES["TURN_OFF"]: ("room_lights", "off"),
+    HA_SCRIPT_NAMES["TURN_ON"]: ("room_lights", "on"),
+    HA_SCRIPT_NAMES["SET_MOOD_LIGHTING"]: ("mood_light", "on"),
+    HA_SCRIPT_NAMES["SET_MOOD_LIGHTING_OFF"]: ("mood_light", "off")
+}
+
+# Groups whose cached state can no longer be trusted once a group's script has run (the "all lights" scripts may include the mood light)
+HA_GROUP_OVERLAPS = {
+    "room_lights": ["mood_light"]
+}
+
+# Scene file declaring what happens on each phase transition and menu action (overridden by BOTC_SCENES)
+SCENES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenes.yaml")
+
+# Journal of the game in progress, so it can be resumed after a crash (overridden by BOTC_JOURNAL)
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".botc_journal", "game.jsonl")
+
+# USB VID:PID of the last serial port chosen for the Arduino bridge, so it can be picked automatically next time
+ARDUINO_PORT_MEMORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".arduino_port.json")
+
+# Device-to-seat mappings saved from the device configuration menu, by profile name (overridden by ARDUINO_PROFILES)
+ARDUINO_PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".arduino_profiles.json")
+
+# The state machine graph is only re-rendered when the state machine definition changes
+STATE_MACHINE_GRAPH_PATH = "botc_state_machine.png"
@@ -1,15 +1,42 @@
+import os
+import threading
+import time
+
+# Everything before the first menu is timed, starting with the imports below
+STARTED = time.perf_counter()
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from HomeAssistant.homeassistant import HomeAssistantController
-from consts import EDITION_COLOURS, GAME_PHASE
+from consts import COUNTDOWN_MAX_RATE, GAME_PHASE, JOURNAL_PATH, PREWARM_DELAY, PREWARM_INTERVAL, SCENES_PATH, STATE_MACHINE_GRAPH_PATH, TRANSITION_DEADLINE, TRANSITION_WORKERS
 from dotenv import load_dotenv
 from SmartThings.smartthings import SmartThingsController
 from Arduino.arduino import ArduinoController
-
-import pyautogui
+from util.audio import AudioController, HomeAssistantVolume, KeyboardVolume
+from util.input_loop import InputLoop
+from util.journal import GameJournal
+from util.lazy import LazyModule
+from util.prewarm import Prewarmer
+from util.scene_engine import SceneEngine, SceneError
+from util.scheduler import Scheduler
+from util.startup import StartupTimer, draw_graph_if_changed
+from util.control_api import ControlServer
+from util.state_bus import IN_PROCESS_URL, StateBus
+from util.tracing import tracer
+from util.transition_executor import TransitionExecutor, TransitionPlan
 
 from statemachine import StateMachine, State, Event
 
+# pyautogui needs a display and is slow to import, so it is only imported once audio control is enabled
+# Only these of its functions can be used (by the audio controller, and by scenes through the "keyboard" target), so a
+# misspelt one in scenes.yaml fails at startup rather than mid-game
+pyautogui = LazyModule("pyautogui", names=("press", "keyDown", "keyUp", "hotkey", "write"))
+
 load_dotenv()
 
+STARTUP_TIMER = StartupTimer(STARTED)
+STARTUP_TIMER.mark("imports")
+
 class BOTCController(StateMachine):
     game_configuration = State("Game Configuration", initial=True, value=GAME_PHASE.CONFIGURATION)
     pregame = State("Pre-Game", value=GAME_PHASE.PRE_GAME)
@@ -121,6 +148,11 @@ class BOTCController(StateMachine):
             "label": "Enable/Disable Audio Control",
             "input": "6",
             "non_state_event": "toggle_audio_control"
+        },
+        {
+            "label": "Restore Saved Arduino Devices",
+            "input": "7",
+            "non_state_event": "restore_arduino_profile"
         }],
         GAME_PHASE.PRE_GAME: [{
             "label": "Start Game",
@@ -230,179 +262,520 @@ class BOTCController(StateMachine):
     }
     
 
-    def __init__(self):
-        super().__init__()
-        self.smartthings_controller = SmartThingsController()
-        self.homeassistant_controller = HomeAssistantController()
+    def __init__(self, scenes_path=None, startup_timer=None):
+        startup_timer = startup_timer or StartupTimer()
         
-        self.arduino_controller = ArduinoController()
+        # SmartThings and Home Assistant are set up in the background while the Arduino port is found (or asked for)
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+            smartthings = pool.submit(startup_timer.time, "smartthings", SmartThingsController)
+            homeassistant = pool.submit(startup_timer.time, "homeassistant", HomeAssistantController)
+            self.arduino_controller = startup_timer.time("arduino", ArduinoController)
+            self.smartthings_controller = smartthings.result()
+            self.homeassistant_controller = homeassistant.result()
+        startup_timer.mark("backends")
         
         self.controlling_audio = False
+        self.audio = self._audio_controller()
+        
+        # Set by EventController when other front-ends share the game through Redis
+        self.state_bus = None
+        
+        self.transition_executor = TransitionExecutor(max_workers=TRANSITION_WORKERS, deadline=TRANSITION_DEADLINE)
+        
+        # Compiled before the state machine starts, as entering the initial state already runs its scene
+        self.scenes = SceneEngine(
+            targets={
+                "homeassistant": self.homeassistant_controller,
+                "smartthings": self.smartthings_controller,
+                "arduino": self.arduino_controller,
+                "keyboard": pyautogui,
+                "audio": self.audio,
+                "controller": self
+            },
+            flags={
+                "audio": lambda: self.controlling_audio
+            },
+            states=[state.id for state in self.states_map.values()]
+        ).load(scenes_path or os.getenv("BOTC_SCENES") or SCENES_PATH)
+        
+        for options in self.progression_options.values():
+            for option in options:
+                if "non_state_event" in option and option["non_state_event"] not in self.scenes.events:
+                    raise SceneError(f"events.{option['non_state_event']}: used by the '{option['label']}' menu option but not defined")
+        startup_timer.mark("scenes")
+        
+        # While the game sits in a phase, the backends its next transitions use are kept ready in the background
+        self.prewarmer = None
+        if os.getenv("BOTC_PREWARM", "1").lower() not in ("0", "false", "no"):
+            self.prewarmer = Prewarmer(self.scenes, interval=float(os.getenv("BOTC_PREWARM_INTERVAL") or PREWARM_INTERVAL), delay=PREWARM_DELAY)
+        
+        # Held while anything changes the game: EventController runs its commands under it, and scene timers take it too,
+        # so a timer firing on the scheduler's thread never interleaves with a command
+        self.lock = threading.Lock()
+        
+        # Scenes' countdowns and timers; those of a phase are cancelled as soon as the game leaves it
+        self.scheduler = Scheduler().start()
+        self.countdown = None
+        self.timers = []
+        self.countdown_rate = float(os.getenv("BOTC_COUNTDOWN_RATE") or COUNTDOWN_MAX_RATE)
+        
+        # Offer to pick up where the last game left off if it was still in progress (not yet started, or already over)
+        self.journal = GameJournal(os.getenv("BOTC_JOURNAL") or JOURNAL_PATH)
+        # Changes made during a transition, event or command are journalled together once it finishes (see journal_batch)
+        self._journal_batches = 0
+        self._journal_batch_lock = threading.Lock()
+        restored = self.journal.replay()
+        start_value = None
+        if restored.get("phase") not in (None, type(self).game_configuration.id, type(self).postgame.id):
+            answer = input(f"Resume the unfinished game from the {restored['phase']} phase? (Y/n): ").strip().lower()
+            if answer in ("", "y", "yes"):
+                start_value = next(state.value for state in self.states_map.values() if state.id == restored["phase"])
+            else:
+                self.journal.clear()
+                restored = {}
+        startup_timer.mark("journal")
+        
+        # Scenes are not run for the state the machine starts in; a resumed game is re-pushed to the devices below instead
+        self._starting = True
+        super().__init__(start_value=start_value)
+        self._starting = False
+        
+        self.arduino_controller.on_state_change = self._state_changed
+        with self.journal_batch():
+            if start_value is not None:
+                self._restore(restored)
+        self._prewarm(self.current_state)
+        
+    def _run_plan(self, plan):
+        """
+        Runs all actions of a transition plan concurrently, and reports any that failed or missed the transition deadline.
+        """
+        report = self.transition_executor.run(plan)
+        print(report.summary())
+        return report
     
-    @pregame.enter
-    def entering_pre_game(self):
-        print("Entering Pre-Game phase...")
-        self.homeassistant_controller.turn_on_mood_light()
-        self.arduino_controller.start()
+    # Game phase actions are declared in scenes.yaml
+    def on_enter_state(self, target):
+        if not self._starting:
+            # Shared first, so front-ends show the new phase while its own actions run
+            self._state_changed()
+            # Started first, as the phase's own menus may keep it waiting on the storyteller
+            self._prewarm(target)
+            # Started before the scene, so its menus do not hold up the countdown
+            self._start_timers(self.scenes.enter.get(target.id))
+            self.scenes.on_enter(target.id, self._run_plan)
             
-    # Game phase actions
-    @first_night.enter
-    def entering_first_night(self):
-        print("Entering First Night phase...")
-        # self.smartthings_controller.turn_off_room_lights()
-        if self.controlling_audio:
-            pyautogui.press("playpause")
-        self.homeassistant_controller.turn_off_lights()
-        self.arduino_controller.start_night()
-
-    @first_night.exit
-    def exiting_first_night(self):
-        print("Exiting First Night phase...")
-        self.homeassistant_controller.turn_on_lights()
-        if self.controlling_audio:
-            pyautogui.press("volumedown", presses=50, interval=0.05)
-            pyautogui.press("playpause")
-
-    @prereveal_phase.enter
-    def entering_prereveal_phase(self):
-        print("Entering Pre-Reveal phase...")
-        self.homeassistant_controller.turn_on_lights()
-        if self.controlling_audio:
-            pyautogui.press("volumedown", presses=50, interval=0.05)
-            pyautogui.press("playpause")
-        self.arduino_controller.start_prereveal()
-
-    @day_phase.enter
-    def entering_day_phase(self):
-        print("Entering Day phase...")
-        # self.smartthings_controller.turn_on_room_lights()
-        self.arduino_controller.start_day()
+    def _prewarm(self, state):
+        if self.prewarmer is None:
+            return
+        # Offered in menu order, so the first option is taken to be the likeliest until the game has shown otherwise
+        offered = [option["event"] for option in self.progression_options.get(state.value, []) if "event" in option]
+        transitions = sorted(
+            ((transition.event, transition.target.id) for transition in state.transitions),
+            key=lambda transition: offered.index(transition[0]) if transition[0] in offered else len(offered)
+        )
+        self.prewarmer.prepare(state.id, transitions)
         
-
-
-    @nominations_phase.enter
-    def entering_nominations_phase(self):
-        print("Entering Nominations phase...")
-        self.homeassistant_controller.trigger_gong()
-        self.arduino_controller.start_nomination_config()
-        
-    @night_phase.enter
-    def entering_night_phase(self):
-        print("Entering Night phase...")
-        # self.smartthings_controller.turn_off_room_lights() 
-        self.homeassistant_controller.turn_off_lights()
-        self.arduino_controller.start_night()
-        
-        if self.controlling_audio:
-            pyautogui.press("nexttrack")
-            pyautogui.press("volumeup", presses=50, interval=0.05)
-    
-    @postgame.enter
-    def entering_post_game(self):
-        print("Entering Post-Game phase...")
-        # self.smartthings_controller.turn_off_room_lights() 
-        self.arduino_controller.enter_end_game()
+    def _audio_controller(self):
+        """
+        Fades a Home Assistant media player when one is configured, otherwise presses the keyboard's media keys.
+        """
+        media_player = os.getenv("BOTC_AUDIO_MEDIA_PLAYER")
+        if media_player:
+            backend = HomeAssistantVolume(self.homeassistant_controller, media_player)
+        else:
+            backend = KeyboardVolume(pyautogui)
         
-    def send_non_state(self, event_name):
-        if event_name == "set_trouble_brewing":
-            print("Setting Trouble Brewing edition...")
-            self.homeassistant_controller.set_mood_light_data(EDITION_COLOURS["TROUBLE_BREWING"])
-        elif event_name == "set_bad_moon_rising":
-            print("Setting Bad Moon Rising edition...")
-            self.homeassistant_controller.set_mood_light_data(EDITION_COLOURS["BAD_MOON_RISING"])
-        elif event_name == "set_sects_and_violets":
-            print("Setting Sects and Violets edition...")
-            self.homeassistant_controller.set_mood_light_data(EDITION_COLOURS["SECTS_AND_VIOLETS"])
-        elif event_name == "stop_all_alexa":
-            print("Stopping all Alexa devices...")
-            self.homeassistant_controller.stop_all_alexa()
-        elif event_name == "configure_arduino":
-            print("Starting Arduino device configuration...")
-            self.arduino_controller.start_config()
+        return AudioController(
+            backend,
+            volume=float(os.getenv("BOTC_AUDIO_VOLUME") or "1"),
+            duration=float(os.getenv("BOTC_AUDIO_FADE_SECONDS") or "2.5"),
+            curve=os.getenv("BOTC_AUDIO_FADE_CURVE") or "smooth"
+        )
+        
+    def on_exit_state(self, source):
+        if not self._starting:
+            self._stop_timers()
+            self.scenes.on_exit(source.id, self._run_plan)
             
-        elif event_name == "start_player_kill_screen":
-            print("Starting player kill screen...")
-            self.arduino_controller.kill_player_screen()
+    def _start_timers(self, scene):
+        """
+        Starts a scene's countdown (shown on the Arduino displays) and schedules its timers, all tied to the current phase.
+        """
+        if scene is None:
+            return
+        if scene.countdown is not None:
+            if self.countdown is not None:
+                self.countdown.cancel()
+            self.countdown = self.scheduler.countdown(
+                scene.countdown, self.arduino_controller.show_countdown, max_rate=self.countdown_rate, name=f"{scene.name} countdown"
+            )
+        for timer in scene.timers:
+            self.timers.append(self.scheduler.schedule(
+                timer.after, self._run_timer, timer, self.scheduler.epoch, name=f"{scene.name} {timer.name}"
+            ))
             
-        elif event_name == "start_player_revive_screen":
-            print("Starting player revive screen...")
-            self.arduino_controller.revive_player_screen()
+    def _run_timer(self, timer, epoch):
+        """
+        Runs a scene timer as a transition of its own, on the scheduler's thread, if its flags are still set.
+        """
+        with self.lock:
+            # The phase may have ended while a command held the lock
+            if epoch != self.scheduler.epoch:
+                return
+            active_flags = self.scenes.active_flags()
+            if not all(flag in active_flags for flag in timer.when):
+                return
+            print(f"[SCHEDULER] Timer {timer.name} fired")
+            plan = TransitionPlan(f"Timer {timer.name}")
+            plan.add(timer.name, timer.func, *timer.args, **timer.kwargs)
+            with self.journal_batch():
+                self._run_plan(plan)
+            self._publish("timer", name=timer.name, state=self.current_state.id)
+        
+    def _stop_timers(self):
+        """
+        Cancels the phase's countdown and timers (along with anything else tied to it), clearing the countdown's display.
+        """
+        self.scheduler.next_epoch()
+        self.timers = []
+        if self.countdown is not None:
+            self.countdown = None
+            self.arduino_controller.show_countdown(None)
             
-        elif event_name == "set_player_dead":
-            player_id = input("Enter Player ID to set as dead: ").strip()
-            if player_id.isdigit():
-                self.arduino_controller.set_dead(int(player_id))
-            else:
-                print("Invalid Player ID. Must be an integer.")
-        elif event_name == "set_player_alive":
-            player_id = input("Enter Player ID to set as alive: ").strip()
-            if player_id.isdigit():
-                self.arduino_controller.set_alive(int(player_id))
-            else:
-                print("Invalid Player ID. Must be an integer.")
-        elif event_name == "start_nomination_config":
-            print("Starting nomination configuration...")
-            self.arduino_controller.start_nomination_config()
+    def extend_timers(self, seconds):
+        """
+        Gives the phase "seconds" more (or less, if negative): moves its countdown and every timer still to fire.
+        """
+        if self.countdown is not None and self.countdown.pending:
+            self.countdown.extend(seconds)
+        for scheduled in self.timers:
+            scheduled.reschedule(max(scheduled.remaining + seconds, 0))
+        print(f"[SCHEDULER] Timers moved by {seconds:g}s")
             
-        elif event_name == "set_good_wins":
-            print("Setting Good Wins...")
-            self.homeassistant_controller.set_good_wins()
-            self.arduino_controller.set_good_wins()
-
-        elif event_name == "set_evil_wins":
-            print("Setting Evil Wins...")
-            self.homeassistant_controller.set_evil_wins()
-            self.arduino_controller.set_evil_wins()
+    def cancel_timers(self):
+        if self.countdown is not None or self.timers:
+            print("[SCHEDULER] Timers cancelled")
+        self._stop_timers()
+        
+    def timer_state(self):
+        """
+        The seconds left on the phase's countdown (None if there is none) and on each of its timers still to fire.
+        """
+        countdown = self.countdown
+        return {
+            "countdown": round(countdown.remaining, 1) if countdown is not None and countdown.pending else None,
+            "timers": [{"name": scheduled.name, "remaining": round(scheduled.remaining, 1)} for scheduled in self.timers if scheduled.pending]
+        }
+        
+    def send(self, event, *args, **kwargs):
+        with self.journal_batch():
+            with tracer.span(event, kind="transition", source=self.current_state.id) as span:
+                result = super().send(event, *args, **kwargs)
+                span.set(target=self.current_state.id)
+            if self.prewarmer is not None:
+                self.prewarmer.record(span.attributes["source"], event)
+            self._publish("transition", event=event, source=span.attributes["source"], target=self.current_state.id, duration=span.duration)
+            return result
+        
+    def send_non_state(self, event_name):
+        with self.journal_batch():
+            with tracer.span(event_name, kind="event", state=self.current_state.id) as span:
+                scene = self.scenes.events.get(event_name)
+                if scene is None:
+                    print(f"Unknown non-state event: {event_name}")
+                    return
+                self._start_timers(scene)
+                self.scenes.run(scene, self._run_plan)
+            self._publish("event", event=event_name, state=self.current_state.id, duration=span.duration)
             
-        elif event_name == "restart_game":
-            print("Restarting the game...")
-            self.homeassistant_controller.turn_on_mood_light()
-            self.arduino_controller.restart_game()
-            self.restart_game()
+    def game_state(self):
+        return {
+            "phase": self.current_state.id,
+            "audio": self.controlling_audio,
+            "mood_light": self.homeassistant_controller.mood_light_data,
+            **self.arduino_controller.state()
+        }
+        
+    def degraded_backends(self):
+        """
+        The backends whose circuit breaker is open: calls to them currently fail fast instead of being sent.
+        """
+        apis = (self.homeassistant_controller.api, self.smartthings_controller.api)
+        return [api.breaker.name for api in apis if api.breaker.degraded]
+        
+    def _state_changed(self):
+        """
+        Appends whatever changed in the game state to the journal (with a single fsync), and shares it on the state bus.
+        Inside a journal batch only the state bus is updated; the batch commits once it ends.
+        """
+        if not self._starting:
+            state = self.game_state()
+            if not self._journal_batches:
+                self.journal.commit(state)
+            if self.state_bus is not None:
+                self.state_bus.publish_state(state)
+                
+    @contextmanager
+    def journal_batch(self):
+        """
+        Holds back journal commits (including those from the transition's actions on other threads) until the outermost
+        batch ends, then commits whatever changed with a single fsync.
+        """
+        with self._journal_batch_lock:
+            self._journal_batches += 1
+        try:
+            yield
+        finally:
+            with self._journal_batch_lock:
+                self._journal_batches -= 1
+                outermost = not self._journal_batches
+            if outermost:
+                self._state_changed()
+                
+    def _publish(self, kind, **data):
+        if self.state_bus is not None:
+            try:
+                self.state_bus.publish(kind, **data)
+            except Exception as e:
+                print(f"[BUS] Could not publish {kind}: {e!r}")
             
-        elif event_name == "toggle_audio_control":
-            self.controlling_audio = not self.controlling_audio
-            status = "enabled" if self.controlling_audio else "disabled"
-            print(f"Audio control has been {status}.")
+    def _restore(self, state):
+        """
+        Restores a journalled game, then brings the lights and devices back in line with it in one transition:
+        the actions for entering the restored phase (without its interactive menus), followed by every player's status.
+        """
+        print(f"Resuming game in {self.current_state.name}...")
+        self.controlling_audio = state.get("audio", self.controlling_audio)
+        if state.get("mood_light"):
+            self.homeassistant_controller.set_mood_light_data(dict(state["mood_light"]))
+        self.arduino_controller.restore(state)
+        
+        plan = TransitionPlan(f"Restore {self.current_state.name}")
+        enter_plan = self.scenes.enter_plan(self.current_state.id)
+        if enter_plan is not None:
+            for action in enter_plan.actions.values():
+                plan.add(action.name, action.func, *action.args, after=action.after, **action.kwargs)
+        
+        # Player statuses go after the phase command, which may reset them on the devices
+        after = ["arduino"] if "arduino" in plan.actions else []
+        plan.add("players", self.arduino_controller.push_player_states, after=after)
+        self._run_plan(plan)
             
-        else:
-            print(f"Unknown non-state event: {event_name}")
-
+    def toggle_audio_control(self):
+        self.controlling_audio = not self.controlling_audio
+        if not self.controlling_audio:
+            self.audio.cancel()
+        elif isinstance(self.audio.backend, KeyboardVolume) and not pyautogui.loaded:
+            pyautogui.preload()
+        status = "enabled" if self.controlling_audio else "disabled"
+        print(f"Audio control has been {status}.")
         
-    
 
 class EventController():
-    def __init__(self):
-        self.botc = BOTCController()
+    def __init__(self, startup_timer=None):
+        self.startup_timer = startup_timer or StartupTimer()
+        self.botc = BOTCController(startup_timer=self.startup_timer)
+        self.startup_timer.mark("state machine")
+        
+        # Spans are streamed to spans.jsonl as they finish; metrics.prom is refreshed after every action
+        self.trace_dir = os.getenv("BOTC_TRACE_DIR") or None
+        if self.trace_dir is not None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            tracer.stream_to(os.path.join(self.trace_dir, "spans.jsonl"))
+        
+        # Commands from the CLI and from other front-ends are run one at a time, and never alongside a scene timer
+        self.lock = self.botc.lock
+        
+        # Terminal input, Bluetooth board buttons and timers all arrive through one queue, read by start_game
+        self.inputs = InputLoop()
+        # Any bridge can forward button presses (e.g. a second one beside the Bluetooth grimoire)
+        for bridge in self.botc.arduino_controller.bridges.values():
+            self.inputs.watch_buttons(bridge.reader, self.botc.arduino_controller.commands["BUTTON"])
+        
+        # Menus on the bridge stay open between commands instead of asking for options at the terminal,
+        # so the CLI does not hold up other front-ends while the storyteller is in one
+        self.botc.arduino_controller.interactive = False
+        
+        # Optional: share the game over Redis (or "memory://" for an in-process bus) so other front-ends can follow and drive it
+        self.state_bus = None
+        redis_url = os.getenv("BOTC_REDIS_URL") or None
+        api_port = os.getenv("BOTC_API_PORT") or None
+        if redis_url is None and api_port is not None:
+            # The control API pushes its updates from the state bus, so it needs one even if nothing else shares the game
+            redis_url = IN_PROCESS_URL
+        if redis_url is not None:
+            self.state_bus = StateBus.from_url(redis_url, prefix=os.getenv("BOTC_REDIS_PREFIX") or "botc")
+            self.botc.state_bus = self.state_bus
+            self.botc._state_changed()
+            self.state_bus.listen(self.run_command)
+            print(f"[BUS] Sharing the game on {redis_url}")
+            self.startup_timer.mark("state bus")
+        
+        # Optional: an HTTP/WebSocket control API for phones and tablets on the LAN
+        self.control_server = None
+        if api_port is not None:
+            try:
+                self.control_server = ControlServer(
+                    self, host=os.getenv("BOTC_API_HOST") or "127.0.0.1", port=int(api_port), token=os.getenv("BOTC_API_TOKEN") or None
+                )
+            except ValueError as e:
+                print(f"[API] Not starting: {e} (set BOTC_API_TOKEN)")
+            else:
+                self.control_server.start_in_background()
+                self.startup_timer.mark("control api")
+        
+    def _options(self):
+        return self.botc.progression_options.get(self.botc.current_state.value, [])
+    
+    def snapshot(self):
+        """
+        The game state along with what can be done next: the phase's options, and the options of the menu open on the bridge.
+        """
+        arduino = self.botc.arduino_controller
+        return {
+            **self.botc.game_state(),
+            "options": [{"input": option["input"], "label": option["label"]} for option in self._options()],
+            "menu": arduino.menu,
+            "menu_options": arduino.menu_options(),
+            "degraded": self.botc.degraded_backends(),
+            **self.botc.timer_state(),
+            "bridges": arduino.bridge_stats()
+        }
+    
+    def _run_option(self, option):
+        if "event" in option:
+            self.botc.send(option['event'])
+        elif "non_state_event" in option:
+            self.botc.send_non_state(option['non_state_event'])
+        
+        if self.trace_dir is not None:
+            tracer.write_prometheus(os.path.join(self.trace_dir, "metrics.prom"))
+            
+    def run_command(self, command):
+        """
+        Runs a command from the CLI or another front-end: {"input": phase option}, {"menu_option": option of the open menu,
+        "player": player number for "Set Player"}, {"event": name}, {"non_state_event": name}, or
+        {"set_dead" / "set_alive" / "set_dead_vote_used": player ID}, {"extend_timers": seconds} or {"cancel_timers": true}
+        for the phase's countdown and timers.
+        A command may also give the "phase" and "menu" it was chosen in, and is refused if the game has moved on since.
+        With a "delay" (in seconds), it is run that much later instead.
+        """
+        arduino = self.botc.arduino_controller
+        if command.get("delay"):
+            # Run later by start_game, e.g. {"delay": 300, "event": "start_night"} to end the day after five minutes
+            command = dict(command)
+            delay = float(command.pop("delay"))
+            self.botc.scheduler.schedule(delay, self.inputs.post, "timer", command, name="delayed command", state_bound=False)
+            print(f"[INPUT] {command} scheduled in {delay:g}s")
+            return
+        
+        with self.lock, self.botc.journal_batch():
+            if command.get("phase") not in (None, self.botc.current_state.id):
+                raise ValueError(f"The game has moved on to the {self.botc.current_state.id} phase")
+            if "menu" in command and (command["menu"] or None) != arduino.menu:
+                raise ValueError(f"The {command['menu'] or 'phase'} menu is no longer open")
+            
+            menu = arduino.menu
+            try:
+                if "menu_option" in command:
+                    if arduino.menu is None:
+                        raise ValueError("No menu is open")
+                    if not arduino.choose(str(command["menu_option"]).strip(), player=command.get("player")):
+                        raise ValueError(f"No option {command['menu_option']!r} in the {arduino.menu} menu")
+                    if self.trace_dir is not None:
+                        tracer.write_prometheus(os.path.join(self.trace_dir, "metrics.prom"))
+                elif "input" in command:
+                    if arduino.menu is not None:
+                        raise ValueError(f"Finish the {arduino.menu} menu first")
+                    option = next((opt for opt in self._options() if opt['input'] == str(command["input"]).strip().lower()), None)
+                    if option is None:
+                        raise ValueError(f"No option {command['input']!r} in the {self.botc.current_state.id} phase")
+                    self._run_option(option)
+                elif "event" in command:
+                    self._run_option({"event": command["event"]})
+                elif "non_state_event" in command:
+                    if command["non_state_event"] not in self.botc.scenes.events:
+                        raise ValueError(f"Unknown non-state event {command['non_state_event']!r}")
+                    self._run_option({"non_state_event": command["non_state_event"]})
+                elif "set_dead" in command:
+                    arduino.set_dead(int(command["set_dead"]))
+                elif "set_alive" in command:
+                    arduino.set_alive(int(command["set_alive"]))
+                elif "set_dead_vote_used" in command:
+                    arduino.set_dead_vote_used(int(command["set_dead_vote_used"]))
+                elif "extend_timers" in command:
+                    self.botc.extend_timers(float(command["extend_timers"]))
+                elif "cancel_timers" in command:
+                    self.botc.cancel_timers()
+                else:
+                    raise ValueError(f"Unknown command {command}")
+            finally:
+                if arduino.menu != menu:
+                    self.botc._publish("menu", menu=arduino.menu, options=arduino.menu_options())
         
     def start_game(self):
+        """
+        Runs the game from one queue of inputs: lines typed at the terminal, buttons pressed on the Bluetooth board
+        (forwarded by the bridge) and timers. A button does what typing its number would.
+        """
+        arduino = self.botc.arduino_controller
+        self.inputs.read_stdin()
         while True:
-            options = self.botc.progression_options.get(self.botc.current_state.value, [])
-            print("\nAvailable Actions:")
-            for option in options:
-                print(f"{option['input']}: {option['label']}")
-            
+            phase, menu = self.botc.current_state.id, arduino.menu
+            if menu is not None:
+                arduino.print_menu()
+                print("Enter option number: ", end="", flush=True)
+            else:
+                print("\nAvailable Actions:")
+                for option in self._options():
+                    print(f"{option['input']}: {option['label']}")
+                print("Next action: ", end="", flush=True)
             
-            next_action = input(f"Next action: ").strip().lower()
-            matched_option = next((opt for opt in options if opt['input'] == next_action), None)
-            if matched_option is not None:
-                if "event" in matched_option:
-                    self.botc.send(matched_option['event'])
-                elif "non_state_event" in matched_option:
-                    self.botc.send_non_state(matched_option['non_state_event'])
+            event = self.inputs.next()
+            if event.source == "timer":
+                print(f"\n[INPUT] Timer fired: {event.value}")
+                command = event.value
             else:
-                print("Invalid input. Please try again.")
+                if event.source == "button":
+                    print(f"\n[INPUT] Button {event.value} pressed")
+                next_action = str(event.value).lower()
+                if menu is not None:
+                    command = {"menu_option": next_action, "phase": phase, "menu": menu}
+                    if arduino.menu_options().get(next_action) == "Set Player":
+                        print("Enter player ID to set as current: ", end="", flush=True)
+                        command["player"] = self.inputs.next(sources=("stdin",)).value
+                else:
+                    command = {"input": next_action, "phase": phase, "menu": None}
+            
+            try:
+                # Timed from when the input arrived, so a button's span covers the press all the way to the end of its transition
+                with tracer.span(f"{event.source} {event.value}" if event.source == "button" else event.source, kind="input",
+                                 start=event.received, queued=time.monotonic() - event.received):
+                    self.run_command(command)
+            except ValueError as e:
+                print(f"Invalid input ({e}). Please try again.")
+            except Exception as e:
+                # A backend failing outside a transition plan (e.g. in a menu's follow-up step) must not end the game
+                print(f"[INPUT] {command} failed: {e!r}")
             
             
     def _draw_graph(self):
-        self.botc._graph().write_png("botc_state_machine.png")
+        if draw_graph_if_changed(self.botc, STATE_MACHINE_GRAPH_PATH):
+            print(f"State machine changed, redrew {STATE_MACHINE_GRAPH_PATH}")
+        self.startup_timer.mark("graph")
           
     
 
 def main():    
-    controller = EventController()
+    controller = EventController(STARTUP_TIMER)
     controller._draw_graph()
+    
+    print(STARTUP_TIMER.summary())
+    if os.getenv("BOTC_STARTUP_LOG"):
+        STARTUP_TIMER.record(os.getenv("BOTC_STARTUP_LOG"))
+    
     controller.start_game()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
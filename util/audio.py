@@ -0,0 +1,199 @@
+import contextvars
+import math
+import threading
+import time
+
+from util.tracing import tracer
+
+# Volume key presses between silent and full (two percent each on Windows)
+KEYBOARD_VOLUME_STEPS = 50
+
+# Each maps how far through a fade we are (0 to 1) to how far the volume has moved
+CURVES = {
+    "linear": lambda t: t,
+    "ease_in": lambda t: t * t,
+    "ease_out": lambda t: 1 - (1 - t) * (1 - t),
+    "smooth": lambda t: t * t * (3 - 2 * t),
+    # Loudness is heard logarithmically, so this sounds like an even fade
+    "exponential": lambda t: (math.pow(2, 10 * t) - 1) / 1023
+}
+
+
+class KeyboardVolume():
+    """
+    Changes the volume with the media keys (through pyautogui). The keys only move it up or down, so the level is
+    estimated from the presses sent so far.
+    """
+    # Key presses are cheap, so fades are sent in small steps
+    interval = 0.05
+
+    def __init__(self, keyboard, steps=KEYBOARD_VOLUME_STEPS, level=1.0):
+        self.keyboard = keyboard
+        self.steps = steps
+        # Counted in presses, so rounding never drifts
+        self.position = round(level * steps)
+
+    @property
+    def level(self):
+        return self.position / self.steps
+
+    def set_level(self, level):
+        presses = round(level * self.steps) - self.position
+        if presses:
+            # pyautogui sleeps after every call unless told not to
+            self.keyboard.press("volumeup" if presses > 0 else "volumedown", presses=abs(presses), _pause=False)
+            self.position += presses
+
+    def prewarm(self):
+        pass
+
+    def play_pause(self):
+        self.keyboard.press("playpause", _pause=False)
+
+    def next_track(self):
+        self.keyboard.press("nexttrack", _pause=False)
+
+
+class HomeAssistantVolume():
+    """
+    Sets a Home Assistant media player's volume to an absolute level with media_player.volume_set.
+    """
+    # Every step is a service call, so fades are sent in fewer, larger steps
+    interval = 0.25
+
+    def __init__(self, homeassistant, entity_id):
+        self.homeassistant = homeassistant
+        self.entity_id = entity_id
+        self._level = None
+
+    @property
+    def level(self):
+        if self._level is None:
+            try:
+                state = self.homeassistant.get_state(self.entity_id)
+                self._level = float(state["attributes"]["volume_level"])
+            except Exception as e:
+                print(f"[AUDIO] Could not read the volume of {self.entity_id} ({e!r}), assuming full")
+                self._level = 1.0
+        return self._level
+
+    def prewarm(self):
+        # Read through the circuit breaker, so left to the first fade while Home Assistant is degraded
+        if not self.homeassistant.api.breaker.degraded:
+            self.level
+
+    def set_level(self, level):
+        self.homeassistant.call_service("media_player", "volume_set", {"entity_id": self.entity_id, "volume_level": round(level, 3)}, retry=True)
+        self._level = level
+
+    def play_pause(self):
+        self.homeassistant.call_service("media_player", "media_play_pause", {"entity_id": self.entity_id})
+
+    def next_track(self):
+        self.homeassistant.call_service("media_player", "media_next_track", {"entity_id": self.entity_id})
+
+
+class AudioController():
+    """
+    Fades the music on a background thread, so a phase transition only starts the fade instead of waiting for it.
+    Starting a fade cancels the one in progress, which stops where it is (and skips whatever was to run after it), so
+    flicking between phases never leaves two fades fighting over the volume.
+    """
+    def __init__(self, backend, volume=1.0, duration=2.5, curve="smooth"):
+        if curve not in CURVES:
+            raise ValueError(f"Unknown fade curve '{curve}', expected one of {', '.join(CURVES)}")
+
+        self.backend = backend
+        # The level fading in returns to
+        self.volume = volume
+        self.duration = duration
+        self.curve = curve
+
+        self._lock = threading.Lock()
+        # Held around every call to the backend, so a cancelled fade finishes its step before the next fade reads the level
+        self._backend_lock = threading.Lock()
+        self._cancelled = None
+        self._thread = None
+
+    @property
+    def level(self):
+        return self.backend.level
+
+    def fade_to(self, level, duration=None, curve=None, then=None):
+        """
+        Starts fading to "level" (0 to 1) and returns at once. "then" is called when the fade completes, unless it is cancelled.
+        """
+        duration = self.duration if duration is None else duration
+        curve = CURVES[curve or self.curve]
+        cancelled = threading.Event()
+
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+            self._cancelled = cancelled
+            # Run in a copy of the caller's context, so the fade's spans are part of the transition that started it
+            self._thread = threading.Thread(
+                target=contextvars.copy_context().run, args=(self._fade, level, duration, curve, then, cancelled), daemon=True, name="audio_fade"
+            )
+            self._thread.start()
+        return self._thread
+
+    def fade_out(self, pause=False, duration=None, curve=None):
+        return self.fade_to(0.0, duration, curve, then=self.play_pause if pause else None)
+
+    def fade_in(self, next_track=False, duration=None, curve=None):
+        if next_track:
+            self.next_track()
+        return self.fade_to(self.volume, duration, curve)
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the latest fade to finish, or to be cancelled. Returns False if it is still running after "timeout".
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def prewarm(self, methods):
+        # A media player's level is read on the first fade, which would otherwise have to wait for it
+        with self._backend_lock:
+            self.backend.prewarm()
+
+    def play_pause(self):
+        with self._backend_lock:
+            self.backend.play_pause()
+
+    def next_track(self):
+        with self._backend_lock:
+            self.backend.next_track()
+
+    def _fade(self, target, duration, curve, then, cancelled):
+        with tracer.span("fade", kind="audio", target=target, seconds=duration) as span:
+            with self._backend_lock:
+                start_level = self.backend.level
+
+            steps = max(1, round(duration / self.backend.interval))
+            start = time.monotonic()
+            for step in range(1, steps + 1):
+                # Paced against the start, so slow backend calls do not stretch the fade
+                if cancelled.wait(max(start + duration * step / steps - time.monotonic(), 0)):
+                    break
+                with self._backend_lock:
+                    if cancelled.is_set():
+                        break
+                    self.backend.set_level(start_level + (target - start_level) * curve(step / steps))
+
+            span.set(cancelled=cancelled.is_set(), level=round(self.backend.level, 3))
+            if cancelled.is_set():
+                print(f"[AUDIO] Fade to {target:.0%} cancelled at {self.backend.level:.0%}")
+                return
+
+        if then is not None:
+            then()
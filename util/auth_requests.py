@@ -1,46 +1,234 @@
-import os
-from requests import Session
+import contextvars
+import random
 import threading
+import time
 
-class AuthRequests(Session):    
-    def __init__(self, base_url, token):
+from concurrent.futures import ThreadPoolExecutor
+from requests import ConnectionError, HTTPError, Session, Timeout
+from requests.adapters import HTTPAdapter
+
+from util.errors import BackendUnavailable
+from util.tracing import tracer
+
+
+class CircuitOpenError(BackendUnavailable):
+    """
+    Raised instead of sending a request to a backend whose circuit breaker is open.
+    """
+    def __init__(self, backend, retry_in):
+        super().__init__(backend, f"{backend} is degraded, not calling it for another {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker():
+    """
+    Stops calling a backend after "failure_threshold" calls in a row have failed, so every call fails fast instead of
+    waiting out its timeout. After "reset_timeout" seconds one call is let through to probe it: if that succeeds the
+    backend is healthy again, otherwise it stays degraded for another "reset_timeout".
+    """
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def degraded(self):
+        return self.opened_at is not None
+
+    def check(self, probe=True):
+        """
+        Raises CircuitOpenError if calls to the backend should not be made right now. Once the backend is due a probe, the
+        first call to check() becomes the probe, and must end in record_success(), record_failure() or release().
+        With "probe" False, only checks whether a call could be made, leaving the probe to the call itself.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in <= 0 and not (probe and self._probing):
+                if probe:
+                    self._probing = True
+                return
+
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(retry_in, 0))
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"[BREAKER] {self.name} is answering again")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                print(f"[BREAKER] {self.name} is degraded after {self.failures} failure(s), failing fast for {self.reset_timeout:.0f}s")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        return {"degraded": self.degraded, "failures": self.failures, "rejected": self.rejected}
+
+class BatchResult():
+    """
+    The outcome of a batch of requests, in the same order as the commands that were sent.
+    Each command has either a result (the decoded JSON response) or an error (the exception raised).
+    """
+    def __init__(self, size):
+        self.results = [None] * size
+        self.errors = [None] * size
+
+    @property
+    def ok(self):
+        return all(error is None for error in self.errors)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(zip(self.results, self.errors))
+
+    def __repr__(self):
+        return f"BatchResult(results={self.results!r}, errors={self.errors!r})"
+
+
+class AuthRequests(Session):
+    """
+    A session for one backend's REST API. Every call has a time budget: each attempt times out after "timeout" seconds,
+    and retries (up to "retries" of them, with jittered exponential backoff) are only made while the whole call is within
+    "budget" seconds. Only calls marked as retryable are retried, as a retry may repeat a request that did get through.
+    Connection errors, timeouts and 5xx responses count against the backend's circuit breaker.
+    """
+    def __init__(self, base_url, token, max_workers=8, timeout=10, budget=None, retries=0, backoff=0.2, breaker=None):
         super().__init__()
         self.base_url = base_url
         self.token = token
-        
-    def _make_request(self, method, url, *args, **kwargs):
-        joined_url = self.base_url + url
-        
-        headers = {
-            "Authorization": "Bearer " + self.token,
+        self.timeout = timeout
+        self.budget = timeout if budget is None else budget
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker(base_url)
+        self.max_workers = max_workers
+
+        # Headers are the same for every request, so build them once for the whole session
+        self.headers.update({
+            "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
-        }
-        
-        return super().request(method, joined_url, headers=headers, *args, **kwargs)
-    
-    def get(self, url):
-        r = self._make_request("GET", url)     
+        })
+
+        # Keep as many connections alive as we have workers, and block rather than open throwaway connections
+        adapter = HTTPAdapter(pool_maxsize=max_workers, pool_block=True)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+        # For batches; its threads are only started once a batch needs them
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth_requests")
+
+    def _make_request(self, method, url, *args, retry=False, **kwargs):
+        joined_url = self.base_url + url
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        deadline = time.monotonic() + max(self.budget, timeout)
+        self.breaker.check()
+
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                try:
+                    response = self._attempt(method, url, joined_url, *args, timeout=min(timeout, deadline - time.monotonic()), **kwargs)
+                except (ConnectionError, Timeout, HTTPError) as e:
+                    # Full jitter, so clients retrying together do not hit a recovering backend in step
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                    if not retry or attempt >= self.retries or time.monotonic() + delay >= deadline - 0.05:
+                        self.breaker.record_failure()
+                        recorded = True
+                        raise
+                    print(f"[HTTP] {method} {url} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+                self.breaker.record_success()
+                recorded = True
+                return response
+        finally:
+            if not recorded:
+                # Not the backend's fault (e.g. a malformed request, or interrupted), so the next call may probe it instead
+                self.breaker.release()
+
+    def _attempt(self, method, url, joined_url, *args, timeout, **kwargs):
+        with tracer.span(f"{method} {url}", kind="http") as span:
+            response = super().request(method, joined_url, *args, timeout=timeout, **kwargs)
+            span.set(
+                status=response.status_code,
+                bytes_sent=len(response.request.body or b""),
+                bytes_received=len(response.content)
+            )
+            # The backend is struggling rather than refusing the request, so this is worth retrying
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+
+    def get(self, url, timeout=None):
+        r = self._make_request("GET", url, timeout=timeout, retry=True)
         return r.json()
-    
-    def post(self, url, data, mutable_ret: list|None = None):
-        r = self._make_request("POST", url, json=data)
-        
-        r.raise_for_status()     
-        
-        if mutable_ret is not None:
-            mutable_ret.append(r.json())
-        
+
+    def status(self, url, timeout=None):
+        """
+        Returns the status code of a single GET, e.g. to check that an entity exists or to keep the connection open.
+        Sent around the circuit breaker, as these checks run in the background: they must neither take the probe a real
+        call is due nor count against the backend. An answer does show the backend has recovered, closing the breaker.
+        """
+        try:
+            response = self._attempt("GET", url, self.base_url + url, timeout=timeout or self.timeout)
+        except HTTPError as e:
+            return e.response.status_code
+        self.breaker.record_success()
+        return response.status_code
+
+    def post(self, url, data, timeout=None, retry=False):
+        r = self._make_request("POST", url, json=data, timeout=timeout, retry=retry)
+
+        r.raise_for_status()
+
         return r.json()
-    
-    def batch_post(self, commands):
-        threads = []
-        results = []
-        for command in commands:
-            thread = threading.Thread(target=self.post, args=(command['url'], command['data'], results))
-            thread.start()
-            threads.append(thread)
-        
-        for thread in threads:
-            thread.join()
-            
-        return results
\ No newline at end of file
+
+    def batch_post(self, commands, timeout=None, retry=False):
+        """
+        Sends all commands concurrently on a fixed worker pool, returning a BatchResult in the same order as the commands.
+        A failing command does not stop the others from being sent.
+        """
+        # Fail the whole batch at once rather than one command at a time; a probe, if due, is left to the first command
+        self.breaker.check(probe=False)
+
+        futures = [
+            self._pool.submit(contextvars.copy_context().run, self.post, command['url'], command['data'], timeout, retry)
+            for command in commands
+        ]
+
+        batch = BatchResult(len(futures))
+        for i, future in enumerate(futures):
+            try:
+                batch.results[i] = future.result()
+            except Exception as e:
+                batch.errors[i] = e
+
+        return batch
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        super().close()
@@ -0,0 +1,313 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Commands are a few dozen bytes, so anything much bigger is refused rather than read into memory
+MAX_MESSAGE_BYTES = 64 * 1024
+
+# A client that has not taken its updates in this long is dropped, rather than left to buffer them without limit
+DRAIN_TIMEOUT = 5
+
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error"
+}
+
+
+class MessageTooLarge(ValueError):
+    """
+    Raised when a request body or WebSocket message is over MAX_MESSAGE_BYTES.
+    """
+
+
+class ControlServer():
+    """
+    Lets the game be driven from a phone or tablet on the LAN, alongside the CLI, with asyncio and no extra dependencies.
+
+    GET  /state        the game state, the open menu and the options available now
+    POST /command      runs a command, in the same shapes as the state bus (e.g. {"input": "1"} or {"menu_option": "3"})
+    GET  /ws           a WebSocket pushing every transition, state change and menu change; commands can be sent on it too,
+                       as {"id": ..., <command>}, and are answered with {"type": "result", "id": ..., "ok": ..., "state": ...}
+
+    Commands run one at a time on a single game thread (they make blocking serial and HTTP calls), so the event loop
+    stays free to answer other clients and push updates while a transition is in progress.
+
+    It listens on the loopback interface unless told otherwise. With a "token", every request must carry it, either as
+    "Authorization: Bearer <token>" or as "?token=<token>" (browsers cannot set headers on a WebSocket); listening
+    anywhere else requires one, as anyone who can reach the port could otherwise run the game.
+    """
+    def __init__(self, controller, host="127.0.0.1", port=8765, token=None):
+        if host not in LOOPBACK_HOSTS and not token:
+            raise ValueError(f"The control API needs a token to listen on {host}")
+
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.token = token
+
+        self.clients = set()
+        self.loop = None
+        self._server = None
+        self._game_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="control_api")
+
+    def start_in_background(self):
+        """
+        Runs the server's event loop on a daemon thread, returning once it is accepting connections.
+        """
+        started = threading.Event()
+
+        def _run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=_run, daemon=True, name="control_api_loop").start()
+        started.wait()
+        return self
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        # Updates are published on the state bus; a thread hands them to the loop to be pushed to every WebSocket
+        subscription = self.controller.state_bus.subscribe()
+        threading.Thread(target=self._forward_updates, args=(subscription,), daemon=True, name="control_api_updates").start()
+        print(f"[API] Listening on http://{self.host}:{self.port}")
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._server.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _forward_updates(self, subscription):
+        while True:
+            message = subscription.get_message(timeout=1.0)
+            if message is not None:
+                asyncio.run_coroutine_threadsafe(self._broadcast(message["data"]), self.loop)
+
+    async def _broadcast(self, text):
+        frame = _frame(text.encode("utf-8"))
+        writers = []
+        for writer in list(self.clients):
+            if writer.is_closing():
+                self.clients.discard(writer)
+            else:
+                writer.write(frame)
+                writers.append(writer)
+
+        # Written to every client before waiting on any, so one slow phone does not hold up the others
+        await asyncio.gather(*(self._drain(writer) for writer in writers))
+
+    async def _drain(self, writer):
+        try:
+            await asyncio.wait_for(writer.drain(), DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.clients.discard(writer)
+            writer.close()
+
+    def _authorised(self, path, headers):
+        if not self.token:
+            return True
+
+        supplied = parse_qs(urlsplit(path).query).get("token", [None])[0]
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            supplied = authorization[7:].strip()
+        return supplied is not None and hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    async def _run_command(self, command):
+        try:
+            await self.loop.run_in_executor(self._game_thread, self.controller.run_command, command)
+        except (ValueError, KeyError) as e:
+            return 409, {"ok": False, "error": str(e), "state": self.controller.snapshot()}
+        except Exception as e:
+            return 500, {"ok": False, "error": repr(e), "state": self.controller.snapshot()}
+        return 200, {"ok": True, "state": self.controller.snapshot()}
+
+    async def _handle(self, reader, writer):
+        try:
+            # Connections are kept alive, so a phone only pays for the TCP handshake once
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if not self._authorised(path, headers) or length > MAX_MESSAGE_BYTES:
+                    # The body is not read, so the connection cannot be reused
+                    status = 401 if length <= MAX_MESSAGE_BYTES else 413
+                    await self._respond(writer, status, {"error": STATUS_TEXT[status]}, close=True)
+                    return
+
+                if path.split("?")[0] == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers)
+                    return
+
+                body = await reader.readexactly(length)
+                status, response = await self._route(method, path.split("?")[0], body)
+                await self._respond(writer, status, response)
+
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            return
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer, status, response, close=False):
+        payload = json.dumps(response).encode("utf-8")
+        writer.write((
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            + ("Connection: close\r\n" if close else "")
+            + f"Content-Length: {len(payload)}\r\n\r\n"
+        ).encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _route(self, method, path, body):
+        if path == "/state":
+            if method != "GET":
+                return 405, {"error": "Use GET"}
+            return 200, self.controller.snapshot()
+
+        if path == "/command":
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            try:
+                command = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "The body must be a JSON object"}
+            if not isinstance(command, dict):
+                return 400, {"error": "The body must be a JSON object"}
+            return await self._run_command(command)
+
+        return 404, {"error": f"No endpoint {path}"}
+
+    async def _websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        writer.write(_frame(json.dumps({"type": "snapshot", **self.controller.snapshot()}).encode("utf-8")))
+        await writer.drain()
+        self.clients.add(writer)
+
+        # A message may be split over several frames: the first carries its opcode, the rest are continuations (opcode 0)
+        message_opcode, fragments, received = None, [], 0
+        while True:
+            try:
+                fin, opcode, payload = await _read_frame(reader, MAX_MESSAGE_BYTES - received)
+            except MessageTooLarge:
+                # 1009: message too big
+                writer.write(_frame(struct.pack("!H", 1009), opcode=0x8))
+                await writer.drain()
+                return
+
+            if opcode == 0x8:
+                writer.write(_frame(payload[:2], opcode=0x8))
+                await writer.drain()
+                return
+            if opcode == 0x9:
+                writer.write(_frame(payload, opcode=0xA))
+                await writer.drain()
+                continue
+            if opcode == 0xA:
+                continue
+
+            if opcode != 0x0:
+                message_opcode, fragments, received = opcode, [], 0
+            elif message_opcode is None:
+                # A continuation with nothing to continue
+                return
+            fragments.append(payload)
+            received += len(payload)
+            if not fin:
+                continue
+
+            opcode, payload = message_opcode, b"".join(fragments)
+            message_opcode, fragments, received = None, [], 0
+            if opcode != 0x1:
+                continue
+
+            try:
+                command = json.loads(payload)
+                request_id = command.pop("id", None)
+            except (ValueError, AttributeError):
+                writer.write(_frame(json.dumps({"type": "result", "ok": False, "error": "Commands must be JSON objects"}).encode("utf-8")))
+                await writer.drain()
+                continue
+
+            # Answered as soon as it has run, but without holding up this client's next command
+            asyncio.ensure_future(self._answer(writer, request_id, command))
+
+    async def _answer(self, writer, request_id, command):
+        _, result = await self._run_command(command)
+        if not writer.is_closing():
+            writer.write(_frame(json.dumps({"type": "result", "id": request_id, **result}).encode("utf-8")))
+            await self._drain(writer)
+
+
+async def _read_frame(reader, max_length=MAX_MESSAGE_BYTES):
+    """
+    Reads one frame, returning (fin, opcode, unmasked payload). Raises MessageTooLarge, before reading the payload,
+    if it is longer than "max_length".
+    """
+    header = await reader.readexactly(2)
+    fin = bool(header[0] & 0x80)
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+
+    if length > max_length:
+        raise MessageTooLarge(f"A {length} byte frame is over the {max_length} bytes allowed")
+
+    mask = await reader.readexactly(4) if header[1] & 0x80 else b"\x00\x00\x00\x00"
+    payload = await reader.readexactly(length)
+    return fin, opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _frame(payload, opcode=0x1):
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x80 | opcode, len(payload))
+    elif len(payload) < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+    return header + payload
@@ -0,0 +1,8 @@
+class BackendUnavailable(Exception):
+    """
+    Raised instead of calling a backend that is known to be unavailable (e.g. its circuit breaker is open), so a call
+    that was never attempted can be told apart from one that failed.
+    """
+    def __init__(self, backend, message):
+        super().__init__(message)
+        self.backend = backend
@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+
+
+class InputEvent():
+    def __init__(self, source, value, received=None):
+        self.source = source
+        self.value = value
+        # time.monotonic() when the input arrived (for a button, when its serial line was read)
+        self.received = time.monotonic() if received is None else received
+
+    def __repr__(self):
+        return f"InputEvent({self.source!r}, {self.value!r})"
+
+
+class InputLoop():
+    """
+    Multiplexes every source of input into one queue, so the game loop can wait on all of them at once:
+    lines typed at the terminal ("stdin"), buttons pressed on the Bluetooth board ("button", read from the bridge's
+    "btn,<n>" serial lines) and timers ("timer", posted by the game's Scheduler when a delayed command is due).
+    Waiting blocks on the queue until the next input; nothing polls.
+    """
+    def __init__(self):
+        self.events = queue.Queue()
+        self._deferred = []
+        self._stdin_thread = None
+
+    def post(self, source, value, received=None):
+        self.events.put(InputEvent(source, value, received))
+
+    def read_stdin(self):
+        """
+        Reads lines from the terminal on a background thread, posting each one as a "stdin" event.
+        """
+        def _read():
+            while True:
+                try:
+                    line = input()
+                except EOFError:
+                    return
+                self.post("stdin", line.strip())
+
+        self._stdin_thread = threading.Thread(target=_read, daemon=True, name="stdin_reader")
+        self._stdin_thread.start()
+        return self._stdin_thread
+
+    def watch_buttons(self, reader, word="btn"):
+        """
+        Posts a "button" event with the button's number for every "btn,<n>" line the bridge prints.
+        Runs on the serial reader's thread, so only parses and queues.
+        """
+        prefix = word + ","
+
+        def _on_line(line):
+            if line.text.startswith(prefix) and line.text[len(prefix):].isdigit():
+                self.post("button", int(line.text[len(prefix):]), received=line.received)
+
+        reader.add_listener(_on_line)
+
+    def next(self, sources=None):
+        """
+        Blocks until the next input (from one of "sources", if given) and returns it as an InputEvent.
+        Inputs from other sources are kept, in order, for a later call.
+        """
+        for index, event in enumerate(self._deferred):
+            if sources is None or event.source in sources:
+                return self._deferred.pop(index)
+
+        while True:
+            event = self.events.get()
+            if sources is None or event.source in sources:
+                return event
+            else:
+                self._deferred.append(event)
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+
+
+class GameJournal():
+    """
+    Append-only journal of the game state, so a game can be resumed after a crash or a dropped serial connection.
+    Each commit appends one line holding only the keys that changed since the last one, and is fsynced once.
+    Every "snapshot_every" commits the full state is written to a snapshot file and the journal starts over.
+    Commits only ever set keys to values, so replaying a record twice (e.g. after a crash mid-snapshot) is harmless.
+    Commits may come from any thread (late transition actions run on the executor's pool), so writes are made under a lock.
+    """
+    def __init__(self, path, snapshot_every=100):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.snapshot_every = snapshot_every
+
+        self.state = {}
+        self.records = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def replay(self):
+        """
+        Loads the last snapshot and replays the journal on top of it, returning the restored state.
+        A partly written final line (from a crash mid-commit) is ignored.
+        """
+        state = {}
+        try:
+            with open(self.snapshot_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        records = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        state.update(json.loads(line))
+                    except ValueError:
+                        break
+                    records += 1
+        except OSError:
+            pass
+
+        self.state = state
+        self.records = records
+        return dict(state)
+
+    def commit(self, state):
+        """
+        Records the keys of "state" that changed since the last commit. Returns the number of keys written.
+        """
+        with self._lock:
+            changes = {key: value for key, value in state.items() if self.state.get(key) != value}
+            if not changes:
+                return 0
+
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a")
+
+            encoded = json.dumps(changes, separators=(",", ":"))
+            self._file.write(encoded + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            # Decoded again so later in-place changes to the caller's values are still noticed
+            self.state.update(json.loads(encoded))
+            self.records += 1
+            if self.records >= self.snapshot_every:
+                self._snapshot()
+            return len(changes)
+
+    def snapshot(self):
+        """
+        Writes the full state to the snapshot file, then empties the journal.
+        """
+        with self._lock:
+            self._snapshot()
+
+    def clear(self):
+        """
+        Forgets the journalled game entirely, e.g. once it has been declined for resuming or has ended.
+        """
+        with self._lock:
+            self.state = {}
+            self._snapshot()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _snapshot(self):
+        temporary = self.snapshot_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "w")
+        os.fsync(self._file.fileno())
+        self.records = 0
@@ -0,0 +1,56 @@
+import importlib
+import threading
+
+
+class LazyModule():
+    """
+    Stands in for a module that is slow to import (or needs a display, like pyautogui) until it is first used.
+    Attribute lookups return callables that import the module on their first call, so functions such as "press" can be
+    bound at startup without importing anything. Only suitable for modules used for their functions.
+
+    As nothing is imported to check them against, only the functions listed in "names" can be looked up; any other name
+    raises AttributeError straight away, so a misspelt function fails when it is bound rather than on first use.
+    Once the module is imported, names are checked against the module itself as well.
+    """
+    def __init__(self, name, names):
+        self.name = name
+        self.names = frozenset(names)
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self.name)
+            return self._module
+
+    def preload(self):
+        """
+        Imports the module on a background thread, so it is ready by the time it is used. Import errors are reported
+        then, and raised again on first use.
+        """
+        def _import():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Could not import {self.name}: {e!r}")
+
+        thread = threading.Thread(target=_import, daemon=True, name=f"import_{self.name}")
+        thread.start()
+        return thread
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_") or attribute not in self.names:
+            raise AttributeError(f"{self.name} has no function '{attribute}' (expected one of {', '.join(sorted(self.names))})")
+        if self._module is not None and not callable(getattr(self._module, attribute, None)):
+            raise AttributeError(f"{self.name} has no function '{attribute}'")
+
+        def call(*args, **kwargs):
+            return getattr(self.load(), attribute)(*args, **kwargs)
+
+        call.__name__ = f"{self.name}.{attribute}"
+        return call
@@ -0,0 +1,118 @@
+import threading
+
+from collections import Counter, OrderedDict
+from util.tracing import tracer
+
+
+class Prewarmer():
+    """
+    Gets the backends ready for whichever transition comes next while the game sits in a phase, so the storyteller's
+    next key press does not pay for a cold connection or a first lookup.
+
+    On entering a state, the scenes of the transitions leaving it (its exit scene, then each target's enter scene, most
+    likely first) are read for the methods they call. Each scene target with a "prewarm(methods)" method is called with
+    the names of its methods, on a background thread; targets with a "keep_alive()" method are then called every
+    "interval" seconds until the game moves on, so their connections are not closed for being idle.
+    """
+    def __init__(self, scenes, interval=30.0, delay=0.5):
+        self.scenes = scenes
+        self.interval = interval
+        # Seconds to leave the transition that entered the state to itself before starting
+        self.delay = delay
+
+        # How often each (source, event) transition has been taken, to rank the likely ones first
+        self.taken = Counter()
+        self.passes = 0
+
+        self._lock = threading.Lock()
+        self._cancelled = None
+        # Set once the latest prepare() has been through every target once
+        self._first_pass = None
+
+    def record(self, source, event):
+        self.taken[(source, event)] += 1
+
+    def rank(self, source, transitions):
+        """
+        Orders (event, target) pairs by how often each has been taken from "source", keeping the given order for ties.
+        """
+        return sorted(transitions, key=lambda transition: -self.taken[(source, transition[0])])
+
+    def calls(self, source, transitions):
+        """
+        Returns {target: [method name, ...]} for the scene targets that can be prewarmed, in the order they will be needed.
+        """
+        scenes = [self.scenes.exit.get(source)] + [self.scenes.enter.get(target) for _, target in self.rank(source, transitions)]
+        active_flags = self.scenes.active_flags()
+
+        calls = OrderedDict()
+        for scene in scenes:
+            if scene is None:
+                continue
+            plan = scene.plan_for(active_flags if scene.flags else ())
+            for func in [action.func for action in plan.actions.values()] + [func for func, _, _ in scene.then]:
+                target = getattr(func, "__self__", None)
+                # Looked up on the class, as stand-ins such as LazyModule make up any attribute asked for
+                if target is None or not callable(getattr(type(target), "prewarm", None)):
+                    continue
+                methods = calls.setdefault(target, [])
+                if func.__name__ not in methods:
+                    methods.append(func.__name__)
+        return calls
+
+    def prepare(self, source, transitions):
+        """
+        Starts getting ready for the (event, target) transitions leaving "source", replacing whatever was prepared before.
+        Returns at once.
+        """
+        calls = self.calls(source, transitions)
+        cancelled = threading.Event()
+        first_pass = threading.Event()
+
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+            self._cancelled, self._first_pass = cancelled, first_pass
+            if not calls:
+                first_pass.set()
+                return None
+            thread = threading.Thread(target=self._run, args=(source, calls, cancelled, first_pass), daemon=True, name="prewarm")
+            thread.start()
+        return thread
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the first pass of the latest prepare() to finish. Returns False if it is still running after "timeout".
+        """
+        first_pass = self._first_pass
+        return first_pass is None or first_pass.wait(timeout)
+
+    def _run(self, source, calls, cancelled, first_pass):
+        try:
+            if cancelled.wait(self.delay):
+                return
+            self._pass(source, calls, cancelled, lambda target, methods: target.prewarm(methods))
+        finally:
+            first_pass.set()
+
+        keep_alive = [target for target in calls if callable(getattr(type(target), "keep_alive", None))]
+        while keep_alive and not cancelled.wait(self.interval):
+            self._pass(source, {target: calls[target] for target in keep_alive}, cancelled, lambda target, methods: target.keep_alive())
+
+    def _pass(self, source, calls, cancelled, call):
+        with tracer.span("prewarm", kind="prewarm", state=source, targets=[type(target).__name__ for target in calls]) as span:
+            for target, methods in calls.items():
+                if cancelled.is_set():
+                    break
+                try:
+                    call(target, methods)
+                except Exception as e:
+                    # Only preparation: the transition itself reports the backend's errors if they last
+                    print(f"[PREWARM] {type(target).__name__} could not be prepared: {e!r}")
+            span.set(cancelled=cancelled.is_set())
+        self.passes += 1
@@ -0,0 +1,255 @@
+import itertools
+
+import yaml
+
+from util.transition_executor import TransitionPlan
+
+SCENE_KEYS = {"message", "actions", "then", "countdown", "timers"}
+ACTION_KEYS = {"name", "call", "args", "kwargs", "after", "when"}
+STEP_KEYS = {"call", "args", "kwargs"}
+TIMER_KEYS = {"name", "after", "call", "args", "kwargs", "when"}
+
+
+class SceneError(ValueError):
+    """
+    Raised when a scene file is malformed or refers to a state, target, method or flag that does not exist.
+    """
+
+
+class SceneTimer():
+    """
+    A call a scene makes "after" seconds, as long as all of its "when" flags are set by then.
+    """
+    def __init__(self, name, after, func, args, kwargs, when):
+        self.name = name
+        self.after = after
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.when = when
+
+
+class Scene():
+    """
+    A compiled scene: its transition plan for every combination of the flags it uses, the steps that follow it, and
+    the countdown and timers it starts.
+    """
+    def __init__(self, name, message, flags, plans, then, countdown=None, timers=()):
+        self.name = name
+        self.message = message
+        self.flags = flags
+        self.plans = plans
+        self.then = then
+        self.countdown = countdown
+        self.timers = list(timers)
+
+    def plan_for(self, active_flags):
+        return self.plans[tuple(flag in active_flags for flag in self.flags)]
+
+
+class SceneEngine():
+    """
+    Compiles a scene file (see scenes.yaml) into ready-made TransitionPlans, resolving every "<target>.<method>" to a bound
+    callable up front. Running a scene is then a dictionary lookup: nothing is parsed or looked up by name during a transition.
+    """
+    def __init__(self, targets, flags=None, states=()):
+        # targets: name -> object whose methods scenes may call; flags: name -> callable returning whether the flag is set
+        self.targets = targets
+        self.flags = flags or {}
+        self.states = set(states)
+
+        self.enter = {}
+        self.exit = {}
+        self.events = {}
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                definition = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise SceneError(f"Could not read scenes from {path}: {e}") from e
+
+        self.compile(definition)
+        return self
+
+    def compile(self, definition):
+        """
+        Validates and compiles a parsed scene file, replacing any scenes compiled before.
+        """
+        enter, exit_, events = {}, {}, {}
+
+        for state_id, hooks in self._mapping(definition.get("states"), "states").items():
+            if self.states and state_id not in self.states:
+                raise SceneError(f"states.{state_id}: unknown state (expected one of {', '.join(sorted(self.states))})")
+
+            for hook, scene in self._mapping(hooks, f"states.{state_id}").items():
+                if hook == "enter":
+                    enter[state_id] = self._compile_scene(f"states.{state_id}.enter", scene)
+                elif hook == "exit":
+                    exit_[state_id] = self._compile_scene(f"states.{state_id}.exit", scene)
+                else:
+                    raise SceneError(f"states.{state_id}.{hook}: expected 'enter' or 'exit'")
+
+        for event_name, scene in self._mapping(definition.get("events"), "events").items():
+            events[event_name] = self._compile_scene(f"events.{event_name}", scene)
+
+        self.enter, self.exit, self.events = enter, exit_, events
+
+    def _compile_scene(self, path, scene):
+        scene = self._mapping(scene, path)
+        self._check_keys(path, scene, SCENE_KEYS)
+
+        actions = scene.get("actions") or []
+        if not isinstance(actions, list):
+            raise SceneError(f"{path}.actions: expected a list")
+
+        compiled = []
+        for index, action in enumerate(actions):
+            action_path = f"{path}.actions[{index}]"
+            action = self._mapping(action, action_path)
+            self._check_keys(action_path, action, ACTION_KEYS)
+
+            if "name" not in action:
+                raise SceneError(f"{action_path}: missing 'name'")
+
+            when = self._list(action.get("when"), f"{action_path}.when")
+            for flag in when:
+                if flag not in self.flags:
+                    raise SceneError(f"{action_path}.when: unknown flag '{flag}'")
+
+            func, args, kwargs = self._compile_call(action_path, action)
+            compiled.append((action["name"], func, args, kwargs, self._list(action.get("after"), f"{action_path}.after"), when))
+
+        # One plan per combination of the flags used, so the right one only has to be picked at run time
+        flags = sorted({flag for *_, when in compiled for flag in when})
+        plans = {}
+        for values in itertools.product((False, True), repeat=len(flags)):
+            active = {flag for flag, value in zip(flags, values) if value}
+            plan = TransitionPlan(path)
+            for name, func, args, kwargs, after, when in compiled:
+                if not active.issuperset(when):
+                    continue
+                try:
+                    plan.add(name, func, *args, after=after, **kwargs)
+                except ValueError as e:
+                    raise SceneError(f"{path}: {e}" + (f" (with flags {', '.join(sorted(active))})" if active else "")) from None
+            plans[values] = plan
+
+        then = []
+        for index, step in enumerate(self._list(scene.get("then"), f"{path}.then")):
+            step_path = f"{path}.then[{index}]"
+            if isinstance(step, str):
+                step = {"call": step}
+            step = self._mapping(step, step_path)
+            self._check_keys(step_path, step, STEP_KEYS)
+            then.append(self._compile_call(step_path, step))
+
+        countdown = scene.get("countdown")
+        if countdown is not None:
+            countdown = self._seconds(countdown, f"{path}.countdown")
+
+        timers = []
+        for index, timer in enumerate(self._list(scene.get("timers"), f"{path}.timers")):
+            timer_path = f"{path}.timers[{index}]"
+            timer = self._mapping(timer, timer_path)
+            self._check_keys(timer_path, timer, TIMER_KEYS)
+            if "after" not in timer:
+                raise SceneError(f"{timer_path}: missing 'after'")
+
+            when = self._list(timer.get("when"), f"{timer_path}.when")
+            for flag in when:
+                if flag not in self.flags:
+                    raise SceneError(f"{timer_path}.when: unknown flag '{flag}'")
+
+            func, args, kwargs = self._compile_call(timer_path, timer)
+            timers.append(SceneTimer(timer.get("name") or timer["call"], self._seconds(timer["after"], f"{timer_path}.after"), func, args, kwargs, when))
+
+        return Scene(path, scene.get("message"), flags, plans, then, countdown, timers)
+
+    def _compile_call(self, path, action):
+        call = action.get("call")
+        if not isinstance(call, str) or "." not in call:
+            raise SceneError(f"{path}.call: expected '<target>.<method>', got {call!r}")
+
+        target_name, method = call.split(".", 1)
+        if target_name not in self.targets:
+            raise SceneError(f"{path}.call: unknown target '{target_name}' (expected one of {', '.join(sorted(self.targets))})")
+
+        func = getattr(self.targets[target_name], method, None)
+        if not callable(func):
+            raise SceneError(f"{path}.call: '{target_name}' has no method '{method}'")
+
+        args = action.get("args") or []
+        kwargs = action.get("kwargs") or {}
+        if not isinstance(args, list):
+            raise SceneError(f"{path}.args: expected a list")
+        if not isinstance(kwargs, dict):
+            raise SceneError(f"{path}.kwargs: expected a mapping")
+
+        return func, tuple(args), kwargs
+
+    @staticmethod
+    def _seconds(value, path):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise SceneError(f"{path}: expected a number of seconds, got {value!r}")
+        return float(value)
+
+    @staticmethod
+    def _mapping(value, path):
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            raise SceneError(f"{path}: expected a mapping")
+        return value
+
+    @staticmethod
+    def _list(value, path):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value]
+        if not isinstance(value, list):
+            raise SceneError(f"{path}: expected a list")
+        return value
+
+    @staticmethod
+    def _check_keys(path, value, allowed):
+        unknown = set(value) - allowed
+        if unknown:
+            raise SceneError(f"{path}: unknown key(s) {', '.join(sorted(unknown))}")
+
+    def active_flags(self):
+        return {name for name, is_set in self.flags.items() if is_set()}
+
+    def run(self, scene, run_plan):
+        """
+        Runs a compiled scene: its transition plan through "run_plan", then each of its "then" steps in order.
+        """
+        if scene.message:
+            print(scene.message)
+
+        plan = scene.plan_for(self.active_flags() if scene.flags else ())
+        if plan:
+            run_plan(plan)
+
+        for func, args, kwargs in scene.then:
+            func(*args, **kwargs)
+
+    def enter_plan(self, state_id):
+        """
+        Returns the transition plan for entering a state with the current flags, or None if it has no enter scene.
+        """
+        scene = self.enter.get(state_id)
+        if scene is None:
+            return None
+        return scene.plan_for(self.active_flags() if scene.flags else ())
+
+    def on_enter(self, state_id, run_plan):
+        scene = self.enter.get(state_id)
+        if scene is not None:
+            self.run(scene, run_plan)
+
+    def on_exit(self, state_id, run_plan):
+        scene = self.exit.get(state_id)
+        if scene is not None:
+            self.run(scene, run_plan)
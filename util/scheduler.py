@@ -0,0 +1,288 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from collections import deque
+from util.tracing import tracer
+
+# Lateness (seconds an action ran after it was due) kept for the scheduler's percentiles
+LATENESS_HISTORY = 256
+
+
+class VirtualClock():
+    """
+    A clock that only moves when told to, for driving a Scheduler by hand: advance() it, then call run_due().
+    """
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.now
+
+
+class ScheduledAction():
+    """
+    An action waiting in a Scheduler. Cancelling or rescheduling it leaves its old heap entry behind, to be dropped when
+    it comes up, so neither has to search the heap.
+    """
+    def __init__(self, scheduler, due, action, args, kwargs, name, epoch):
+        self.scheduler = scheduler
+        self.due = due
+        self.action = action
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        # The epoch it belongs to, or None if it outlives transitions
+        self.epoch = epoch
+        # Bumped on every reschedule, so only the latest heap entry counts
+        self.version = 0
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def pending(self):
+        return not (self.cancelled or self.fired) and self.epoch in (None, self.scheduler.epoch)
+
+    @property
+    def remaining(self):
+        return max(self.due - self.scheduler.clock(), 0)
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+    def reschedule(self, delay):
+        self.scheduler.reschedule(self, delay)
+
+    def __call__(self):
+        return self.action(*self.args, **self.kwargs)
+
+
+class Countdown():
+    """
+    Calls "tick" with the whole seconds left, each time that number changes but never more than "max_rate" times a second,
+    then calls "then" (if given) when the countdown reaches zero. A late scheduler skips straight to the current value
+    rather than catching up on the ticks it missed.
+    """
+    def __init__(self, scheduler, duration, tick, then=None, max_rate=1.0, name="countdown", state_bound=True):
+        self.scheduler = scheduler
+        self.tick = tick
+        self.then = then
+        self.min_interval = 1.0 / max_rate
+        self.end = scheduler.clock() + duration
+        self.shown = None
+        self.ticks = 0
+        self.last_tick = None
+        self.finished = False
+        self.name = name
+        # Every tick is scheduled in the epoch the countdown started in, so a transition stops it for good
+        self.epoch = scheduler.epoch if state_bound else None
+        self._next = scheduler._schedule(0, self._tick, (), {}, name, self.epoch)
+
+    @property
+    def remaining(self):
+        return max(self.end - self.scheduler.clock(), 0)
+
+    @property
+    def pending(self):
+        return not self.finished and self._next.pending
+
+    def cancel(self):
+        self._next.cancel()
+
+    def extend(self, seconds):
+        """
+        Moves the end of the countdown by "seconds" (negative to shorten it), showing the new time straight away.
+        """
+        self.end += seconds
+        if self.pending:
+            self._next.reschedule(0)
+
+    def _tick(self):
+        now = self.scheduler.clock()
+        seconds = math.ceil(max(self.end - now, 0))
+        if seconds != self.shown:
+            self.shown = seconds
+            self.ticks += 1
+            self.last_tick = now
+            self.tick(seconds)
+
+        if seconds == 0:
+            self.finished = True
+            if self.then is not None:
+                self.then()
+            return
+
+        # Next when the shown value changes, but no sooner than the rate allows
+        next_change = self.end - (seconds - 1)
+        self._next = self.scheduler._schedule(max(next_change, self.last_tick + self.min_interval) - now, self._tick, (), {}, self.name, self.epoch)
+
+
+class Scheduler():
+    """
+    Runs timed actions from a single heap, soonest first, on a single thread: waiting costs nothing however many actions
+    are pending, as the thread sleeps until the earliest is due (or something is scheduled sooner).
+
+    Actions are state-bound by default: they belong to the current epoch, and next_epoch() (called on every transition)
+    cancels all of them at once. Cancelled and rescheduled actions are dropped from the heap as they come up.
+    Pass "clock" (e.g. a VirtualClock) and call run_due() instead of start() to drive it by hand.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.epoch = 0
+        self.fired = 0
+        self.failed = 0
+        self.lateness = deque(maxlen=LATENESS_HISTORY)
+
+        # (due, order, version, ScheduledAction)
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        # Set when the heap changes, so the thread works out how long to sleep again
+        self._woken = False
+        self._running = False
+        self._thread = None
+
+    def schedule(self, delay, action, *args, name=None, state_bound=True, **kwargs):
+        """
+        Runs action(*args, **kwargs) after "delay" seconds. Returns a ScheduledAction to cancel or reschedule it with.
+        """
+        return self._schedule(delay, action, args, kwargs, name or getattr(action, "__name__", "action"), self.epoch if state_bound else None)
+
+    def countdown(self, duration, tick, then=None, max_rate=1.0, name="countdown", state_bound=True):
+        return Countdown(self, duration, tick, then=then, max_rate=max_rate, name=name, state_bound=state_bound)
+
+    def cancel(self, scheduled):
+        with self._condition:
+            scheduled.cancelled = True
+
+    def reschedule(self, scheduled, delay):
+        """
+        Moves a pending action to "delay" seconds from now. Does nothing if it has already run or been cancelled.
+        """
+        with self._condition:
+            if not scheduled.pending:
+                return False
+            scheduled.due = self.clock() + delay
+            scheduled.version += 1
+            self._push(scheduled)
+        return True
+
+    def next_epoch(self):
+        """
+        Cancels every state-bound action at once, e.g. on a transition.
+        """
+        with self._condition:
+            self.epoch += 1
+            self._wake()
+
+    def pending(self):
+        """
+        The actions still waiting to run, soonest first.
+        """
+        with self._condition:
+            return sorted(
+                (scheduled for _, _, version, scheduled in self._heap if scheduled.pending and scheduled.version == version),
+                key=lambda scheduled: scheduled.due
+            )
+
+    def run_due(self):
+        """
+        Runs every action that is due, in order, on the calling thread. Returns the seconds until the next one is due,
+        or None if nothing is pending.
+        """
+        while True:
+            with self._condition:
+                scheduled, wait = self._pop_due()
+            if scheduled is None:
+                return wait
+            self._run(scheduled)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="scheduler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def stats(self):
+        lateness = sorted(self.lateness)
+
+        def percentile(fraction):
+            if not lateness:
+                return None
+            return round(lateness[min(int(round(fraction * (len(lateness) - 1))), len(lateness) - 1)] * 1000, 2)
+
+        return {
+            "epoch": self.epoch,
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "failed": self.failed,
+            "lateness_p50_ms": percentile(0.50),
+            "lateness_p95_ms": percentile(0.95),
+            "lateness_max_ms": percentile(1.0)
+        }
+
+    def _schedule(self, delay, action, args, kwargs, name, epoch):
+        with self._condition:
+            scheduled = ScheduledAction(self, self.clock() + delay, action, args, kwargs, name, epoch)
+            self._push(scheduled)
+        return scheduled
+
+    def _push(self, scheduled):
+        heapq.heappush(self._heap, (scheduled.due, next(self._order), scheduled.version, scheduled))
+        # Only the earliest entry decides how long the thread sleeps
+        if self._heap[0][3] is scheduled:
+            self._wake()
+
+    def _wake(self):
+        self._woken = True
+        self._condition.notify()
+
+    def _pop_due(self):
+        """
+        Returns (the next due action, None), or (None, seconds until the next is due, or None if nothing is pending).
+        """
+        while self._heap:
+            due, _, version, scheduled = self._heap[0]
+            if version != scheduled.version or not scheduled.pending:
+                heapq.heappop(self._heap)
+                continue
+
+            wait = due - self.clock()
+            if wait > 0:
+                return None, wait
+
+            heapq.heappop(self._heap)
+            scheduled.fired = True
+            self.lateness.append(0.0 - wait)
+            return scheduled, None
+        return None, None
+
+    def _run(self, scheduled):
+        self.fired += 1
+        try:
+            with tracer.span(scheduled.name, kind="timer", late=round(self.lateness[-1], 4)):
+                scheduled()
+        except Exception as e:
+            self.failed += 1
+            print(f"[SCHEDULER] {scheduled.name} failed: {e!r}")
+
+    def _loop(self):
+        while self._running:
+            wait = self.run_due()
+            with self._condition:
+                if self._running and not self._woken:
+                    self._condition.wait(wait)
+                self._woken = False
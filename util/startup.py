@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class StartupTimer():
+    """
+    Records how long each part of startup takes, so regressions in time-to-first-menu can be spotted between releases.
+    Steps are timed from the previous mark; background tasks timed with "time" are recorded separately.
+    """
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.steps = []
+        self.tasks = {}
+        self._last = self.started
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            self.steps.append((name, now - self._last))
+            self._last = now
+
+    def time(self, name, func, *args, **kwargs):
+        """
+        Calls func, recording how long it took under "name". Safe to call from several threads at once.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.tasks[name] = time.perf_counter() - start
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        steps = ", ".join(f"{name} {duration * 1000:.0f}ms" for name, duration in self.steps)
+        summary = f"[STARTUP] Ready in {self.elapsed * 1000:.0f}ms ({steps})"
+        if self.tasks:
+            summary += f"; backends: {', '.join(f'{name} {duration * 1000:.0f}ms' for name, duration in self.tasks.items())}"
+        return summary
+
+    def record(self, path):
+        """
+        Appends this startup's timings to a JSON Lines file.
+        """
+        entry = {
+            "time": time.time(),
+            "total_ms": round(self.elapsed * 1000, 1),
+            "steps_ms": {name: round(duration * 1000, 1) for name, duration in self.steps},
+            "tasks_ms": {name: round(duration * 1000, 1) for name, duration in self.tasks.items()}
+        }
+        with open(path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def state_machine_hash(machine):
+    """
+    Hashes the states and transitions of a state machine, which is everything its graph shows.
+    """
+    definition = [
+        (state.id, state.name, state.initial, state.final, sorted((event.id, event.name, t.target.id) for t in state.transitions for event in t.events))
+        for state in machine.states_map.values()
+    ]
+    return hashlib.sha256(json.dumps(sorted(definition, key=lambda s: s[0]), default=str).encode()).hexdigest()
+
+
+def draw_graph_if_changed(machine, path):
+    """
+    Renders the state machine graph to "path", unless it is already there and the definition has not changed since.
+    Returns True if the graph was rendered.
+    """
+    digest = state_machine_hash(machine)
+    hash_path = path + ".sha256"
+
+    if os.path.exists(path) and os.path.exists(hash_path):
+        with open(hash_path) as f:
+            if f.read().strip() == digest:
+                return False
+
+    machine._graph().write_png(path)
+    with open(hash_path, "w") as f:
+        f.write(digest)
+    return True
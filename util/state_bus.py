@@ -0,0 +1,280 @@
+import itertools
+import json
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# URL that selects the in-process stand-in instead of a redis-server
+IN_PROCESS_URL = "memory://"
+
+
+class InProcessRedis():
+    """
+    Enough of the redis-py client (with decode_responses=True) for StateBus, kept in memory: hashes, pub/sub and streams.
+    Lets several front-ends in one process share a game without a redis-server, and keeps the benchmark hermetic.
+    """
+    def __init__(self):
+        self._hashes = {}
+        self._streams = {}
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._last_milliseconds = 0
+        self._condition = threading.Condition()
+
+    def ping(self):
+        return True
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._condition:
+            fields = self._hashes.setdefault(name, {})
+            added = sum(1 for field in items if field not in fields)
+            fields.update({field: str(value) for field, value in items.items()})
+        return added
+
+    def hgetall(self, name):
+        with self._condition:
+            return dict(self._hashes.get(name, {}))
+
+    def delete(self, *names):
+        with self._condition:
+            return sum(1 for name in names if self._hashes.pop(name, None) is not None or self._streams.pop(name, None) is not None)
+
+    def publish(self, channel, message):
+        with self._condition:
+            subscribers = list(self._subscribers.get(channel, []))
+        for subscriber in subscribers:
+            subscriber._deliver(channel, message)
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return InProcessPubSub(self, ignore_subscribe_messages)
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True):
+        with self._condition:
+            stream = self._streams.setdefault(name, [])
+            # Stream ids only ever increase, even if the clock goes back
+            self._last_milliseconds = max(self._last_milliseconds, int(time.time() * 1000))
+            message_id = f"{self._last_milliseconds}-{next(self._ids)}"
+            stream.append((message_id, {field: str(value) for field, value in fields.items()}))
+            if maxlen is not None and len(stream) > maxlen:
+                del stream[:len(stream) - maxlen]
+            self._condition.notify_all()
+        return message_id
+
+    def xlen(self, name):
+        with self._condition:
+            return len(self._streams.get(name, []))
+
+    def xrevrange(self, name, max="+", min="-", count=None):
+        with self._condition:
+            messages = list(reversed(self._streams.get(name, [])))
+        return messages[:count] if count else messages
+
+    def xread(self, streams, count=None, block=None):
+        """
+        Returns [[stream, [(id, fields), ...]], ...] for messages after the given ids ("$" meaning only new ones),
+        waiting up to "block" milliseconds for one to arrive.
+        """
+        deadline = None if block is None else time.monotonic() + block / 1000
+        with self._condition:
+            # "$" is resolved once, so messages added while blocked are not missed
+            after = {name: self._last_id(name) if last_id == "$" else last_id for name, last_id in streams.items()}
+            while True:
+                result = []
+                for name, last_id in after.items():
+                    messages = self._messages_after(name, _id_key(last_id))
+                    if messages:
+                        result.append([name, messages[:count] if count else messages])
+                if result or deadline is None:
+                    return result
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+
+    def _messages_after(self, name, key):
+        # New messages are at the end, so only those are looked at
+        stream = self._streams.get(name, [])
+        index = len(stream)
+        while index > 0 and _id_key(stream[index - 1][0]) > key:
+            index -= 1
+        return stream[index:]
+
+    def _last_id(self, name):
+        stream = self._streams.get(name)
+        return stream[-1][0] if stream else "0-0"
+
+
+class InProcessPubSub():
+    def __init__(self, client, ignore_subscribe_messages):
+        self.client = client
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.channels = set()
+        self._messages = []
+        self._condition = threading.Condition()
+
+    def subscribe(self, *channels):
+        with self.client._condition:
+            for channel in channels:
+                self.client._subscribers.setdefault(channel, []).append(self)
+                self.channels.add(channel)
+        if not self.ignore_subscribe_messages:
+            for channel in channels:
+                self._deliver(channel, len(self.channels), "subscribe")
+
+    def unsubscribe(self, *channels):
+        with self.client._condition:
+            for channel in channels or list(self.channels):
+                if self in self.client._subscribers.get(channel, []):
+                    self.client._subscribers[channel].remove(self)
+                self.channels.discard(channel)
+
+    def close(self):
+        self.unsubscribe()
+
+    def _deliver(self, channel, data, kind="message"):
+        with self._condition:
+            self._messages.append({"type": kind, "pattern": None, "channel": channel, "data": data})
+            self._condition.notify()
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        deadline = time.monotonic() + (timeout or 0)
+        with self._condition:
+            while True:
+                while self._messages:
+                    message = self._messages.pop(0)
+                    if message["type"] == "message" or not (ignore_subscribe_messages or self.ignore_subscribe_messages):
+                        return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+
+def _id_key(message_id):
+    milliseconds, _, sequence = message_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def connect(url):
+    """
+    Returns a client for a redis:// URL, or the in-process stand-in for "memory://".
+    """
+    if url == IN_PROCESS_URL:
+        return InProcessRedis()
+    if redis is None:
+        raise RuntimeError(f"The redis package is needed for the state bus at {url} (pip install redis)")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class StateBus():
+    """
+    Shares one game between several front-ends (the CLI, a storyteller's phone, a grimoire display, ...) through Redis.
+    Every transition and state change is published on "<prefix>:events", the latest game state is kept in the
+    "<prefix>:state" hash (one JSON-encoded value per key), and front-ends send commands by adding them to the
+    "<prefix>:commands" stream, which the controller reads with a blocking XREAD instead of polling.
+    """
+    def __init__(self, client, prefix="botc", stream_length=1000):
+        self.client = client
+        self.state_key = f"{prefix}:state"
+        self.events_channel = f"{prefix}:events"
+        self.commands_key = f"{prefix}:commands"
+        self.stream_length = stream_length
+
+        # key -> the JSON last written to the state hash for it
+        self._published = {}
+        self._listener = None
+        self._listening = False
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        return cls(connect(url), **kwargs)
+
+    def publish_state(self, state):
+        """
+        Writes the keys of "state" that changed since the last call to the state hash, then announces them.
+        Returns the changed keys.
+        """
+        # Compared as JSON, as that is what is published: a tuple and the list it is sent as are the same value
+        encoded = {key: json.dumps(value, separators=(",", ":"), sort_keys=True) for key, value in state.items()}
+        encoded = {key: value for key, value in encoded.items() if self._published.get(key) != value}
+        if not encoded:
+            return {}
+
+        changes = {key: state[key] for key in encoded}
+        try:
+            self.client.hset(self.state_key, mapping=encoded)
+            self.publish("state", changes=changes)
+        except Exception as e:
+            # The game carries on without the bus; the changes are sent again with the next one
+            print(f"[BUS] Could not publish the game state: {e!r}")
+            return {}
+
+        # Kept encoded, so later in-place changes to the caller's values are still noticed
+        self._published.update(encoded)
+        return changes
+
+    def publish(self, kind, **data):
+        """
+        Announces something that happened (e.g. a transition) to every subscribed front-end.
+        """
+        self.client.publish(self.events_channel, json.dumps({"type": kind, "time": time.time(), **data}, separators=(",", ":")))
+
+    def read_state(self):
+        return {key: json.loads(value) for key, value in self.client.hgetall(self.state_key).items()}
+
+    def subscribe(self):
+        """
+        Returns a pub/sub handle subscribed to the events channel; messages' "data" is the JSON-encoded event.
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.events_channel)
+        return pubsub
+
+    def send_command(self, **fields):
+        """
+        Queues a command for the controller, e.g. send_command(event="start_night", source="phone").
+        """
+        return self.client.xadd(self.commands_key, fields, maxlen=self.stream_length, approximate=True)
+
+    def listen(self, handler, block_ms=1000):
+        """
+        Calls handler(fields) on a background thread for each command added to the stream from now on.
+        """
+        # Resolved now rather than with "$" on the thread, so commands sent while it starts are not missed
+        latest = self.client.xrevrange(self.commands_key, count=1)
+        start_id = latest[0][0] if latest else "0-0"
+
+        def _read():
+            last_id = start_id
+            while self._listening:
+                try:
+                    entries = self.client.xread({self.commands_key: last_id}, count=100, block=block_ms)
+                except Exception as e:
+                    print(f"[BUS] Could not read commands: {e!r}")
+                    time.sleep(1)
+                    continue
+
+                for _, messages in entries or []:
+                    for message_id, fields in messages:
+                        last_id = message_id
+                        try:
+                            handler(fields)
+                        except Exception as e:
+                            print(f"[BUS] Command {fields} failed: {e!r}")
+                            self.publish("command_failed", command=fields, error=repr(e))
+
+        self._listening = True
+        self._listener = threading.Thread(target=_read, daemon=True, name="state_bus")
+        self._listener.start()
+        return self._listener
+
+    def stop(self):
+        self._listening = False
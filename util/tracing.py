@@ -0,0 +1,194 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span():
+    def __init__(self, span_id, name, kind, parent=None, attributes=None, start=None):
+        self.span_id = span_id
+        self.name = name
+        self.kind = kind
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else span_id
+        self.attributes = dict(attributes or {})
+        self.start = time.monotonic() if start is None else start
+        self.wall_start = time.time() - (time.monotonic() - self.start)
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.wall_start, 6),
+            "duration_ms": None if self.end is None else round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class Histogram():
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, value, error=False):
+        self.count += 1
+        self.total += value
+        if error:
+            self.errors += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Tracer():
+    """
+    Records a span for each state machine event and each backend call made while handling it (HTTP, WebSocket, serial, ...).
+    The most recent spans are kept in a ring buffer; latency histograms per (kind, name) cover every span since startup.
+    Spans started inside another span on the same thread (or in a context copied from it) become its children.
+    """
+    def __init__(self, capacity=2048):
+        self.spans = deque(maxlen=capacity)
+        self.histograms = {}
+        self.sink = None
+        self._listeners = []
+
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, kind="internal", start=None, **attributes):
+        """
+        Times the body of a "with" block as a span, recording any exception raised in it.
+        "start" (a time.monotonic() value) backdates the span, e.g. to when the input that led to it arrived.
+        """
+        span = Span(next(self._ids), name, kind, parent=_current_span.get(), attributes=attributes, start=start)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.monotonic()
+            self._finish(span)
+
+    def record(self, name, kind, start, end=None, parent=None, error=None, **attributes):
+        """
+        Records a span that has already happened, e.g. the time between writing a serial command and the reply arriving.
+        "start" and "end" are time.monotonic() values.
+        """
+        span = Span(next(self._ids), name, kind, parent=parent or _current_span.get(), attributes=attributes, start=start)
+        span.end = time.monotonic() if end is None else end
+        span.error = error
+        self._finish(span)
+        return span
+
+    def add_listener(self, callback):
+        """
+        Calls "callback" with every span as it finishes, on the thread that finished it.
+        """
+        self._listeners.append(callback)
+
+    @staticmethod
+    def current():
+        return _current_span.get()
+
+    def _finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+            key = (span.kind, span.name)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(span.duration, error=span.error is not None)
+
+            if self.sink is not None:
+                self.sink.write(json.dumps(span.to_dict()) + "\n")
+                self.sink.flush()
+
+        for callback in self._listeners:
+            callback(span)
+
+    def stream_to(self, path):
+        """
+        Appends every span to a JSON Lines file as soon as it finishes.
+        """
+        self.sink = open(path, "a")
+
+    def export_jsonl(self, path):
+        """
+        Writes the spans currently in the ring buffer to a JSON Lines file, oldest first.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict()) + "\n")
+        return len(spans)
+
+    def prometheus(self):
+        """
+        Returns a Prometheus text-format snapshot of the span latency histograms.
+        """
+        lines = [
+            "# HELP botc_span_duration_seconds Time taken by traced transitions and backend calls.",
+            "# TYPE botc_span_duration_seconds histogram"
+        ]
+        errors = []
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+
+            for (kind, name), histogram in histograms:
+                labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'botc_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'botc_span_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"botc_span_duration_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"botc_span_duration_seconds_count{{{labels}}} {histogram.count}")
+                errors.append(f"botc_span_errors_total{{{labels}}} {histogram.errors}")
+
+        lines.append("# HELP botc_span_errors_total Traced transitions and backend calls that failed.")
+        lines.append("# TYPE botc_span_errors_total counter")
+        return "\n".join(lines + errors) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w") as f:
+            f.write(self.prometheus())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every controller, so all spans of a transition end up in one place
+tracer = Tracer()
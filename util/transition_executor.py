@@ -0,0 +1,192 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from util.errors import BackendUnavailable
+from util.tracing import tracer
+
+class TransitionAction():
+    def __init__(self, name, func, args=(), kwargs=None, after=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.after = tuple(after)
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+class TransitionPlan():
+    """
+    Collects the side effects of a single transition (lights, Arduino, audio, ...) so they can be run together.
+    Actions are independent unless they list the actions they must run after.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.actions = {}
+
+    def add(self, name, func, *args, after=(), **kwargs):
+        """
+        Adds an action to the plan. Any names in "after" must already be part of the plan, which also keeps the plan free of cycles.
+        """
+        if name in self.actions:
+            raise ValueError(f"Action '{name}' is already part of the plan '{self.name}'")
+
+        for dependency in after:
+            if dependency not in self.actions:
+                raise ValueError(f"Action '{name}' depends on unknown action '{dependency}'")
+
+        self.actions[name] = TransitionAction(name, func, args, kwargs, after)
+        return self
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class TransitionReport():
+    def __init__(self, name, deadline):
+        self.name = name
+        self.deadline = deadline
+        self.elapsed = 0.0
+        self.completed = []
+        self.failed = {}
+        # Actions that were not attempted because their backend is degraded, by name, with the backend
+        self.degraded = {}
+        self.skipped = []
+        self.missed = []
+
+    @property
+    def ok(self):
+        return not (self.failed or self.degraded or self.skipped or self.missed)
+
+    def summary(self):
+        summary = f"[TRANSITION] {self.name}: {len(self.completed)} action(s) completed in {self.elapsed:.2f}s"
+        if self.missed:
+            summary += f", missed the {self.deadline:.1f}s deadline: {', '.join(self.missed)}"
+        if self.failed:
+            summary += f", failed: {', '.join(f'{name} ({exc!r})' for name, exc in self.failed.items())}"
+        if self.degraded:
+            summary += f", not attempted (degraded): {', '.join(f'{name} ({backend})' for name, backend in self.degraded.items())}"
+        if self.skipped:
+            summary += f", skipped: {', '.join(self.skipped)}"
+        return summary
+
+
+class PlanRun():
+    """
+    The actions of one plan as they run. Each action that finishes submits the actions that were waiting on it, from its
+    future's callback, so the rest of the plan carries on in the background once run() has stopped waiting for it.
+    """
+    def __init__(self, pool, plan):
+        self.pool = pool
+        self.plan = plan
+        self.waiting = dict(plan.actions)
+        # Names only; a dict keeps them in the order they were submitted
+        self.running = {}
+        self.completed = []
+        self.failed = {}
+        self.degraded = {}
+        self.skipped = []
+        self.finished = threading.Event()
+        # Set once run() has reported on the plan; anything finishing after that is late
+        self.reported = False
+        self._lock = threading.Lock()
+        self._context = None
+
+    def start(self):
+        # Each action runs in a copy of the caller's context, so its spans are part of the transition's trace
+        self._context = contextvars.copy_context()
+        with self._lock:
+            ready = self._take_ready()
+        self._submit(ready)
+
+    def report_to(self, report):
+        with self._lock:
+            self.reported = True
+            report.completed = list(self.completed)
+            report.failed = dict(self.failed)
+            report.degraded = dict(self.degraded)
+            report.skipped = list(self.skipped)
+            report.missed = list(self.running) + list(self.waiting)
+
+    def _take_ready(self):
+        # Skipping an action can unblock (or skip) others, so keep going until nothing changes
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for name, action in list(self.waiting.items()):
+                if any(dependency in self.failed or dependency in self.degraded or dependency in self.skipped for dependency in action.after):
+                    self.skipped.append(name)
+                elif all(dependency in self.completed for dependency in action.after):
+                    self.running[name] = None
+                    ready.append(action)
+                else:
+                    continue
+
+                del self.waiting[name]
+                changed = True
+
+        if not self.waiting and not self.running:
+            self.finished.set()
+        return ready
+
+    def _submit(self, actions):
+        # Outside the lock, as a future that is already done runs its callback straight away
+        for action in actions:
+            future = self.pool.submit(self._context.copy().run, TransitionExecutor._run_action, self.plan.name, action)
+            future.add_done_callback(lambda future, name=action.name: self._done(name, future))
+
+    def _done(self, name, future):
+        exception = future.exception()
+        with self._lock:
+            del self.running[name]
+            if exception is None:
+                self.completed.append(name)
+            elif isinstance(exception, BackendUnavailable):
+                self.degraded[name] = exception.backend
+            else:
+                self.failed[name] = exception
+            late = self.reported
+            ready = self._take_ready()
+
+        if late:
+            outcome = "completed" if exception is None else f"failed ({exception!r})"
+            print(f"[TRANSITION] {self.plan.name}: {name} {outcome} after the deadline")
+        self._submit(ready)
+
+
+class TransitionExecutor():
+    """
+    Runs the actions of a TransitionPlan on a bounded thread pool, so a transition takes as long as its slowest device rather than the sum of all of them.
+    """
+    def __init__(self, max_workers=4, deadline=5.0):
+        self.deadline = deadline
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transition")
+
+    def run(self, plan, deadline=None):
+        """
+        Runs the plan and waits at most "deadline" seconds for it. Actions still running (or waiting on one that is) once the deadline passes
+        are reported as missed; they are left to finish in the background, and the actions waiting on them still run once they have.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        report = TransitionReport(plan.name, deadline)
+
+        start = time.monotonic()
+        plan_run = PlanRun(self.pool, plan)
+        plan_run.start()
+        plan_run.finished.wait(deadline)
+
+        plan_run.report_to(report)
+        report.elapsed = time.monotonic() - start
+        return report
+
+    @staticmethod
+    def _run_action(plan_name, action):
+        with tracer.span(action.name, kind="action", plan=plan_name):
+            return action()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)